@@ -1,30 +1,62 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, jsonify, Response, stream_with_context, stream_template
 from flask_login import LoginManager, login_required, login_user, logout_user, current_user, UserMixin
 import sqlite3
-from datetime import datetime
+from datetime import date, datetime
 import os
-from io import BytesIO, StringIO
-import csv
 from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import random
 import string
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import threading
+import click
 from dotenv import load_dotenv
+from compression import GzipMiddleware
+import metrics
+import jobs
+import archive
+import dbconn
+import events
+import assets
+import attachments
+import maintenance
+import memprofile
+import models
+import ratelimit
+import readapi
+from cache import query_cache
+import repository
+import shards
+import suggest
+from repository import get_repository, DuplicateUser
+from writer import WriteQueueFull
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "mes_report_app_secret_key_2026"
 
+# Response compression (responses smaller than COMPRESS_MIN_SIZE bytes are sent as-is)
+app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+app.config["COMPRESS_LEVEL"] = int(os.getenv("COMPRESS_LEVEL", "6"))
+app.wsgi_app = GzipMiddleware(app.wsgi_app, min_size=app.config["COMPRESS_MIN_SIZE"], level=app.config["COMPRESS_LEVEL"])
+
+# Reverse proxies in front of the app (nginx, PythonAnywhere): trust this many
+# X-Forwarded-For/-Proto hops, so request.remote_addr (rate limits) is the client.
+# Leave at 0 when clients connect directly, or they could forge their address.
+app.config["PROXY_HOPS"] = int(os.getenv("PROXY_HOPS", "0"))
+if app.config["PROXY_HOPS"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_HOPS"], x_proto=app.config["PROXY_HOPS"])
+
+# Content-hashed static files with far-future caching (see assets.py)
+assets.init_app(app)
+
+# Opt-in per-request memory tracing (MEMPROFILE_ENABLED=1, see memprofile.py)
+memprofile.init_app(app)
+
+# JSON read API under /api; also served by the asyncio tier in asgi.py
+readapi.init_app(app)
+
 # Flask-Login Setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -32,6 +64,9 @@ login_manager.login_view = 'login'
 login_manager.login_message = "Please log in to access this page."
 
 DB_PATH = os.path.join(app.instance_path, "site_reports.db")
+jobs.configure(DB_PATH)
+repository.configure(DB_PATH)
+attachments.configure(DB_PATH)
 
 # Admin email configuration
 ADMIN_EMAIL = "byamungutony@gmail.com"
@@ -48,12 +83,9 @@ class User(UserMixin):
 
     @staticmethod
     def get_from_db(user_id):
-        conn = get_db()
-        cur = conn.cursor()
-        user = cur.execute("SELECT id, username, email, role FROM users WHERE id = ?", (user_id,)).fetchone()
-        conn.close()
+        user = get_repository().get_user(user_id)
         if user:
-            return User(user[0], user[1], user[2], user[3])
+            return User(user.id, user.username, user.email, user.role)
         return None
 
 @login_manager.user_loader
@@ -65,27 +97,43 @@ def load_user(user_id):
 # ----------------------------
 def get_db():
     os.makedirs(app.instance_path, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    conn = dbconn.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Users table with new schema
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'technician',
-        verified INTEGER DEFAULT 0,
-        verification_code TEXT,
-        created_at TEXT NOT NULL
+def cached_query(name, params, compute):
+    """``compute()``'s result, reused until the next database write (see cache.py)."""
+    return query_cache.get_or_compute(
+        name, params, current_user.role, get_repository().write_generation(), compute
     )
-    """)
+
+# Streamed pages are sent in chunks of about this many characters; Jinja
+# yields tiny fragments, and each chunk costs a gzip sync flush.
+STREAM_CHUNK_SIZE = 8192
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response, so long pages start arriving at once."""
+    fragments = stream_template(template_name, **context)
+
+    def chunks():
+        buffer, size = [], 0
+        for fragment in fragments:
+            buffer.append(fragment)
+            size += len(fragment)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    return Response(chunks(), mimetype="text/html")
+
+# PRAGMA user_version once the one-off orphan purge has run on a database
+# (2: attachment rows and old dashboard events are purged too)
+ORPHANS_PURGED_VERSION = 2
+
+def init_report_tables(conn):
+    """Create and migrate the reports, issues and devices tables in ``conn``'s database."""
+    cur = conn.cursor()
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS reports (
@@ -147,6 +195,7 @@ def init_db():
         priority TEXT,
         target_date TEXT,
         responsible TEXT,
+        target_date_iso TEXT NOT NULL DEFAULT '9999-12-31',
         FOREIGN KEY(report_id) REFERENCES reports(id) ON DELETE CASCADE
     )
     """)
@@ -167,38 +216,14 @@ def init_db():
     )
     """)
 
-    conn.commit()
-    
-    # Initialize default accounts if they don't exist, or update if they do
-    admin_exists = cur.execute("SELECT id FROM users WHERE username = ?", ("admin",)).fetchone()
-    if not admin_exists:
-        admin_password = generate_password_hash("Mes@2026")
-        cur.execute(
-            "INSERT INTO users (username, email, password, role, verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            ("admin", ADMIN_EMAIL, admin_password, "admin", 1, datetime.utcnow().isoformat())
-        )
-    else:
-        # Update existing admin account to be verified
-        cur.execute(
-            "UPDATE users SET verified = 1, role = 'admin', email = ? WHERE username = 'admin'",
-            (ADMIN_EMAIL,)
-        )
-    
-    tech_exists = cur.execute("SELECT id FROM users WHERE username = ?", ("IT",)).fetchone()
-    if not tech_exists:
-        tech_password = generate_password_hash("Mes@2026")
-        cur.execute(
-            "INSERT INTO users (username, email, password, role, verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            ("IT", "it@localhost", tech_password, "technician", 1, datetime.utcnow().isoformat())
-        )
-    else:
-        # Update existing IT account to be verified
-        cur.execute(
-            "UPDATE users SET verified = 1, role = 'technician', email = ? WHERE username = 'IT'",
-            ("it@localhost",)
-        )
-    
-    conn.commit()
+    # Bumped by every write so each worker's query cache notices (see cache.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS write_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO write_generation (id, generation) VALUES (1, 0)")
 
     # Ensure new columns exist for existing DBs (backwards-compatible migration)
     existing_cols = [r[1] for r in cur.execute("PRAGMA table_info(reports)").fetchall()]
@@ -258,6 +283,182 @@ def init_db():
         except Exception:
             pass
 
+    # Sortable copy of issues.target_date for the issue board, backfilled once
+    existing_issue_cols = [r[1] for r in cur.execute("PRAGMA table_info(issues)").fetchall()]
+    if 'target_date_iso' not in existing_issue_cols:
+        cur.execute(f"ALTER TABLE issues ADD COLUMN target_date_iso TEXT NOT NULL DEFAULT '{repository.NO_TARGET_DATE}'")
+        conn.create_function("normalize_date", 1, repository.normalize_date, deterministic=True)
+        cur.execute("UPDATE issues SET target_date_iso = normalize_date(target_date)")
+        print(f"[DB] Backfilled target_date_iso for {cur.rowcount} issue(s)")
+    for statement in repository.ISSUE_INDEXES:
+        cur.execute(statement)
+
+    # Photo/evidence attachments; the files themselves are in instance/attachments (see attachments.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attachments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_id INTEGER NOT NULL,
+        issue_id INTEGER,
+        sha256 TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        content_type TEXT,
+        size INTEGER NOT NULL,
+        uploaded_by TEXT,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(report_id) REFERENCES reports(id) ON DELETE CASCADE,
+        FOREIGN KEY(issue_id) REFERENCES issues(id) ON DELETE SET NULL
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_attachments_report ON attachments(report_id)")
+
+    # Live dashboard updates, one row per report write (see events.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS dashboard_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        report_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+    conn.commit()
+
+    # Issues, devices and attachment rows left behind by report deletes from before
+    # foreign keys were enforced; purged once per database, in batches (see maintenance.py)
+    if cur.execute("PRAGMA user_version").fetchone()[0] < ORPHANS_PURGED_VERSION:
+        purged = maintenance.purge_orphans(conn)
+        if any(purged.values()):
+            print(f"[DB] Purged orphaned rows: {purged}")
+        cur.execute(f"PRAGMA user_version = {ORPHANS_PURGED_VERSION}")
+
+
+def init_shard_db(region):
+    """Create or migrate one region shard's database (see shards.py)."""
+    path = shards.shard_path(DB_PATH, region)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = dbconn.connect(path)
+    try:
+        dbconn.prepare(conn)
+        init_report_tables(conn)
+        shards.reserve_id_range(conn, region)
+    finally:
+        conn.close()
+
+def init_db():
+    conn = get_db()
+    dbconn.prepare(conn)
+    cur = conn.cursor()
+
+    # Users table with new schema
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'technician',
+        verified INTEGER DEFAULT 0,
+        verification_code TEXT,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+    init_report_tables(conn)
+
+    # Background export jobs (see jobs.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        params TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress REAL DEFAULT 0,
+        message TEXT,
+        result_path TEXT,
+        result_name TEXT,
+        result_mimetype TEXT,
+        worker_pid INTEGER,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        heartbeat_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_status ON jobs(user_id, status)")
+    if 'heartbeat_at' not in [r[1] for r in cur.execute("PRAGMA table_info(jobs)").fetchall()]:
+        cur.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at TEXT")
+
+    # Unfinished chunked attachment uploads (see attachments.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attachment_uploads (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        report_id INTEGER NOT NULL,
+        issue_id INTEGER,
+        filename TEXT NOT NULL,
+        content_type TEXT,
+        size INTEGER NOT NULL,
+        sha256 TEXT,
+        received INTEGER NOT NULL DEFAULT 0,
+        writer TEXT,
+        writer_seen TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    existing_upload_cols = [r[1] for r in cur.execute("PRAGMA table_info(attachment_uploads)").fetchall()]
+    for col in ("writer", "writer_seen"):
+        if col not in existing_upload_cols:
+            cur.execute(f"ALTER TABLE attachment_uploads ADD COLUMN {col} TEXT")
+
+    # One row per database maintenance run (see maintenance.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        duration REAL,
+        reclaimed_bytes INTEGER,
+        integrity TEXT,
+        steps TEXT
+    )
+    """)
+
+    conn.commit()
+    
+    # Initialize default accounts if they don't exist, or update if they do
+    admin_exists = cur.execute("SELECT id FROM users WHERE username = ?", ("admin",)).fetchone()
+    if not admin_exists:
+        admin_password = generate_password_hash("Mes@2026")
+        cur.execute(
+            "INSERT INTO users (username, email, password, role, verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ("admin", ADMIN_EMAIL, admin_password, "admin", 1, datetime.utcnow().isoformat())
+        )
+    else:
+        # Update existing admin account to be verified
+        cur.execute(
+            "UPDATE users SET verified = 1, role = 'admin', email = ? WHERE username = 'admin'",
+            (ADMIN_EMAIL,)
+        )
+    
+    tech_exists = cur.execute("SELECT id FROM users WHERE username = ?", ("IT",)).fetchone()
+    if not tech_exists:
+        tech_password = generate_password_hash("Mes@2026")
+        cur.execute(
+            "INSERT INTO users (username, email, password, role, verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ("IT", "it@localhost", tech_password, "technician", 1, datetime.utcnow().isoformat())
+        )
+    else:
+        # Update existing IT account to be verified
+        cur.execute(
+            "UPDATE users SET verified = 1, role = 'technician', email = ? WHERE username = 'IT'",
+            ("it@localhost",)
+        )
+    
+    conn.commit()
+
     # Add email, role, verified, verification_code columns to existing users table
     existing_user_cols = [r[1] for r in cur.execute("PRAGMA table_info(users)").fetchall()]
     user_alter_stmts = []
@@ -284,9 +485,62 @@ def init_db():
     conn.commit()
     conn.close()
 
+    if repository.DB_BACKEND == "sqlite":
+        for region in shards.REGIONS:
+            init_shard_db(region)
+
+    # The postgres backend keeps users and reports in its own database;
+    # the local file above still holds jobs and the maintenance log.
+    if repository.DB_BACKEND == "postgres":
+        repo = get_repository()
+        repo.init_schema()
+        default_password = generate_password_hash("Mes@2026")
+        repo.ensure_default_user("admin", ADMIN_EMAIL, default_password, "admin")
+        repo.ensure_default_user("IT", "it@localhost", default_password, "technician")
+
+_init_lock = threading.Lock()
+_init_done = False
+
+def _reset_init_lock():
+    # A lock held by another thread at fork time would stay locked in the child.
+    global _init_lock
+    _init_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_init_lock)
+
+def init_app_once():
+    """Run schema migrations once per process (or once in a pre-fork parent)."""
+    global _init_done
+    if _init_done:
+        return
+    with _init_lock:
+        if not _init_done:
+            init_db()
+            jobs.recover_interrupted()
+            assets.load_manifest(app.static_folder)
+            _init_done = True
+
+def warm_up():
+    """Compile templates and touch the main tables so the first requests are fast."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    conn = get_db()
+    cur = conn.cursor()
+    for table in ("users", "reports", "issues", "devices"):
+        cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+    conn.close()
+    suggest.build(get_repository())
+
+def drain_background_work():
+    """Let running export jobs finish before a worker process exits."""
+    jobs.shutdown(wait=True)
+
 @app.before_request
 def startup():
-    init_db()
+    init_app_once()
+    jobs.ensure_worker()
+    maintenance.ensure_scheduler(DB_PATH)
 
 # ----------------------------
 # Email helper
@@ -295,82 +549,6 @@ def generate_verification_code():
     """Generate a random 6-digit verification code"""
     return ''.join(random.choices(string.digits, k=6))
 
-def send_verification_email(email, username, verification_code):
-    """Send verification code to admin email.
-
-    Supports configurable SMTP via environment variables:
-      SENDER_EMAIL (defaults to ADMIN_EMAIL)
-      SENDER_PASSWORD (if provided, login will be attempted)
-      SENDER_SMTP (defaults to smtp.gmail.com)
-      SENDER_PORT (defaults to 587)
-      SENDER_USE_TLS (1/0 or true/false, defaults to 1)
-      SENDER_USE_SSL (1/0 or true/false, defaults to 0)
-
-    If no password is provided the function will attempt an unauthenticated send
-    (useful for localhost SMTP servers). Returns True on success, False on error.
-    """
-    try:
-        sender_email = os.getenv("SENDER_EMAIL", ADMIN_EMAIL)
-        sender_password = os.getenv("SENDER_PASSWORD", "")
-        smtp_host = os.getenv("SENDER_SMTP", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SENDER_PORT", "587"))
-        use_tls = os.getenv("SENDER_USE_TLS", "1").lower() in ("1", "true", "yes")
-        use_ssl = os.getenv("SENDER_USE_SSL", "0").lower() in ("1", "true", "yes")
-
-        # Debug logging
-        print(f"[EMAIL] Attempting to send verification code")
-        print(f"[EMAIL] SMTP: {smtp_host}:{smtp_port} (TLS={use_tls}, SSL={use_ssl})")
-        print(f"[EMAIL] From: {sender_email} | To: {ADMIN_EMAIL}")
-        print(f"[EMAIL] Auth: {'Yes (with password)' if sender_password else 'No (unauthenticated)'}")
-
-        subject = f"New User Registration - Verification Code"
-        body = f"""
-A new user has registered with the following details:
-
-Username: {username}
-Email: {email}
-Verification Code: {verification_code}
-
-Please provide the verification code to the user to complete registration.
-"""
-
-        msg = MIMEMultipart()
-        msg["From"] = sender_email
-        msg["To"] = ADMIN_EMAIL
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        # Connect to SMTP server (support SSL, TLS, or plain localhost delivery)
-        print(f"[EMAIL] Connecting to SMTP server...")
-        if use_ssl:
-            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10)
-        else:
-            server = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
-            if use_tls:
-                print(f"[EMAIL] Initiating STARTTLS...")
-                try:
-                    server.starttls()
-                    print(f"[EMAIL] STARTTLS successful")
-                except Exception as e:
-                    print(f"[EMAIL] STARTTLS failed (continuing): {e}")
-
-        # Authenticate if credentials provided
-        if sender_password:
-            print(f"[EMAIL] Authenticating with {sender_email}...")
-            server.login(sender_email, sender_password)
-            print(f"[EMAIL] Authentication successful")
-
-        print(f"[EMAIL] Sending message...")
-        server.send_message(msg)
-        print(f"[EMAIL] Message sent successfully")
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"[EMAIL] ERROR: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
 # ----------------------------
 # Access Control Decorators
 # ----------------------------
@@ -396,6 +574,7 @@ def technician_required(f):
 # Authentication Routes
 # ----------------------------
 @app.route("/login", methods=["GET", "POST"])
+@ratelimit.limit("auth", methods=("POST",))
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("index"))
@@ -404,17 +583,14 @@ def login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "")
 
-        conn = get_db()
-        cur = conn.cursor()
-        user = cur.execute("SELECT id, username, email, password, role, verified FROM users WHERE username = ?", (username,)).fetchone()
-        conn.close()
+        user = get_repository().get_user_by_username(username)
 
         if user and check_password_hash(user["password"], password):
             if not user["verified"]:
                 flash("Your account is pending verification. Please contact the administrator.", "warning")
                 return redirect(url_for("login"))
             
-            user_obj = User(user[0], user[1], user[2], user[4])
+            user_obj = User(user.id, user.username, user.email, user.role)
             login_user(user_obj, remember=False)
             flash(f"Welcome back, {user['username']}!", "success")
             return redirect(url_for("index"))
@@ -424,6 +600,7 @@ def login():
     return render_template("login.html")
 
 @app.route("/register", methods=["GET", "POST"])
+@ratelimit.limit("auth", methods=("POST",))
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("index"))
@@ -447,18 +624,11 @@ def register():
             flash("Password must be at least 6 characters.", "warning")
             return redirect(url_for("register"))
 
-        conn = get_db()
-        cur = conn.cursor()
-
         # Check if user already exists in database
-        existing = cur.execute("SELECT id FROM users WHERE username = ? OR email = ?", (username, email)).fetchone()
-        if existing:
-            conn.close()
+        if get_repository().user_exists(username, email):
             flash("Username or email already exists.", "danger")
             return redirect(url_for("register"))
 
-        conn.close()
-
         # Generate verification code and hash password
         verification_code = generate_verification_code()
         hashed_password = generate_password_hash(password)
@@ -474,7 +644,8 @@ def register():
         print(f"[REGISTER] Stored pending registration in session for {username}")
 
         # Send verification code to admin (attempt)
-        email_sent = send_verification_email(email, username, verification_code)
+        from mailer import send_verification_email
+        email_sent = send_verification_email(email, username, verification_code, ADMIN_EMAIL)
 
         if email_sent:
             flash("Registration initiated! A verification code has been sent to the administrator. Please enter the code you receive.", "success")
@@ -487,6 +658,7 @@ def register():
     return render_template("register.html")
 
 @app.route("/verify", methods=["POST"])
+@ratelimit.limit("auth")
 def verify_code():
     """Verify the registration code and save user to database only after validation"""
     username = request.form.get("username", "").strip()
@@ -510,18 +682,13 @@ def verify_code():
 
     # Code is valid - NOW save user to database
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        
         print(f"[VERIFY] Code validated. Saving user {pending_reg['username']} to database")
         
         # Insert verified user into database (verified=1)
-        cur.execute(
-            "INSERT INTO users (username, email, password, role, verified, verification_code, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (pending_reg['username'], pending_reg['email'], pending_reg['hashed_password'], "technician", 1, None, pending_reg['created_at'])
+        get_repository().create_user(
+            pending_reg['username'], pending_reg['email'], pending_reg['hashed_password'],
+            "technician", 1, pending_reg['created_at']
         )
-        conn.commit()
-        conn.close()
         
         # Clear session data
         session.pop('pending_registration', None)
@@ -529,10 +696,10 @@ def verify_code():
         
         flash("Email verified successfully! You can now log in.", "success")
         return redirect(url_for("login"))
-    except sqlite3.IntegrityError as e:
+    except DuplicateUser as e:
         # User may have been registered by another request
         session.pop('pending_registration', None)
-        print(f"[VERIFY] IntegrityError (likely duplicate): {e}")
+        print(f"[VERIFY] Duplicate user: {e}")
         flash("This username or email is already registered.", "danger")
         return redirect(url_for("register"))
     except Exception as e:
@@ -557,219 +724,140 @@ def index():
     status = request.args.get("status", "").strip()
     priority = request.args.get("priority", "").strip()
     report_type = request.args.get("report_type", "").strip()
+    include_archive = request.args.get("include_archive") == "1"
 
-    conn = get_db()
-    cur = conn.cursor()
-
-    query = """
-        SELECT r.*,
-        (SELECT COUNT(*) FROM issues i WHERE i.report_id = r.id AND i.status != 'Resolved') AS open_issues
-        FROM reports r
-        WHERE 1=1
-    """
-    params = []
-
-    if site:
-        query += " AND r.site_name LIKE ?"
-        params.append(f"%{site}%")
-
-    if status:
-        query += " AND r.overall_status = ?"
-        params.append(status)
-
-    if report_type:
-        query += " AND r.report_type = ?"
-        params.append(report_type)
-
-    query += " ORDER BY r.created_at DESC"
-
-    reports = cur.execute(query, params).fetchall()
-
-    # priority filter needs joining issues
-    if priority:
-        reports_filtered = []
-        for r in reports:
-            p = cur.execute(
-                "SELECT COUNT(*) AS c FROM issues WHERE report_id = ? AND priority = ?",
-                (r["id"], priority)
-            ).fetchone()["c"]
-            if p > 0:
-                reports_filtered.append(r)
-        reports = reports_filtered
+    filters = dict(site=site, status=status, report_type=report_type, priority=priority, include_archive=include_archive)
+    # Taken before anything on the page is read: the page replays any write it may
+    # already show, and applying a report's event twice leaves it unchanged.
+    events_cursor = events.current_cursor(get_repository())
 
-    conn.close()
-
-    # Aggregate stats for the displayed reports
-    total_reports = len(reports)
-    total_open_issues = sum([r["open_issues"] or 0 for r in reports])
+    summary = cached_query(
+        "index_summary", (site, status, report_type, priority, include_archive),
+        lambda: get_repository().report_summary(**filters)
+    )
 
     # Counts by overall_status for displayed reports
     status_counts = {"Good": 0, "Stable": 0, "Needs Attention": 0, "Critical": 0}
-    for r in reports:
-        s = r["overall_status"] or ""
-        if s in status_counts:
-            status_counts[s] += 1
-
-    # Devices summary across displayed reports
-    device_total = 0
-    device_broken = 0
-    report_ids = [r["id"] for r in reports]
-    if report_ids:
-        conn = get_db()
-        cur = conn.cursor()
-        q = f"SELECT COUNT(*) AS c FROM devices WHERE report_id IN ({','.join('?'*len(report_ids))})"
-        device_total = cur.execute(q, report_ids).fetchone()["c"]
-        q2 = f"SELECT COUNT(*) AS c FROM devices WHERE report_id IN ({','.join('?'*len(report_ids))}) AND status = ?"
-        device_broken = cur.execute(q2, report_ids + ["Broken"]).fetchone()["c"]
-        conn.close()
+    for name, count in summary["by_status"].items():
+        if name in status_counts:
+            status_counts[name] = count
 
-    return render_template(
+    # Rows are read from the cursor while the page streams out.
+    return stream_page(
         "index.html",
-        reports=reports,
+        reports=get_repository().iter_reports(**filters),
+        events_cursor=events_cursor,
         site=site,
         status=status,
         report_type=report_type,
         priority=priority,
-        total_reports=total_reports,
-        total_open_issues=total_open_issues,
+        include_archive=include_archive,
+        total_reports=summary["total_reports"],
+        total_open_issues=summary["total_open_issues"],
         status_counts=status_counts,
-        device_total=device_total,
-        device_broken=device_broken,
+        device_total=summary["device_total"],
+        device_broken=summary["device_broken"],
+    )
+
+
+@app.route("/events/dashboard")
+@login_required
+def dashboard_events():
+    """Server-sent events with report changes for the open dashboard (see events.py)"""
+    cursor = request.headers.get("Last-Event-ID") or request.args.get("after", "")
+    try:
+        body = events.stream(get_repository(), cursor)
+    except events.TooManyStreams as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    return Response(body, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # keep nginx from buffering the stream
+    })
+
+
+@app.route("/api/sites/suggest")
+@login_required
+def suggest_sites():
+    """Site and location names starting with ``q``, for the typeahead fields (see suggest.py)"""
+    query = request.args.get("q", "").strip()
+    kind = request.args.get("kind", "").strip() or None
+    if kind and kind not in suggest.KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(suggest.KINDS)}."}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), suggest.MAX_LIMIT))
+    suggest.refresh(get_repository())
+    # Short private caching lets backspacing over a query skip the round trip.
+    return jsonify({"query": query, "suggestions": suggest.lookup(query, kind, limit)}), 200, {
+        "Cache-Control": "private, max-age=10",
+    }
+
+
+@app.route("/issues")
+@login_required
+def issue_board():
+    """Open issues across every report, soonest target date first, 50 per page."""
+    status = request.args.get("status", "").strip()
+    priority = request.args.get("priority", "").strip()
+    area = request.args.get("area", "").strip()
+    responsible = request.args.get("responsible", "").strip()
+    overdue = request.args.get("overdue") == "1"
+    descending = request.args.get("sort") == "desc"
+    after = None
+    after_date = request.args.get("after_date", "")
+    after_id = request.args.get("after_id", "")
+    if after_date and after_id.isdigit():
+        after = (after_date, int(after_id))
+
+    issues, next_key = get_repository().issue_board(
+        status=status, priority=priority, area=area, responsible=responsible,
+        overdue_before=date.today().isoformat() if overdue else None,
+        descending=descending, after=after,
     )
 
+    filters = {
+        "status": status, "priority": priority, "area": area, "responsible": responsible,
+        "overdue": "1" if overdue else "", "sort": "desc" if descending else "",
+    }
+    filters = {k: v for k, v in filters.items() if v}
+    next_url = None
+    if next_key:
+        next_url = url_for("issue_board", after_date=next_key[0], after_id=next_key[1], **filters)
+
+    return render_template(
+        "issues.html",
+        issues=issues,
+        filters=filters,
+        first_url=url_for("issue_board", **filters) if after else None,
+        next_url=next_url,
+        today=date.today().isoformat(),
+        no_target_date=repository.NO_TARGET_DATE,
+    )
+
+
+def _bind_report_form(existing=None):
+    """(report, issues, devices) models from the create/edit form.
+
+    On edit, blank Wi-Fi and router password fields keep ``existing``'s.
+    """
+    report = models.bind_form(models.Report, request.form)
+    if existing:
+        report.id = existing.id
+        report.wifi_password = report.wifi_password or existing.wifi_password
+        report.router_password = report.router_password or existing.router_password
+    else:
+        report.created_at = datetime.utcnow().isoformat()
+    return report, models.bind_form_rows(models.Issue, request.form), models.bind_form_rows(models.Device, request.form)
+
 
 @app.route("/report/new", methods=["GET", "POST"])
 @login_required
 def new_report():
     if request.method == "POST":
-        data = request.form
-
-        conn = get_db()
-        cur = conn.cursor()
-
-        cur.execute("""
-            INSERT INTO reports (
-                site_name, location, report_type, period_start, period_end,
-                prepared_by, department, date_submitted, prepared_by_title, office_manager, director_it, site_manager_hr,
-                internet_service_provider, internet_ip, kit_number, recharge_contact, wifi_password, router_password, internet_note,
-                executive_summary, overall_status,
-                network_status, power_status, hardware_status, biomedical_status,
-                cameras_live, cameras_down, biometrics_live, biometrics_down,
-                software_status, security_status,
-                recommendations, risks_constraints, conclusion,
-                created_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get("site_name"),
-            data.get("location"),
-            data.get("report_type"),
-            data.get("period_start"),
-            data.get("period_end"),
-            data.get("prepared_by"),
-            data.get("department"),
-            data.get("date_submitted"),
-            data.get("prepared_by_title"),
-            data.get("office_manager"),
-            data.get("director_it"),
-            data.get("site_manager_hr"),
-            data.get("internet_service_provider"),
-            data.get("internet_ip"),
-            data.get("kit_number"),
-            data.get("recharge_contact"),
-            data.get("wifi_password"),
-            data.get("router_password"),
-            data.get("internet_note"),
-            data.get("executive_summary"),
-            data.get("overall_status"),
-            data.get("network_status"),
-            data.get("power_status"),
-            data.get("hardware_status"),
-            data.get("biomedical_status"),
-            data.get("cameras_live"),
-            data.get("cameras_down"),
-            data.get("biometrics_live"),
-            data.get("biometrics_down"),
-            data.get("software_status"),
-            data.get("security_status"),
-            data.get("recommendations"),
-            data.get("risks_constraints"),
-            data.get("conclusion"),
-            datetime.utcnow().isoformat()
-        ))
-
-        report_id = cur.lastrowid
-
-        # Issues (dynamic)
-        issue_titles = request.form.getlist("issue_title[]")
-        areas = request.form.getlist("area[]")
-        impacts = request.form.getlist("impact[]")
-        statuses = request.form.getlist("issue_status[]")
-        owners = request.form.getlist("owner[]")
-        actions = request.form.getlist("action_taken[]")
-        root_causes = request.form.getlist("root_cause[]")
-        priorities = request.form.getlist("priority[]")
-        target_dates = request.form.getlist("target_date[]")
-        responsibles = request.form.getlist("responsible[]")
-
-        for idx in range(len(issue_titles)):
-            title = issue_titles[idx].strip() if idx < len(issue_titles) else ""
-            if not title:
-                continue
-
-            cur.execute("""
-                INSERT INTO issues (
-                    report_id, issue_title, area, impact, status, owner,
-                    action_taken, root_cause, priority, target_date, responsible
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                report_id,
-                title,
-                areas[idx] if idx < len(areas) else "",
-                impacts[idx] if idx < len(impacts) else "",
-                statuses[idx] if idx < len(statuses) else "",
-                owners[idx] if idx < len(owners) else "",
-                actions[idx] if idx < len(actions) else "",
-                root_causes[idx] if idx < len(root_causes) else "",
-                priorities[idx] if idx < len(priorities) else "",
-                target_dates[idx] if idx < len(target_dates) else "",
-                responsibles[idx] if idx < len(responsibles) else ""
-            ))
-
-        # Devices (dynamic)
-        device_names = request.form.getlist("device_name[]")
-        hostnames = request.form.getlist("hostname[]")
-        serials = request.form.getlist("serial_number[]")
-        software_versions = request.form.getlist("software_version[]")
-        hdd_capacities = request.form.getlist("hdd_capacity[]")
-        device_usernames = request.form.getlist("device_username[]")
-        device_passwords = request.form.getlist("device_password[]")
-        dev_statuses = request.form.getlist("device_status[]")
-
-        for idx in range(len(device_names)):
-            dname = device_names[idx].strip() if idx < len(device_names) else ""
-            if not dname:
-                continue
-
-            cur.execute("""
-                INSERT INTO devices (
-                    report_id, device_name, hostname, serial_number, software_version, hdd_capacity, username, password, status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                report_id,
-                dname,
-                hostnames[idx] if idx < len(hostnames) else "",
-                serials[idx] if idx < len(serials) else "",
-                software_versions[idx] if idx < len(software_versions) else "",
-                hdd_capacities[idx] if idx < len(hdd_capacities) else "",
-                device_usernames[idx] if idx < len(device_usernames) else "",
-                device_passwords[idx] if idx < len(device_passwords) else "",
-                dev_statuses[idx] if idx < len(dev_statuses) else ""
-            ))
-
-        conn.commit()
-        conn.close()
+        report, issues, devices = _bind_report_form()
+        try:
+            report_id = get_repository().create_report(report, issues, devices)
+        except WriteQueueFull as e:
+            flash(str(e), "warning")
+            return render_template("new_report.html"), 503
 
         flash("Report saved successfully!", "success")
         return redirect(url_for("report_detail", report_id=report_id))
@@ -777,357 +865,109 @@ def new_report():
     return render_template("new_report.html")
 
 
+def _load_report(report_id):
+    """(report, issues, devices, archived), falling back to the archive files."""
+    return repository.load_report(get_repository(), report_id)
+
+
 @app.route("/report/<int:report_id>")
 @login_required
 def report_detail(report_id):
-    conn = get_db()
-    cur = conn.cursor()
-
-    report = cur.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
-    issues = cur.execute("SELECT * FROM issues WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
-    devices = cur.execute("SELECT * FROM devices WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
-
-    conn.close()
+    report, issues, devices, archived = cached_query("report_detail", (report_id,), lambda: _load_report(report_id))
 
     if not report:
         flash("Report not found.", "danger")
         return redirect(url_for("index"))
 
-    return render_template("report_detail.html", report=report, issues=issues, devices=devices)
+    report_attachments = cached_query(
+        "attachments", (report_id,), lambda: get_repository().get_attachments(report_id, include_archive=archived)
+    )
+    return render_template(
+        "report_detail.html", report=report, issues=issues, devices=devices, archived=archived,
+        attachments=report_attachments, chunk_size=min(attachments.CHUNK_MAX, 1024 * 1024),
+    )
 
 
 @app.route("/report/<int:report_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_report(report_id):
-    conn = get_db()
-    cur = conn.cursor()
-
-    report = cur.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
-    issues = cur.execute("SELECT * FROM issues WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
+    repo = get_repository()
+    report = repo.get_report(report_id)
+    issues = repo.get_issues(report_id)
 
     if not report:
-        conn.close()
         flash("Report not found.", "danger")
         return redirect(url_for("index"))
 
     if request.method == "POST":
-        data = request.form
-
-        cur.execute("""
-            UPDATE reports SET
-                site_name=?, location=?, report_type=?, period_start=?, period_end=?,
-                prepared_by=?, department=?, date_submitted=?, prepared_by_title=?, office_manager=?, director_it=?, site_manager_hr=?,
-                internet_service_provider=?, internet_ip=?, kit_number=?, recharge_contact=?, wifi_password=?, router_password=?, internet_note=?,
-                executive_summary=?, overall_status=?,
-                network_status=?, power_status=?, hardware_status=?, biomedical_status=?,
-                cameras_live=?, cameras_down=?, biometrics_live=?, biometrics_down=?,
-                software_status=?, security_status=?,
-                recommendations=?, risks_constraints=?, conclusion=?
-            WHERE id=?
-        """, (
-            data.get("site_name"),
-            data.get("location"),
-            data.get("report_type"),
-            data.get("period_start"),
-            data.get("period_end"),
-            data.get("prepared_by"),
-            data.get("department"),
-            data.get("date_submitted"),
-            data.get("prepared_by_title"),
-            data.get("office_manager"),
-            data.get("director_it"),
-            data.get("site_manager_hr"),
-            data.get("internet_service_provider"),
-            data.get("internet_ip"),
-            data.get("kit_number"),
-            data.get("recharge_contact"),
-            data.get("wifi_password") or report["wifi_password"],
-            data.get("router_password") or report["router_password"],
-            data.get("internet_note"),
-            data.get("executive_summary"),
-            data.get("overall_status"),
-            data.get("network_status"),
-            data.get("power_status"),
-            data.get("hardware_status"),
-            data.get("biomedical_status"),
-            data.get("cameras_live"),
-            data.get("cameras_down"),
-            data.get("biometrics_live"),
-            data.get("biometrics_down"),
-            data.get("software_status"),
-            data.get("security_status"),
-            data.get("recommendations"),
-            data.get("risks_constraints"),
-            data.get("conclusion"),
-            report_id
-        ))
-
-        # Clear old issues then re-add
-        cur.execute("DELETE FROM issues WHERE report_id = ?", (report_id,))
-        # Clear old devices then re-add
-        cur.execute("DELETE FROM devices WHERE report_id = ?", (report_id,))
-
-        issue_titles = request.form.getlist("issue_title[]")
-        areas = request.form.getlist("area[]")
-        impacts = request.form.getlist("impact[]")
-        statuses = request.form.getlist("issue_status[]")
-        owners = request.form.getlist("owner[]")
-        actions = request.form.getlist("action_taken[]")
-        root_causes = request.form.getlist("root_cause[]")
-        priorities = request.form.getlist("priority[]")
-        target_dates = request.form.getlist("target_date[]")
-        responsibles = request.form.getlist("responsible[]")
-
-        for idx in range(len(issue_titles)):
-            title = issue_titles[idx].strip() if idx < len(issue_titles) else ""
-            if not title:
-                continue
-
-            cur.execute("""
-                INSERT INTO issues (
-                    report_id, issue_title, area, impact, status, owner,
-                    action_taken, root_cause, priority, target_date, responsible
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                report_id,
-                title,
-                areas[idx] if idx < len(areas) else "",
-                impacts[idx] if idx < len(impacts) else "",
-                statuses[idx] if idx < len(statuses) else "",
-                owners[idx] if idx < len(owners) else "",
-                actions[idx] if idx < len(actions) else "",
-                root_causes[idx] if idx < len(root_causes) else "",
-                priorities[idx] if idx < len(priorities) else "",
-                target_dates[idx] if idx < len(target_dates) else "",
-                responsibles[idx] if idx < len(responsibles) else ""
-            ))
-
-        # Re-add devices
-        device_names = request.form.getlist("device_name[]")
-        hostnames = request.form.getlist("hostname[]")
-        serials = request.form.getlist("serial_number[]")
-        software_versions = request.form.getlist("software_version[]")
-        hdd_capacities = request.form.getlist("hdd_capacity[]")
-        device_usernames = request.form.getlist("device_username[]")
-        device_passwords = request.form.getlist("device_password[]")
-        dev_statuses = request.form.getlist("device_status[]")
-
-        for idx in range(len(device_names)):
-            dname = device_names[idx].strip() if idx < len(device_names) else ""
-            if not dname:
-                continue
-
-            cur.execute("""
-                INSERT INTO devices (
-                    report_id, device_name, hostname, serial_number, software_version, hdd_capacity, username, password, status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                report_id,
-                dname,
-                hostnames[idx] if idx < len(hostnames) else "",
-                serials[idx] if idx < len(serials) else "",
-                software_versions[idx] if idx < len(software_versions) else "",
-                hdd_capacities[idx] if idx < len(hdd_capacities) else "",
-                device_usernames[idx] if idx < len(device_usernames) else "",
-                device_passwords[idx] if idx < len(device_passwords) else "",
-                dev_statuses[idx] if idx < len(dev_statuses) else ""
-            ))
-
-        conn.commit()
-        conn.close()
+        updated, new_issues, devices = _bind_report_form(existing=report)
+        try:
+            get_repository().update_report(updated, new_issues, devices)
+        except WriteQueueFull as e:
+            flash(str(e), "warning")
+            return render_template("edit_report.html", report=report, issues=issues), 503
 
         flash("Report updated successfully!", "success")
         return redirect(url_for("report_detail", report_id=report_id))
 
-    conn.close()
     return render_template("edit_report.html", report=report, issues=issues)
 
 
 @app.route("/report/<int:report_id>/delete", methods=["POST"])
 @login_required
 def delete_report(report_id):
-    conn = get_db()
-    cur = conn.cursor()
-
-    cur.execute("DELETE FROM reports WHERE id = ?", (report_id,))
-    conn.commit()
-    conn.close()
+    repo = get_repository()
+    hashes = repo.report_attachment_hashes([report_id])
+    try:
+        repo.delete_report(report_id)
+    except WriteQueueFull as e:
+        flash(str(e), "warning")
+        return redirect(url_for("report_detail", report_id=report_id))
+    _release_attachment_files(hashes)
 
     flash("Report deleted.", "info")
     return redirect(url_for("index"))
 
 
-@app.route("/report/<int:report_id>/download")
+def _release_attachment_files(hashes):
+    """Remove the stored files of deleted reports' attachments that nothing else refers to."""
+    if hashes:
+        attachments.release(hashes, get_repository().attachment_hashes())
+
+
+@app.route("/reports/delete", methods=["POST"])
 @login_required
-def download_report(report_id):
-    conn = get_db()
-    cur = conn.cursor()
+def delete_reports():
+    """Bulk delete from the dashboard: the ticked reports and their dependent rows in one transaction"""
+    report_ids = sorted({int(v) for v in request.form.getlist("report_id") if v.isdigit()})
+    if not report_ids:
+        flash("No reports selected.", "warning")
+        return redirect(url_for("index"))
+    repo = get_repository()
+    hashes = repo.report_attachment_hashes(report_ids)
+    try:
+        deleted = repo.delete_reports(report_ids)
+    except WriteQueueFull as e:
+        flash(str(e), "warning")
+        return redirect(url_for("index"))
+    _release_attachment_files(hashes)
 
-    report = cur.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
-    issues = cur.execute("SELECT * FROM issues WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
+    flash(f"Deleted {deleted} report(s).", "info")
+    return redirect(url_for("index"))
 
-    conn.close()
+
+@app.route("/report/<int:report_id>/download")
+@login_required
+@ratelimit.limit("pdf")
+def download_report(report_id):
+    report, issues, devices, _ = _load_report(report_id)
 
     if not report:
         flash("Report not found.", "danger")
         return redirect(url_for("index"))
 
-    # Create PDF in memory
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor("#1a2c47"),
-        spaceAfter=6,
-        alignment=TA_CENTER
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=12,
-        textColor=colors.HexColor('#1f4788'),
-        spaceAfter=6,
-        spaceBefore=12
-    )
-
-    # Title
-    story.append(Paragraph("SITE REPORT DETAIL", title_style))
-    story.append(Spacer(1, 0.2*inch))
-
-    # Report header info
-    available_width = doc.width
-    label_col = 1.8 * inch
-    value_col = max(available_width - label_col, 2.5 * inch)
-
-    header_data = [
-        ["Site Name:", Paragraph(report["site_name"] or "-", styles['Normal'])],
-        ["Location:", Paragraph(report["location"] or "-", styles['Normal'])],
-        ["Report Type:", Paragraph(report["report_type"] or "-", styles['Normal'])],
-        ["Period Start:", Paragraph(report["period_start"] or "-", styles['Normal'])],
-        ["Period End:", Paragraph(report["period_end"] or "-", styles['Normal'])],
-        ["Prepared By:", Paragraph(report["prepared_by"] or "-", styles['Normal'])],
-        ["Prepared By Title:", Paragraph(report["prepared_by_title"] or "-", styles['Normal'])],
-        ["Department:", Paragraph(report["department"] or "-", styles['Normal'])],
-        ["Office Manager:", Paragraph(report["office_manager"] or "-", styles['Normal'])],
-        ["Director of IT Department:", Paragraph(report["director_it"] or "-", styles['Normal'])],
-        ["Site Manager/HR:", Paragraph(report["site_manager_hr"] or "-", styles['Normal'])],
-        ["Date Submitted:", Paragraph(report["date_submitted"] or "-", styles['Normal'])],
-        ["Overall Status:", Paragraph(report["overall_status"] or "-", styles['Normal'])]
-    ]
-    header_table = Table(header_data, colWidths=[label_col, value_col])
-    header_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f0f8')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-    ]))
-    story.append(header_table)
-    story.append(Spacer(1, 0.3*inch))
-
-    # Executive Summary
-    story.append(Paragraph("EXECUTIVE SUMMARY", heading_style))
-    story.append(Paragraph(report["executive_summary"] or "-", styles['Normal']))
-    story.append(Spacer(1, 0.2*inch))
-
-    # Status Overview
-    story.append(Paragraph("STATUS OVERVIEW", heading_style))
-    status_data = [
-        ["Category", "Status"],
-        ["Network", Paragraph(report["network_status"] or "-", styles['Normal'])],
-        ["Power", Paragraph(report["power_status"] or "-", styles['Normal'])],
-        ["Hardware", Paragraph(report["hardware_status"] or "-", styles['Normal'])],
-        ["Cameras", Paragraph(f"{report['cameras_live'] or '-'} live / {report['cameras_down'] or '-'} down", styles['Normal'])],
-        ["Biometrics", Paragraph(f"{report['biometrics_live'] or '-'} live / {report['biometrics_down'] or '-'} down", styles['Normal'])],
-        ["Software", Paragraph(report["software_status"] or "-", styles['Normal'])],
-        ["Security", Paragraph(report["security_status"] or "-", styles['Normal'])]
-    ]
-    status_table = Table(status_data, colWidths=[available_width * 0.35, available_width * 0.65])
-    status_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
-        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6)
-    ]))
-    story.append(status_table)
-    story.append(Spacer(1, 0.2*inch))
-
-    # Issues
-    if issues:
-        story.append(Paragraph("ISSUES LOGGED", heading_style))
-        issues_data = [["Issue Title", "Area", "Impact", "Status", "Priority", "Owner"]]
-        for issue in issues:
-            issues_data.append([
-                Paragraph(issue["issue_title"] or "-", styles['Normal']),
-                Paragraph(issue["area"] or "-", styles['Normal']),
-                Paragraph(issue["impact"] or "-", styles['Normal']),
-                Paragraph(issue["status"] or "-", styles['Normal']),
-                Paragraph(issue["priority"] or "-", styles['Normal']),
-                Paragraph(issue["owner"] or "-", styles['Normal'])
-            ])
-        issues_table = Table(issues_data, colWidths=[available_width * 0.35, available_width * 0.13, available_width * 0.13, available_width * 0.13, available_width * 0.13, available_width * 0.13])
-        issues_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4)
-        ]))
-        story.append(issues_table)
-        story.append(Spacer(1, 0.2*inch))
-
-    # Recommendations
-    story.append(Paragraph("RECOMMENDATIONS", heading_style))
-    story.append(Paragraph(report["recommendations"] or "-", styles['Normal']))
-    story.append(Spacer(1, 0.2*inch))
-
-    # Risks & Constraints
-    story.append(Paragraph("RISKS & CONSTRAINTS", heading_style))
-    story.append(Paragraph(report["risks_constraints"] or "-", styles['Normal']))
-    story.append(Spacer(1, 0.2*inch))
-
-    # Conclusion
-    story.append(Paragraph("CONCLUSION", heading_style))
-    story.append(Paragraph(report["conclusion"] or "-", styles['Normal']))
-
-    # Build PDF
-    def on_first_page(canvas, doc_obj):
-        canvas.saveState()
-        width, height = doc_obj.pagesize
-        logo_path = os.path.join(os.path.dirname(__file__), 'static', 'logo.png')
-        
-        if os.path.exists(logo_path):
-            try:
-                logo_width = 1.8 * inch
-                logo_height = 0.45 * inch
-                logo_x = doc_obj.leftMargin
-                logo_y = height - logo_height - 0.35 * inch
-                canvas.drawImage(logo_path, logo_x, logo_y, width=logo_width, height=logo_height, preserveAspectRatio=True)
-            except Exception:
-                pass
-        canvas.restoreState()
-
-    doc.build(story, onFirstPage=on_first_page)
-    pdf_buffer.seek(0)
+    from pdf_report import build_report_pdf
+    pdf_buffer = build_report_pdf(report, issues, devices, show_credentials=current_user.role == 'admin')
 
     return send_file(
         pdf_buffer,
@@ -1140,69 +980,224 @@ def download_report(report_id):
 @app.route('/download_all_csv')
 @login_required
 @admin_required
+@ratelimit.limit("export")
 def download_all_csv():
-    """Admin-only CSV download for all reports"""
-    conn = get_db()
-    cur = conn.cursor()
+    """Admin-only CSV download for all reports.
 
-    # Fetch all reports
-    cur.execute("SELECT * FROM reports")
-    rows = cur.fetchall()
-
-    # Determine column names and exclude heavy/text fields
-    exclude = set([
-        'executive_summary',
-        'network_status',
-        'power_status',
-        'hardware_status',
-        'biomedical_status',
-        'recommendations',
-        'risks_constraints',
-        'conclusion'
-    ])
-
-    if cur.description:
-        all_cols = [c[0] for c in cur.description]
-    else:
-        all_cols = [r[1] for r in cur.execute("PRAGMA table_info(reports)").fetchall()]
-
-    # Default: omit 'id' and 'created_at' as well
-    default_omit = set(['id', 'created_at'])
-    cols = [c for c in all_cols if c not in exclude and c not in default_omit]
-
-    # Fields that contain sensitive credentials and should be hidden in CSV
-    sensitive_fields = set(['wifi_password', 'router_password'])
-
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(cols)
-
-    for row in rows:
-        out_row = []
-        for c in cols:
-            val = row[c] if row[c] is not None else ""
-            if c in sensitive_fields and val:
-                out_row.append('[HIDDEN]')
-            else:
-                out_row.append(val)
-        writer.writerow(out_row)
-
-    mem = BytesIO()
-    mem.write(si.getvalue().encode('utf-8'))
-    mem.seek(0)
-    conn.close()
+    Rows are read from a point-in-time snapshot (see exports.py) and streamed,
+    so a large export never holds a read transaction on the live database.
+    """
+    from exports import iter_reports_csv
 
-    return send_file(
-        mem,
+    def generate():
+        with get_repository().snapshot() as conn:
+            yield from iter_reports_csv(conn)
+
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=all_site_reports.csv'}
+    )
+
+
+@app.route('/download_all_xlsx')
+@login_required
+@admin_required
+@ratelimit.limit("export")
+def download_all_xlsx():
+    """Admin-only Excel workbook with Reports, Issues and Devices sheets, streamed from a snapshot."""
+    from exports import iter_reports_xlsx
+
+    def generate():
+        with get_repository().snapshot() as conn:
+            yield from iter_reports_xlsx(conn)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': 'attachment; filename=all_site_reports.xlsx'}
+    )
+
+
+# ----------------------------
+# Attachments
+# ----------------------------
+@app.route('/report/<int:report_id>/attachments', methods=['POST'])
+@login_required
+def create_attachment_upload(report_id):
+    """Start a chunked upload; the client then PUTs the file to the returned upload_url"""
+    data = request.get_json(silent=True) or request.form
+    repo = get_repository()
+    if not repo.get_report(report_id):
+        return jsonify({"error": "Report not found."}), 404
+    filename = (data.get("filename") or "").strip()[:255]
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        size = 0
+    if not filename or size <= 0:
+        return jsonify({"error": "filename and size are required."}), 400
+    if size > attachments.MAX_BYTES:
+        return jsonify({"error": f"Files are limited to {attachments.MAX_BYTES} bytes."}), 413
+    issue_id = data.get("issue_id") or None
+    if issue_id is not None:
+        if not str(issue_id).isdigit() or int(issue_id) not in {i["id"] for i in repo.get_issues(report_id)}:
+            return jsonify({"error": "Issue not found on this report."}), 400
+        issue_id = int(issue_id)
+
+    upload = attachments.create_upload(
+        current_user.id, report_id, issue_id, filename,
+        data.get("content_type") or "application/octet-stream", size, data.get("sha256"),
+    )
+    body = attachments.upload_to_dict(upload)
+    body["upload_url"] = url_for("attachment_upload", upload_id=upload["id"])
+    return jsonify(body), 201, {"Location": body["upload_url"]}
+
+@app.route('/attachments/uploads/<upload_id>', methods=['GET', 'PUT'])
+@login_required
+def attachment_upload(upload_id):
+    """GET: how much has arrived (to resume). PUT: the next chunk, starting at the Upload-Offset header"""
+    upload = attachments.get_upload(upload_id)
+    if not upload or upload["user_id"] != current_user.id:
+        return jsonify({"error": "Upload not found."}), 404
+    if request.method == 'GET':
+        return jsonify(attachments.upload_to_dict(upload))
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header required."}), 400
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length required."}), 411
+    if request.content_length > attachments.CHUNK_MAX:
+        return jsonify({"error": f"Chunks are limited to {attachments.CHUNK_MAX} bytes."}), 413
+    try:
+        offset = attachments.write_chunk(upload, offset, request.stream, request.content_length)
+    except attachments.OffsetMismatch as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    if offset < upload["size"]:
+        return jsonify({"id": upload_id, "size": upload["size"], "offset": offset})
+
+    try:
+        sha256 = attachments.finish_upload(upload)
+    except attachments.ChecksumMismatch as e:
+        return jsonify({"error": str(e)}), 422
+    attachment_id = get_repository().add_attachment(
+        upload["report_id"], upload["issue_id"], sha256, upload["filename"],
+        upload["content_type"], upload["size"], current_user.username,
+    )
+    return jsonify({
+        "attachment_id": attachment_id,
+        "size": upload["size"],
+        "offset": offset,
+        "url": url_for("download_attachment", attachment_id=attachment_id),
+    }), 201
+
+@app.route('/attachments/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    """Stream an attachment from disk; Range requests get 206 partial content"""
+    attachment = get_repository().get_attachment(attachment_id, include_archive=True)
+    path = attachments.object_path(attachment["sha256"]) if attachment else None
+    if not path or not os.path.exists(path):
+        flash("Attachment not found.", "danger")
+        return redirect(url_for("index"))
+    inline = attachment["content_type"] in attachments.INLINE_TYPES
+    response = send_file(
+        path,
+        mimetype=attachment["content_type"] if inline else "application/octet-stream",
+        as_attachment=not inline,
+        download_name=attachment["filename"],
+        conditional=True,
+        etag=attachment["sha256"],
+    )
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
+@app.route('/attachments/<int:attachment_id>/delete', methods=['POST'])
+@login_required
+def delete_attachment(attachment_id):
+    repo = get_repository()
+    attachment = repo.get_attachment(attachment_id)
+    if not attachment:
+        flash("Attachment not found.", "danger")
+        return redirect(url_for("index"))
+    repo.delete_attachment(attachment_id)
+    flash("Attachment deleted.", "success")
+    return redirect(url_for("report_detail", report_id=attachment["report_id"]))
+
+
+# ----------------------------
+# Background jobs
+# ----------------------------
+def _queue_job(kind, params=None):
+    try:
+        job_id = jobs.submit(current_user.id, kind, params)
+    except jobs.JobLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify({"id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202, {
+        "Location": url_for("job_status", job_id=job_id)
+    }
+
+def _get_own_job(job_id):
+    job = jobs.get(job_id)
+    if not job or (job["user_id"] != current_user.id and current_user.role != 'admin'):
+        return None
+    return job
+
+@app.route('/jobs/export/csv', methods=['POST'])
+@login_required
+@admin_required
+@ratelimit.limit("export", heavy=False)
+def queue_csv_export():
+    """Queue the all-reports CSV export as a background job"""
+    return _queue_job("csv_export")
+
+@app.route('/jobs/export/xlsx', methods=['POST'])
+@login_required
+@admin_required
+@ratelimit.limit("export", heavy=False)
+def queue_xlsx_export():
+    """Queue the all-reports Excel workbook as a background job"""
+    return _queue_job("xlsx_export")
+
+@app.route('/jobs/report/<int:report_id>/pdf', methods=['POST'])
+@login_required
+@ratelimit.limit("pdf", heavy=False)
+def queue_report_pdf(report_id):
+    """Queue a report PDF as a background job"""
+    return _queue_job("report_pdf", {"report_id": report_id, "show_credentials": current_user.role == 'admin'})
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = _get_own_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    data = jobs.to_dict(job)
+    if job["status"] == "done":
+        data["download_url"] = url_for("job_download", job_id=job_id)
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = _get_own_job(job_id)
+    if not job or job["status"] != "done" or not os.path.exists(job["result_path"] or ""):
+        flash("Export not found or expired.", "danger")
+        return redirect(url_for("index"))
+    return send_file(
+        job["result_path"],
+        mimetype=job["result_mimetype"],
         as_attachment=True,
-        download_name='all_site_reports.csv'
+        download_name=job["result_name"]
     )
 
 
 @app.route('/device_passwords', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@ratelimit.limit("passwords", methods=("POST",))
 def device_passwords():
     """Admin-only page to view device passwords after password confirmation"""
     if request.method == 'POST':
@@ -1211,22 +1206,11 @@ def device_passwords():
             flash("Password required.", "danger")
             return render_template('device_passwords.html', show_form=True, devices=None)
 
-        conn = get_db()
-        cur = conn.cursor()
-        admin = cur.execute("SELECT password FROM users WHERE username = 'admin'").fetchone()
-        conn.close()
+        admin = get_repository().get_user_by_username('admin')
 
         if admin and check_password_hash(admin['password'], password):
             # Fetch devices
-            conn = get_db()
-            cur = conn.cursor()
-            devices = cur.execute("""
-                SELECT r.site_name, d.device_name, d.username, d.password, r.wifi_password, r.router_password
-                FROM devices d
-                JOIN reports r ON d.report_id = r.id
-                ORDER BY r.site_name, d.device_name
-            """).fetchall()
-            conn.close()
+            devices = cached_query("device_passwords", (), get_repository().device_credentials)
             return render_template('device_passwords.html', show_form=False, devices=devices)
         else:
             flash("Incorrect password.", "danger")
@@ -1235,5 +1219,210 @@ def device_passwords():
         return render_template('device_passwords.html', show_form=True, devices=None)
 
 
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    """Admin-only JSON dump of this worker's counters"""
+    return jsonify(metrics.snapshot())
+
+
+MEMORY_GROUPINGS = ("lineno", "filename", "traceback")
+
+def _memory_listing_args():
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in MEMORY_GROUPINGS:
+        group_by = "lineno"
+    return group_by, min(max(request.args.get("limit", 20, type=int), 1), 200)
+
+def _memory_disabled():
+    return jsonify({"error": "Memory profiling is off; start the worker with MEMPROFILE_ENABLED=1."}), 409
+
+@app.route('/admin/memory')
+@login_required
+@admin_required
+def admin_memory():
+    """Admin-only: per-endpoint peaks, recent over-budget requests and saved snapshots of this worker"""
+    if not memprofile.enabled():
+        return _memory_disabled()
+    return jsonify(memprofile.status())
+
+@app.route('/admin/memory/snapshots', methods=['POST'])
+@login_required
+@admin_required
+def admin_memory_snapshot():
+    """Admin-only: keep a tracemalloc snapshot and list its top allocation sites"""
+    if not memprofile.enabled():
+        return _memory_disabled()
+    group_by, limit = _memory_listing_args()
+    snapshot_id = memprofile.take_snapshot(request.args.get("label"))
+    return jsonify({
+        "id": snapshot_id,
+        "top": memprofile.top_sites(memprofile.get_snapshot(snapshot_id), group_by, limit),
+    }), 201
+
+@app.route('/admin/memory/snapshots/<int:snapshot_id>')
+@login_required
+@admin_required
+def admin_memory_snapshot_detail(snapshot_id):
+    """Admin-only: top allocation sites of a saved snapshot"""
+    snapshot = memprofile.get_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({"error": "Snapshot not found."}), 404
+    group_by, limit = _memory_listing_args()
+    return jsonify({"id": snapshot_id, "top": memprofile.top_sites(snapshot, group_by, limit)})
+
+@app.route('/admin/memory/snapshots/<int:snapshot_id>/diff')
+@login_required
+@admin_required
+def admin_memory_diff(snapshot_id):
+    """Admin-only: what grew since a snapshot, compared to ?against=<id> or to the heap now"""
+    if not memprofile.enabled():
+        return _memory_disabled()
+    old = memprofile.get_snapshot(snapshot_id)
+    against = request.args.get("against", type=int)
+    new = memprofile.get_snapshot(against) if against is not None else None
+    if old is None or (against is not None and new is None):
+        return jsonify({"error": "Snapshot not found."}), 404
+    group_by, limit = _memory_listing_args()
+    return jsonify({
+        "from": snapshot_id,
+        "to": against if against is not None else "now",
+        "top": memprofile.diff(old, new, group_by, limit),
+    })
+
+
+# ----------------------------
+# CLI commands
+# ----------------------------
+@app.cli.command("serve")
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", default=8000, show_default=True, type=int)
+@click.option("--workers", default=lambda: int(os.getenv("WEB_WORKERS", "2")), show_default="WEB_WORKERS or 2", type=int)
+@click.option("--threads", default=lambda: int(os.getenv("WEB_THREADS", "8")), show_default="WEB_THREADS or 8", type=int)
+@click.option("--max-requests", default=lambda: int(os.getenv("WEB_MAX_REQUESTS", "0")), show_default="WEB_MAX_REQUESTS or 0 (never)", type=int,
+              help="Recycle a worker after this many requests.")
+@click.option("--timeout", default=30, show_default=True, type=int, help="Socket timeout in seconds while a request is read or its response written.")
+@click.option("--idle-timeout", default=lambda: int(os.getenv("WEB_IDLE_TIMEOUT", "5")), show_default="WEB_IDLE_TIMEOUT or 5", type=int,
+              help="Seconds a connection may wait idle before sending a request.")
+@click.option("--max-queue", default=lambda: int(os.getenv("WEB_MAX_QUEUE", "64")), show_default="WEB_MAX_QUEUE or 64", type=int,
+              help="Connections waiting for a thread per worker before new ones get a 503.")
+def serve_command(host, port, workers, threads, max_requests, timeout, idle_timeout, max_queue):
+    """Serve the app with pre-forked, threaded workers."""
+    from serve import serve
+    serve(host=host, port=port, workers=workers, threads=threads, max_requests=max_requests, timeout=timeout,
+          idle_timeout=idle_timeout, max_queue=max_queue)
+
+
+@app.cli.command("serve-api")
+@click.option("--host", default="0.0.0.0", show_default=True)
+@click.option("--port", default=8001, show_default=True, type=int)
+@click.option("--workers", default=lambda: int(os.getenv("API_WORKERS", "1")), show_default="API_WORKERS or 1", type=int)
+@click.option("--timeout", default=30, show_default=True, type=int, help="Idle keep-alive socket timeout in seconds.")
+def serve_api_command(host, port, workers, timeout):
+    """Serve the read API (/api) from the asyncio tier in asgi.py."""
+    try:
+        import uvicorn
+    except ImportError:
+        raise click.ClickException("serve-api requires uvicorn (pip install uvicorn)")
+    uvicorn.run("asgi:application", host=host, port=port, workers=workers, timeout_keep_alive=timeout,
+                lifespan="on", access_log=False)
+
+
+@app.cli.command("archive-reports")
+@click.option("--older-than-days", default=lambda: archive.ARCHIVE_AFTER_DAYS, show_default="ARCHIVE_AFTER_DAYS or 365", type=int)
+@click.option("--batch-size", default=200, show_default=True, type=int)
+def archive_reports_command(older_than_days, batch_size):
+    """Move old reports, issues and devices into per-year archive databases."""
+    if repository.DB_BACKEND != "sqlite":
+        raise click.ClickException("Archiving is only available with the SQLite backend.")
+    init_db()
+    for region, path in shards.shard_paths(DB_PATH).items():
+        moved = archive.archive_reports(path, older_than_days, batch_size)
+        click.echo(f"Archived {moved} report(s) older than {older_than_days} days from {region}.")
+
+def _shard_regions(region):
+    if repository.DB_BACKEND != "sqlite":
+        raise click.ClickException("Shards are only available with the SQLite backend.")
+    regions = [shards.MAIN] + shards.REGIONS
+    if region and region not in regions:
+        raise click.ClickException(f"Unknown region {region!r}; configured: {', '.join(regions)}")
+    return [region] if region else regions
+
+@app.cli.command("shard-migrate")
+@click.option("--region", help="Only this region (default: the main database and every shard).")
+def shard_migrate_command(region):
+    """Create or migrate the report tables of each region shard."""
+    for name in _shard_regions(region):
+        if name == shards.MAIN:
+            init_db()
+        else:
+            init_shard_db(name)
+        click.echo(f"Migrated {name}: {shards.shard_path(DB_PATH, name)}")
+
+@app.cli.command("shard-backup")
+@click.argument("dest_dir", type=click.Path(file_okay=False))
+@click.option("--region", help="Only this region (default: the main database and every shard).")
+def shard_backup_command(dest_dir, region):
+    """Copy each region's database to DEST_DIR with the online backup API."""
+    from exports import backup_database
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    for name in _shard_regions(region):
+        dest = os.path.join(dest_dir, f"{name}-{stamp}.db")
+        backup_database(shards.shard_path(DB_PATH, name), dest)
+        click.echo(f"Backed up {name} to {dest}")
+
+@app.cli.command("purge-orphans")
+@click.option("--batch-size", default=lambda: maintenance.ORPHAN_BATCH_SIZE, show_default="5000", type=int,
+              help="Rows examined per transaction.")
+@click.option("--dry-run", is_flag=True, help="Only count orphaned rows.")
+def purge_orphans_command(batch_size, dry_run):
+    """Delete issues, devices, attachments and old events whose report no longer exists."""
+    if repository.DB_BACKEND != "sqlite":
+        raise click.ClickException("Postgres enforces the foreign keys itself; there is nothing to purge.")
+    init_db()
+    for region, path in shards.shard_paths(DB_PATH).items():
+        conn = dbconn.connect(path, timeout=30)
+        try:
+            found = maintenance.purge_orphans(conn, batch_size, dry_run)
+        finally:
+            conn.close()
+        verb = "Found" if dry_run else "Purged"
+        click.echo(f"{verb} orphaned rows in {region}: " + ", ".join(f"{table} {n}" for table, n in found.items()) + ".")
+    if not dry_run:
+        freed = attachments.collect_garbage(get_repository().attachment_hashes())
+        click.echo(f"Freed {freed} bytes of unreferenced attachments.")
+
+@app.cli.command("attachments-gc")
+@click.option("--min-age", default=lambda: attachments.UPLOAD_TTL, show_default="ATTACHMENT_UPLOAD_TTL or 86400", type=int,
+              help="Keep unreferenced files younger than this many seconds.")
+def attachments_gc_command(min_age):
+    """Delete stored attachment files no report refers to any more."""
+    init_db()
+    attachments.cleanup_expired()
+    freed = attachments.collect_garbage(get_repository().attachment_hashes(), min_age)
+    click.echo(f"Freed {freed} bytes of unreferenced attachments.")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write content-hashed copies of static files and their manifest."""
+    manifest = assets.build_assets(app.static_folder)
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f"{name} -> {hashed}")
+
+@app.cli.command("db-maintain")
+@click.option("--budget", default=lambda: maintenance.MAINTENANCE_BUDGET, show_default="DB_MAINTENANCE_BUDGET or 30", type=float,
+              help="Stop starting new steps after this many seconds.")
+@click.option("--analyze", is_flag=True, help="Run a full ANALYZE instead of PRAGMA optimize.")
+@click.option("--convert", is_flag=True,
+              help="Switch databases to auto_vacuum=INCREMENTAL first (a full VACUUM each, ignoring the budget).")
+def db_maintain_command(budget, analyze, convert):
+    """Optimize, vacuum, checkpoint and integrity-check every database file."""
+    init_db()
+    result = maintenance.run_maintenance(DB_PATH, budget, analyze=analyze, convert=convert)
+    click.echo(f"Reclaimed {result['reclaimed_bytes']} bytes from {len(result['databases'])} database(s) "
+               f"in {result['duration']}s; integrity: {result['integrity']}")
+
 if __name__ == "__main__":
     app.run(debug=True)
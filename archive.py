@@ -0,0 +1,211 @@
+"""Hot/cold archival of old reports into per-year SQLite files.
+
+``archive_reports`` moves reports older than a cut-off, together with
+their issues, devices and attachment rows, from ``site_reports.db`` into
+``instance/archive/reports_<year>.db``. Each batch is copied into the
+attached archive file in one transaction and deleted from the hot database
+in a second (a WAL database's transactions are not atomic across attached
+files), and rows are copied with INSERT OR REPLACE, so an interrupted run
+is simply resumed by running it again.
+
+Readers use ``connect_with_archives`` to get a read-only connection that
+attaches every archive file read-only and exposes ``all_reports``,
+``all_issues`` and ``all_devices`` temp views (hot UNION ALL archives).
+
+Environment variables:
+  ARCHIVE_AFTER_DAYS (default age cut-off for the archive command, defaults to 365)
+"""
+import glob
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import dbconn
+import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+ARCHIVED_TABLES = ("reports", "issues", "devices", "attachments")
+
+# SQLite refuses more attached databases than this by default.
+MAX_ATTACHED = 10
+
+
+def archive_dir(db_path):
+    path = os.path.join(os.path.dirname(db_path), "archive")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def archive_files(db_path):
+    """Existing archive files as [(year, path)], oldest first."""
+    files = []
+    for path in glob.glob(os.path.join(archive_dir(db_path), "reports_*.db")):
+        match = re.search(r"reports_(\d{4})\.db$", path)
+        if match:
+            files.append((int(match.group(1)), path))
+    return sorted(files)
+
+
+def _columns(conn, table, schema="main"):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _ensure_archive_schema(conn, schema):
+    """Create the archived tables in ``schema`` or add columns the hot DB gained since."""
+    # A no-op once the file has tables; new archive files start out incremental (see maintenance.py).
+    conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+    for table in ARCHIVED_TABLES:
+        create_sql = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        existing = _columns(conn, table, schema)
+        if not existing:
+            conn.execute(create_sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE {schema}.{table}", 1))
+            continue
+        for name, col_type in [(r[1], r[2]) for r in conn.execute(f"PRAGMA main.table_info({table})").fetchall()]:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {col_type}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_issues_report ON issues(report_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_devices_report ON devices(report_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attachments_report ON attachments(report_id)")
+
+
+def _move_batch(conn, path, report_ids):
+    conn.execute("ATTACH DATABASE ? AS arc", (path,))
+    try:
+        _ensure_archive_schema(conn, "arc")
+        marks = ",".join("?" * len(report_ids))
+        # Copy committed before the hot rows are deleted: a crash in between
+        # leaves rows in both files rather than in neither.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, key in (("reports", "id"), ("issues", "report_id"), ("devices", "report_id"),
+                               ("attachments", "report_id")):
+                cols = ", ".join(_columns(conn, table))
+                conn.execute(
+                    f"INSERT OR REPLACE INTO arc.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE {key} IN ({marks})",
+                    report_ids
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Children first: deleting the reports would otherwise cascade to rows not copied yet.
+            for table, key in (("attachments", "report_id"), ("issues", "report_id"), ("devices", "report_id"),
+                               ("reports", "id")):
+                conn.execute(f"DELETE FROM main.{table} WHERE {key} IN ({marks})", report_ids)
+            # Cached dashboard results must not keep listing moved reports as hot.
+            conn.execute("UPDATE main.write_generation SET generation = generation + 1 WHERE id = 1")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE arc")
+
+
+def archive_reports(db_path, older_than_days=None, batch_size=200):
+    """Move reports created more than ``older_than_days`` ago into archive files.
+
+    Returns the number of reports moved.
+    """
+    older_than_days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    # Autocommit mode: transactions are managed explicitly per batch.
+    conn = dbconn.connect(db_path, timeout=30, isolation_level=None)
+    moved = 0
+    try:
+        while True:
+            batch = conn.execute(
+                "SELECT id, substr(created_at, 1, 4) FROM reports WHERE created_at < ? ORDER BY id LIMIT ?",
+                (cutoff, batch_size)
+            ).fetchall()
+            if not batch:
+                break
+            by_year = {}
+            for report_id, year in batch:
+                by_year.setdefault(int(year), []).append(report_id)
+            for year, report_ids in sorted(by_year.items()):
+                path = os.path.join(archive_dir(db_path), f"reports_{year}.db")
+                _move_batch(conn, path, report_ids)
+                moved += len(report_ids)
+                print(f"[ARCHIVE] Moved {len(report_ids)} report(s) to {os.path.basename(path)}")
+    finally:
+        conn.close()
+    return moved
+
+
+def connect_with_archives(db_path):
+    """Read-only connection with archives attached and all_* union views."""
+    conn = dbconn.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    files = archive_files(db_path)
+    if len(files) > MAX_ATTACHED:
+        print(f"[ARCHIVE] {len(files)} archive files; only the newest {MAX_ATTACHED} are searched")
+        files = files[-MAX_ATTACHED:]
+    schemas = []
+    for year, path in files:
+        schema = f"arc_{year}"
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{path}?mode=ro",))
+        schemas.append(schema)
+
+    for table in ARCHIVED_TABLES:
+        cols = _columns(conn, table)
+        selects = [f"SELECT {', '.join(cols)} FROM main.{table}"]
+        for schema in schemas:
+            archived = set(_columns(conn, table, schema))
+            if not archived:
+                continue  # written before this table was archived
+            selects.append("SELECT " + ", ".join(c if c in archived else f"NULL AS {c}" for c in cols)
+                           + f" FROM {schema}.{table}")
+        conn.execute(f"CREATE TEMP VIEW all_{table} AS " + " UNION ALL ".join(selects))
+    return conn
+
+
+def _query_archives(db_path, table, sql, params=()):
+    """Run ``sql`` on each archive file that has ``table``, newest first, yielding its rows."""
+    for year, path in reversed(archive_files(db_path)):
+        conn = dbconn.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            if _columns(conn, table):  # files archived before the table existed lack it
+                yield from conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+
+def find_archived_attachments(db_path, report_id):
+    return list(_query_archives(
+        db_path, "attachments", "SELECT * FROM attachments WHERE report_id = ? ORDER BY id", (report_id,)))
+
+
+def find_archived_attachment(db_path, attachment_id):
+    return next(_query_archives(
+        db_path, "attachments", "SELECT * FROM attachments WHERE id = ?", (attachment_id,)), None)
+
+
+def archived_attachment_hashes(db_path):
+    """SHA-256 of every archived attachment, across all archive files."""
+    return {row[0] for row in _query_archives(db_path, "attachments", "SELECT DISTINCT sha256 FROM attachments")}
+
+
+def find_archived_report(db_path, report_id):
+    """Return (report, issues, devices) for an archived report, or None."""
+    for year, path in reversed(archive_files(db_path)):
+        conn = dbconn.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            conn.row_factory = models.row_factory(models.Report)
+            report = conn.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
+            if report:
+                conn.row_factory = models.row_factory(models.Issue)
+                issues = conn.execute("SELECT * FROM issues WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
+                conn.row_factory = models.row_factory(models.Device)
+                devices = conn.execute("SELECT * FROM devices WHERE report_id = ? ORDER BY id DESC", (report_id,)).fetchall()
+                return report, issues, devices
+        finally:
+            conn.close()
+    return None
@@ -0,0 +1,285 @@
+"""Asyncio tier for the read API (see readapi.py).
+
+An ASGI application serving only the GET endpoints under /api. Each open
+connection is a coroutine in the event loop, so thousands of slow or
+long-polling clients cost a few kilobytes each instead of a WSGI worker
+thread apiece. The blocking work, one ``readapi.handle`` call per request,
+runs on a fixed pool of ``API_DB_THREADS`` threads; each thread keeps one
+read-only SQLite connection per database open for its lifetime instead of
+connecting per query. Requests beyond ``API_MAX_PENDING`` waiting for a
+thread are answered 503 at once rather than queued without bound.
+
+Clients sign in through the Flask app as usual: the Flask session cookie
+is verified here with the app's secret key, and the user's role is looked
+up (and kept for ``API_USER_TTL`` seconds) for the role-scoped query cache.
+
+Run it with ``flask serve-api`` or any ASGI server (``uvicorn asgi:application``).
+uvicorn is an optional dependency: pip install uvicorn.
+
+Environment variables:
+  API_DB_THREADS (threads running API queries, each with its own read-only connections, defaults to 16)
+  API_MAX_PENDING (requests waiting for or running a query before new ones get a 503, defaults to 1000)
+  API_USER_TTL (seconds a signed-in user's role is reused before it is looked up again, defaults to 30)
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadData
+
+import app as site_app
+import compression
+import dbconn
+import models
+import readapi
+import repository
+from repository import SQLiteRepository
+
+DB_THREADS = int(os.getenv("API_DB_THREADS", "16"))
+MAX_PENDING = int(os.getenv("API_MAX_PENDING", "1000"))
+USER_TTL = float(os.getenv("API_USER_TTL", "30"))
+
+# (pattern, endpoint); path parameters are the pattern's groups, as ints.
+ROUTES = (
+    (re.compile(r"/api/reports/?"), "reports"),
+    (re.compile(r"/api/reports/(\d+)"), "report"),
+    (re.compile(r"/api/issues/?"), "issues"),
+    (re.compile(r"/api/sites/?"), "sites"),
+)
+
+_executor = None
+_repository = None
+_start_lock = asyncio.Lock()
+_pending = 0
+# user id -> (expires at, role or None)
+_users = {}
+
+
+class ReadOnlySQLiteRepository(SQLiteRepository):
+    """SQLiteRepository reading through one long-lived ``query_only`` connection per thread.
+
+    Archive reads (include_archive) attach the archive databases and still
+    open a connection per query, as in SQLiteRepository. Writes raise.
+    """
+
+    _local = threading.local()
+
+    def _connection(self):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(self.db_path)
+        if conn is None:
+            conn = dbconn.connect(self.db_path)
+            conn.execute("PRAGMA query_only = ON")
+            conn.row_factory = sqlite3.Row
+            connections[self.db_path] = conn
+        return conn
+
+    @contextmanager
+    def _read(self, include_archive=False):
+        if include_archive:
+            with super()._read(include_archive) as cur:
+                yield cur
+            return
+        cur = self._connection().cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    def _fetch(self, model, sql, params, one=False):
+        cur = self._connection().cursor()
+        cur.row_factory = models.row_factory(model)
+        try:
+            cur.execute(sql, params)
+            return cur.fetchone() if one else cur.fetchall()
+        finally:
+            cur.close()
+
+    def _write(self, fn):
+        raise RuntimeError("The API repository is read-only")
+
+
+def api_repository():
+    """The repository the API threads read through, for the configured DB_BACKEND."""
+    if repository.DB_BACKEND != "sqlite":
+        # The Postgres backend already keeps a connection pool.
+        return repository.get_repository()
+    import shards
+    if shards.REGIONS:
+        return shards.ShardedRepository(site_app.DB_PATH, shard_class=ReadOnlySQLiteRepository)
+    return ReadOnlySQLiteRepository(site_app.DB_PATH)
+
+
+# ----------------------------
+# Startup
+# ----------------------------
+def _init():
+    site_app.init_app_once()
+    return api_repository()
+
+
+async def _start():
+    """Create the thread pool and repository once; awaited by every request."""
+    global _executor, _repository
+    if _repository is not None:
+        return
+    async with _start_lock:
+        if _repository is None:
+            _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="api-db")
+            _repository = await asyncio.get_running_loop().run_in_executor(_executor, _init)
+            print(f"[API] Serving the read API with {DB_THREADS} database thread(s)")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await _start()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _executor is not None:
+                _executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+# ----------------------------
+# Sessions
+# ----------------------------
+_serializer = site_app.app.session_interface.get_signing_serializer(site_app.app)
+_session_max_age = int(site_app.app.permanent_session_lifetime.total_seconds())
+_cookie_name = site_app.app.config["SESSION_COOKIE_NAME"]
+
+
+def _session_user_id(cookie_header):
+    """The user id in a valid Flask session cookie, or None."""
+    try:
+        morsel = SimpleCookie(cookie_header or "").get(_cookie_name)
+    except CookieError:
+        return None
+    if morsel is None:
+        return None
+    try:
+        session = _serializer.loads(morsel.value, max_age=_session_max_age)
+    except BadData:
+        return None
+    user_id = session.get("_user_id")
+    return int(user_id) if user_id and str(user_id).isdigit() else None
+
+
+def _lookup_role(user_id):
+    user = _repository.get_user(user_id)
+    return user.role if user else None
+
+
+async def _role(cookie_header):
+    """The signed-in user's role, or None if the request is not signed in."""
+    user_id = _session_user_id(cookie_header)
+    if user_id is None:
+        return None
+    cached = _users.get(user_id)
+    now = time.monotonic()
+    if cached is None or cached[0] < now:
+        role = await asyncio.get_running_loop().run_in_executor(_executor, _lookup_role, user_id)
+        if len(_users) >= 10000:
+            _users.clear()
+        cached = _users[user_id] = (now + USER_TTL, role)
+    return cached[1]
+
+
+# ----------------------------
+# Requests
+# ----------------------------
+def _route(path):
+    for pattern, endpoint in ROUTES:
+        match = pattern.fullmatch(path)
+        if match:
+            return endpoint, tuple(int(group) for group in match.groups())
+    return None
+
+
+def _query_args(query_string):
+    # First value of each name, like request.args.to_dict() on the WSGI side.
+    args = {}
+    for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+        args.setdefault(name, value)
+    return args
+
+
+def _error(status, message, extra=()):
+    return status, [("Cache-Control", "no-store"), *extra], json.dumps({"error": message}, separators=(",", ":")).encode("utf-8")
+
+
+def _handle(endpoint, args, role, params, if_none_match, gzip):
+    # Runs on a database thread; compresses there too, off the event loop.
+    status, headers, body = readapi.handle(_repository, endpoint, args, role, params, if_none_match)
+    if gzip and len(body) >= site_app.app.config["COMPRESS_MIN_SIZE"]:
+        compressor = zlib.compressobj(site_app.app.config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+        body = compressor.compress(body) + compressor.flush()
+        headers = headers + [("Content-Encoding", "gzip"), ("Vary", "Accept-Encoding")]
+    return status, headers, body
+
+
+async def _respond(send, status, headers, body, head=False):
+    raw = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": b"" if head else body})
+
+
+async def application(scope, receive, send):
+    """ASGI entry point."""
+    global _pending
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    await _start()
+    method = scope["method"]
+    route = _route(scope["path"])
+    if route is None:
+        await _respond(send, *_error(404, "Not found."))
+        return
+    if method not in ("GET", "HEAD"):
+        await _respond(send, *_error(405, "Method not allowed.", [("Allow", "GET, HEAD")]))
+        return
+    if _pending >= MAX_PENDING:
+        await _respond(send, *_error(503, "Too many requests in progress.", [("Retry-After", "1")]))
+        return
+
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+    endpoint, params = route
+    # The event loop is single-threaded, so the counter needs no lock.
+    _pending += 1
+    try:
+        role = await _role(headers.get("cookie"))
+        if role is None:
+            response = _error(401, "Sign in to use the API.")
+        else:
+            response = await asyncio.get_running_loop().run_in_executor(
+                _executor, _handle, endpoint, _query_args(scope["query_string"]), role, params,
+                headers.get("if-none-match"),
+                method == "GET" and compression.accepts_gzip(headers.get("accept-encoding")),
+            )
+    except Exception as e:
+        print(f"[API] {method} {scope['path']} failed: {e}")
+        response = _error(500, "Internal error.")
+    finally:
+        _pending -= 1
+    await _respond(send, *response, head=method == "HEAD")
@@ -0,0 +1,135 @@
+"""Content-hashed static assets.
+
+``build_assets`` copies every file in ``static/`` to
+``static/dist/<name>.<hash><ext>`` and records the mapping in
+``static/dist/manifest.json``. Templates keep calling
+``url_for('static', filename='style.css')``; the override installed by
+``init_app`` resolves it through the manifest, and files under
+``/static/dist/`` are served with a one-year immutable ``Cache-Control``,
+since any change to a file changes its name.
+
+The manifest is rebuilt at start-up when a source file is newer than it,
+or explicitly with ``flask build-assets``.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from flask import request, url_for
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_static_dir = None
+_manifest = {}
+
+
+def _dist_path(static_dir):
+    return os.path.join(static_dir, DIST_DIR)
+
+
+def _source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for name in files:
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def build_assets(static_dir):
+    """Write hashed copies and the manifest; returns the manifest dict."""
+    dist = _dist_path(static_dir)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name, path in _source_files(static_dir):
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{_hash_file(path)}{ext}"
+        dest = os.path.join(dist, hashed)
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f"{dest}.{os.getpid()}.tmp"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, dest)
+        manifest[name] = f"{DIST_DIR}/{hashed}"
+
+    # Drop hashed files no longer referenced (old versions).
+    current = {os.path.normpath(os.path.join(static_dir, v)) for v in manifest.values()}
+    for root, dirs, files in os.walk(dist):
+        for fname in files:
+            path = os.path.normpath(os.path.join(root, fname))
+            if fname != MANIFEST_NAME and path not in current and not fname.endswith(".tmp"):
+                os.remove(path)
+
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+    tmp = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    print(f"[ASSETS] Built {len(manifest)} hashed asset(s) in {dist}")
+    return manifest
+
+
+def _is_stale(static_dir):
+    manifest_path = os.path.join(_dist_path(static_dir), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return True
+    built = os.path.getmtime(manifest_path)
+    return any(os.path.getmtime(path) > built for _, path in _source_files(static_dir))
+
+
+def load_manifest(static_dir, rebuild_if_stale=True):
+    """Load (building first if needed) the manifest used by url_for and asset_path."""
+    global _static_dir, _manifest
+    _static_dir = static_dir
+    if rebuild_if_stale and _is_stale(static_dir):
+        _manifest = build_assets(static_dir)
+        return _manifest
+    try:
+        with open(os.path.join(_dist_path(static_dir), MANIFEST_NAME)) as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+
+def asset_path(name):
+    """Filesystem path of the hashed copy of static file ``name`` (or the original)."""
+    hashed = _manifest.get(name)
+    if hashed:
+        path = os.path.join(_static_dir, hashed)
+        if os.path.exists(path):
+            return path
+    static_dir = _static_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    return os.path.join(static_dir, name)
+
+
+def asset_url_for(endpoint, **values):
+    """``url_for`` that maps static filenames to their hashed copies."""
+    if endpoint == "static" and values.get("filename") in _manifest:
+        values["filename"] = _manifest[values["filename"]]
+    return url_for(endpoint, **values)
+
+
+def init_app(app):
+    app.jinja_env.globals["url_for"] = asset_url_for
+    dist_prefix = f"{app.static_url_path}/{DIST_DIR}/"
+
+    @app.after_request
+    def immutable_assets(response):
+        if request.path.startswith(dist_prefix) and response.status_code == 200:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -0,0 +1,306 @@
+"""Photo and evidence attachments for reports and issues.
+
+Uploads are chunked and resumable. A client creates an upload (name, size,
+optional SHA-256), then PUTs the bytes in chunks, each with an
+``Upload-Offset`` header. The offset reached is saved after every chunk,
+and also when a connection drops mid-chunk, so a client on a bad link asks
+for the offset and carries on from there. A chunk claims its upload (a
+conditional UPDATE on the offset) before touching the partial file, so of
+two requests sending the same chunk, possibly from different worker
+processes, one writes and the other gets the offset to resume from.
+
+A finished file is stored once per content, as
+``instance/attachments/objects/<sha256[:2]>/<sha256>``; attaching the same
+photo to several reports uses the disk once. Request bodies are copied to
+disk in blocks and downloads are sent from the file (with Range support),
+so no attachment is ever held in memory.
+
+Upload state lives in the ``attachment_uploads`` table of the local
+database; the attachment rows themselves go through the repository, next
+to their report.
+
+Environment variables:
+  ATTACHMENT_MAX_BYTES (largest file accepted, defaults to 50 MiB)
+  ATTACHMENT_CHUNK_MAX (largest chunk accepted per request, defaults to 8 MiB)
+  ATTACHMENT_UPLOAD_TTL (seconds an unfinished upload is kept, defaults to 86400)
+"""
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import dbconn
+
+MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+CHUNK_MAX = int(os.getenv("ATTACHMENT_CHUNK_MAX", str(8 * 1024 * 1024)))
+UPLOAD_TTL = int(os.getenv("ATTACHMENT_UPLOAD_TTL", "86400"))
+
+BLOCK_SIZE = 64 * 1024
+
+# Seconds since a stored file was last written before a report delete may remove it
+RELEASE_MIN_AGE = 300
+
+# Seconds a chunk's claim on its upload lasts without being renewed; the
+# writer renews it while data keeps arriving, so it only lapses when the
+# process writing the chunk died.
+CLAIM_TIMEOUT = 120
+
+# Served inline; anything else is sent as a download so it cannot run in the page.
+INLINE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+_db_path = None
+
+
+class OffsetMismatch(Exception):
+    """Raised when a chunk does not start where the upload left off."""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class ChecksumMismatch(Exception):
+    """Raised when a finished upload does not match the SHA-256 it was created with."""
+
+
+def configure(db_path):
+    global _db_path
+    _db_path = db_path
+
+
+def _connect():
+    conn = dbconn.connect(_db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def storage_dir():
+    return os.path.join(os.path.dirname(_db_path), "attachments")
+
+
+def _part_path(upload_id):
+    return os.path.join(storage_dir(), "uploads", f"{upload_id}.part")
+
+
+def object_path(sha256):
+    """Where the content with this SHA-256 is stored."""
+    return os.path.join(storage_dir(), "objects", sha256[:2], sha256)
+
+
+def create_upload(user_id, report_id, issue_id, filename, content_type, size, sha256=None):
+    """Start an upload and return its row."""
+    cleanup_expired()
+    upload_id = uuid.uuid4().hex
+    path = _part_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO attachment_uploads (id, user_id, report_id, issue_id, filename, content_type, size, "
+            "sha256, received, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+            (upload_id, user_id, report_id, issue_id, filename, content_type, size,
+             (sha256 or "").lower() or None, _now(), _now())
+        )
+        conn.commit()
+        return conn.execute("SELECT * FROM attachment_uploads WHERE id = ?", (upload_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def get_upload(upload_id):
+    conn = _connect()
+    upload = conn.execute("SELECT * FROM attachment_uploads WHERE id = ?", (upload_id,)).fetchone()
+    conn.close()
+    return upload
+
+
+def _claim(upload_id, offset):
+    """Claim the upload for a chunk starting at ``offset``; returns the claim token.
+
+    Raises OffsetMismatch if the upload is elsewhere or another chunk is
+    being written.
+    """
+    token = uuid.uuid4().hex
+    lapsed = (datetime.utcnow() - timedelta(seconds=CLAIM_TIMEOUT)).isoformat()
+    conn = _connect()
+    try:
+        claimed = conn.execute(
+            "UPDATE attachment_uploads SET writer = ?, writer_seen = ? "
+            "WHERE id = ? AND received = ? AND received < size AND (writer IS NULL OR writer_seen < ?)",
+            (token, _now(), upload_id, offset, lapsed)
+        ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if not claimed:
+        raise OffsetMismatch(_received(upload_id, offset))
+    return token
+
+
+def _received(upload_id, default):
+    upload = get_upload(upload_id)
+    return upload["received"] if upload else default
+
+
+def _renew_claim(upload_id, token):
+    conn = _connect()
+    try:
+        renewed = conn.execute(
+            "UPDATE attachment_uploads SET writer_seen = ? WHERE id = ? AND writer = ?", (_now(), upload_id, token)
+        ).rowcount
+        conn.commit()
+        return bool(renewed)
+    finally:
+        conn.close()
+
+
+def _release_claim(upload_id, token, received):
+    """Save the offset reached and give up the claim."""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE attachment_uploads SET received = ?, updated_at = ?, writer = NULL, writer_seen = NULL "
+            "WHERE id = ? AND writer = ?",
+            (received, _now(), upload_id, token)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def write_chunk(upload, offset, stream, length):
+    """Append ``length`` bytes read from ``stream`` at ``offset``; returns the new offset.
+
+    If the stream ends early (dropped connection) the bytes that did arrive
+    are kept and the error is re-raised.
+    """
+    token = _claim(upload["id"], offset)
+    length = min(length, upload["size"] - offset)
+    written = 0
+    renewed = time.monotonic()
+    try:
+        with open(_part_path(upload["id"]), "r+b") as f:
+            f.seek(offset)
+            f.truncate()
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+                if time.monotonic() - renewed > CLAIM_TIMEOUT / 4:
+                    renewed = time.monotonic()
+                    if not _renew_claim(upload["id"], token):
+                        # The claim lapsed and another chunk took over; leave the file to it.
+                        raise OffsetMismatch(_received(upload["id"], offset))
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        _release_claim(upload["id"], token, offset + written)
+    return offset + written
+
+
+def finish_upload(upload):
+    """Move a complete upload into content-addressed storage; returns its SHA-256.
+
+    The upload row and partial file are removed either way; a checksum
+    mismatch raises ChecksumMismatch.
+    """
+    part = _part_path(upload["id"])
+    digest = hashlib.sha256()
+    try:
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        if upload["sha256"] and upload["sha256"] != sha256:
+            raise ChecksumMismatch(f"Expected SHA-256 {upload['sha256']}, received {sha256}")
+        dest = object_path(sha256)
+        if os.path.exists(dest):
+            print(f"[ATTACH] {upload['filename']} is a duplicate of {sha256[:12]}; stored once")
+            os.utime(dest)  # counts as new for collect_garbage's min_age
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(part, dest)
+        return sha256
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+        conn = _connect()
+        conn.execute("DELETE FROM attachment_uploads WHERE id = ?", (upload["id"],))
+        conn.commit()
+        conn.close()
+
+
+def cleanup_expired():
+    """Drop uploads that have not received a chunk within UPLOAD_TTL."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=UPLOAD_TTL)).isoformat()
+    conn = _connect()
+    try:
+        expired = [r["id"] for r in conn.execute(
+            "SELECT id FROM attachment_uploads WHERE updated_at < ?", (cutoff,)).fetchall()]
+        for upload_id in expired:
+            try:
+                os.remove(_part_path(upload_id))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM attachment_uploads WHERE id = ?", (upload_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    return len(expired)
+
+
+def collect_garbage(referenced, min_age=None):
+    """Delete stored files whose hash is not in ``referenced``; returns bytes freed.
+
+    Files younger than ``min_age`` seconds are kept: their attachment row
+    may not be committed yet.
+    """
+    min_age = UPLOAD_TTL if min_age is None else min_age
+    now = time.time()
+    freed = 0
+    for root, dirs, files in os.walk(os.path.join(storage_dir(), "objects")):
+        for name in files:
+            path = os.path.join(root, name)
+            if name not in referenced and now - os.path.getmtime(path) > min_age:
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
+
+
+def release(hashes, referenced, min_age=RELEASE_MIN_AGE):
+    """Delete the stored files of ``hashes`` that are not in ``referenced``; returns bytes freed.
+
+    Called after reports are deleted, with their attachments' hashes. Files
+    touched within ``min_age`` seconds are left to collect_garbage: an upload
+    of the same content may be about to add a row for them.
+    """
+    now = time.time()
+    freed = 0
+    for sha256 in set(hashes) - set(referenced):
+        path = object_path(sha256)
+        try:
+            if now - os.path.getmtime(path) > min_age:
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+        except OSError:
+            continue
+    return freed
+
+
+def upload_to_dict(upload):
+    return {
+        "id": upload["id"],
+        "filename": upload["filename"],
+        "size": upload["size"],
+        "offset": upload["received"],
+    }
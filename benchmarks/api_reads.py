@@ -0,0 +1,172 @@
+"""Compare the read API on `flask serve` (threaded WSGI) and `flask serve-api` (asyncio).
+
+Usage:
+    python benchmarks/api_reads.py [--slow 500] [--clients 32] [--duration 10] [--workers 2] [--threads 8]
+
+Both servers are started as subprocesses on free ports and serve the
+current instance database (read-only requests only). The script signs in
+through `flask serve`, then for each server runs two rounds of ``--duration`` seconds:
+``--clients`` concurrent clients fetching /api/reports back to back, first
+alone and then while ``--slow`` other connections trickle a request in one
+header line per second, as clients on poor mobile links do. Reports the
+fast clients' request rate, p50/p99 latency and requests that failed or
+took longer than ``--request-timeout`` seconds.
+
+Needs uvicorn (pip install uvicorn), and ``ulimit -n`` above ``--slow``.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATH = "/api/reports?limit=20"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+async def request(port, head):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(head)
+        await writer.drain()
+        status = (await reader.readline()).split(b" ", 2)[1]
+        await reader.read()
+        return int(status)
+    finally:
+        writer.close()
+
+
+async def sign_in(port, username, password):
+    body = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        b"POST /login HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        b"Content-Type: application/x-www-form-urlencoded\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    response = await reader.read()
+    writer.close()
+    for line in response.split(b"\r\n"):
+        if line.lower().startswith(b"set-cookie: session="):
+            return line.split(b": ", 1)[1].split(b";", 1)[0].decode()
+    raise RuntimeError("sign-in failed; pass --username/--password")
+
+
+async def slow_client(port, stop):
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {PATH} HTTP/1.1\r\nHost: localhost\r\n".encode())
+        n = 0
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            writer.write(f"X-Trickle-{n}: 1\r\n".encode())
+            await writer.drain()
+            n += 1
+        writer.close()
+    except OSError:
+        pass
+
+
+async def fast_clients(port, cookie, clients, duration, request_timeout):
+    head = (
+        f"GET {PATH} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n"
+    ).encode()
+    latencies, failed = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal failed
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(request(port, head), request_timeout)
+            except (OSError, asyncio.TimeoutError, IndexError):
+                failed += 1
+                continue
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies, failed, time.perf_counter() - start
+
+
+async def measure(name, port, cookie, args):
+    for slow in (0, args.slow):
+        stop = asyncio.Event()
+        trickles = [asyncio.create_task(slow_client(port, stop)) for _ in range(slow)]
+        await asyncio.sleep(2 if slow else 0)
+        latencies, failed, elapsed = await fast_clients(port, cookie, args.clients, args.duration, args.request_timeout)
+        stop.set()
+        await asyncio.gather(*trickles)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else float("nan")
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan")
+        print(f"{name:<28} {slow:>6} {len(latencies) / elapsed:>9.1f} {p50:>9.1f} {p99:>9.1f} {failed:>7}")
+
+
+def start(cmd, port):
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/api/sites")
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slow", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--request-timeout", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="Mes@2026")
+    args = parser.parse_args()
+
+    wsgi_port, asgi_port = free_port(), free_port()
+    servers = []
+    try:
+        servers.append(start([sys.executable, "-m", "flask", "--app", "app", "serve", "--host", "127.0.0.1",
+                              "--port", str(wsgi_port), "--workers", str(args.workers),
+                              "--threads", str(args.threads)], wsgi_port))
+        servers.append(start([sys.executable, "-m", "flask", "--app", "app", "serve-api", "--host", "127.0.0.1",
+                              "--port", str(asgi_port), "--workers", str(args.workers)], asgi_port))
+        # The asyncio tier has no /login; its session cookie comes from the Flask app.
+        cookie = asyncio.run(sign_in(wsgi_port, args.username, args.password))
+        print(f"{'server':<28} {'slow':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+        asyncio.run(measure(f"flask serve ({args.workers}x{args.threads})", wsgi_port, cookie, args))
+        asyncio.run(measure(f"flask serve-api ({args.workers} worker(s))", asgi_port, cookie, args))
+    finally:
+        for proc in servers:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
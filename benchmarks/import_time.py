@@ -0,0 +1,64 @@
+"""Measure cold-start cost of `import app` with `python -X importtime`.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--top 15]
+
+Prints the median total import time, the slowest modules of the last run,
+and exits with status 1 if any module listed in HEAVY_MODULES was imported
+at start-up (they must only be loaded on first use).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that must not be imported by `import app`.
+HEAVY_MODULES = ("reportlab", "smtplib", "email.mime", "PIL")
+
+
+def import_profile():
+    """Return [(module, self_us, cumulative_us)] for one fresh `import app`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    totals = []
+    rows = []
+    for _ in range(args.runs):
+        rows = import_profile()
+        totals.append(sum(self_us for _, self_us, _ in rows))
+    print(f"import app: median {statistics.median(totals) / 1000:.1f} ms over {args.runs} runs, {len(rows)} modules")
+
+    print(f"\nslowest {args.top} modules (self time):")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:7.2f} ms  {name}")
+
+    heavy = sorted({name for name, _, _ in rows
+                    if any(name == m or name.startswith(m + ".") for m in HEAVY_MODULES)})
+    if heavy:
+        print("\nFAIL: heavy modules imported at start-up: " + ", ".join(heavy))
+        return 1
+    print("\nOK: no heavy modules imported at start-up")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
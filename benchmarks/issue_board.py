@@ -0,0 +1,106 @@
+"""Time issue board queries on a large synthetic issues table.
+
+Usage:
+    python benchmarks/issue_board.py [--issues 2000000] [--per-report 20] [--repeat 5]
+
+Fills a throw-away database with ``--issues`` issues (statuses, priorities
+and target dates spread at random, some dates in legacy DD/MM/YYYY form),
+then times the first page and a deep keyset page of each filter shape and
+prints the index SQLite chose for it.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as site_app  # noqa: E402
+import repository  # noqa: E402
+
+STATUSES = ["Open", "In Progress", "Resolved", "Resolved", "Resolved"]
+PRIORITIES = ["Low", "Medium", "High", "Critical"]
+AREAS = ["Network", "Power", "Cameras", "Biometrics", "Software"]
+
+CASES = [
+    ("unresolved", {}),
+    ("unresolved, desc", {"descending": True}),
+    ("priority=Critical", {"priority": "Critical"}),
+    ("status=Open", {"status": "Open"}),
+    ("status=Open, priority=High", {"status": "Open", "priority": "High"}),
+    ("overdue", {"overdue_before": date.today().isoformat()}),
+    ("overdue, priority=High", {"priority": "High", "overdue_before": date.today().isoformat()}),
+    ("area=Power", {"area": "Power"}),
+]
+
+
+def fill(db_path, n_issues, per_report):
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow().isoformat()
+    start = date.today() - timedelta(days=365)
+    n_reports = max(1, n_issues // per_report)
+    values = ("Bench site", "Loc", "Weekly") + (None,) * 31 + (now,)
+    conn.executemany(repository.INSERT_REPORT_SQL, (values for _ in range(n_reports)))
+
+    def issues():
+        for i in range(n_issues):
+            due = start + timedelta(days=random.randrange(730))
+            target = due.isoformat() if i % 10 else due.strftime("%d/%m/%Y")
+            if i % 50 == 0:
+                target = ""
+            row = (f"issue {i}", random.choice(AREAS), "", random.choice(STATUSES), "IT", "", "",
+                   random.choice(PRIORITIES), target, f"tech{i % 40}")
+            yield repository.issue_params(i // per_report + 1, row)
+    conn.executemany(repository.INSERT_ISSUE_SQL, issues())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def plan(repo, kwargs):
+    query, params = repo._issue_board_query(**kwargs)
+    with repo._read() as cur:
+        rows = cur.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return "; ".join(row[-1] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issues", type=int, default=2000000)
+    parser.add_argument("--per-report", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        site_app.DB_PATH = os.path.join(tmp, "issues.db")
+        site_app.init_db()
+        start = time.perf_counter()
+        fill(site_app.DB_PATH, args.issues, args.per_report)
+        print(f"Filled {args.issues} issues in {time.perf_counter() - start:.1f}s\n")
+
+        repo = repository.SQLiteRepository(site_app.DB_PATH)
+        print(f"{'filter':<28} {'page 1 ms':>10} {'page 20 ms':>11}  plan")
+        for name, kwargs in CASES:
+            timings = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                rows, key = repo.issue_board(**kwargs)
+                timings.append(time.perf_counter() - t)
+            for _ in range(19):
+                if key is None:
+                    break
+                rows, key = repo.issue_board(after=key, **kwargs)
+            deep = []
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                repo.issue_board(after=key, **kwargs)
+                deep.append(time.perf_counter() - t)
+            print(f"{name:<28} {min(timings) * 1000:>10.1f} {min(deep) * 1000:>11.1f}  {plan(repo, kwargs)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Load-test the app with a technician/admin traffic mix.
+
+Usage:
+    python benchmarks/loadtest.py [--concurrency 16] [--duration 30] [--seed 30]
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --admin-password ...
+
+By default the WSGI app is driven in-process (Flask test client, one per
+virtual user thread) against a throw-away copy of instance/site_reports.db,
+with rate limiting off. With ``--url`` the same mix is sent over HTTP to a
+running server instead (e.g. ``flask serve``), which also measures the
+server itself; that run writes to the server's real database.
+
+Each virtual user picks scenarios at random by weight (see SCENARIOS) until
+the duration is up. Reports per scenario: requests, errors, throughput and
+latency percentiles, plus error causes (``database is locked`` is counted
+separately in-process, where the exception is visible).
+"""
+import argparse
+import http.cookiejar
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Scenario -> relative weight
+SCENARIOS = {
+    "login": 10,
+    "dashboard": 30,
+    "detail": 20,
+    "new_report": 10,
+    "edit_report": 10,
+    "pdf": 12,
+    "csv_export": 3,
+    "xlsx_export": 2,
+}
+
+SITES = ["Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot"]
+STATUSES = ["Good", "Stable", "Needs Attention", "Critical"]
+PRIORITIES = ["High", "Medium", "Low"]
+
+
+class WSGIClient:
+    """Flask test client with the (status, body) interface used below."""
+
+    def __init__(self, flask_app):
+        self._client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        body = response.get_data()
+        response.close()
+        return response.status_code, body, response.headers.get("Location")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """urllib client with its own cookie jar; redirects are not followed."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self._opener.open(req, timeout=60) as response:
+                return response.status, response.read(), response.headers.get("Location")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers.get("Location")
+
+
+def report_form(n_issues=20, n_devices=50):
+    form = {
+        "site_name": random.choice(SITES), "location": "Load test", "report_type": random.choice(["Weekly", "Monthly"]),
+        "overall_status": random.choice(STATUSES), "prepared_by": "loadtest",
+        "executive_summary": "Generated by benchmarks/loadtest.py. " * 5,
+        "cameras_live": str(random.randint(0, 200)), "cameras_down": str(random.randint(0, 5)),
+    }
+    form["issue_title[]"] = [f"Issue {i}" for i in range(n_issues)]
+    form["issue_status[]"] = [random.choice(["Open", "Resolved", "Pending"]) for _ in range(n_issues)]
+    form["priority[]"] = [random.choice(PRIORITIES) for _ in range(n_issues)]
+    form["area[]"] = ["Network"] * n_issues
+    form["target_date[]"] = ["2026-12-31"] * n_issues
+    form["device_name[]"] = [f"CAM-{i:03d}" for i in range(n_devices)]
+    form["hostname[]"] = [f"cam{i}.site.local" for i in range(n_devices)]
+    form["device_password[]"] = ["secret"] * n_devices
+    form["device_status[]"] = [random.choice(["Working", "Working", "Broken"]) for _ in range(n_devices)]
+    return form
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.causes = defaultdict(int)
+
+    def record(self, scenario, seconds, error=None):
+        with self.lock:
+            self.latencies[scenario].append(seconds)
+            if error:
+                self.errors[scenario] += 1
+                self.causes[f"{scenario}: {error}"] += 1
+
+    def cause(self, message):
+        with self.lock:
+            self.causes[message] += 1
+
+
+class VirtualUser:
+    def __init__(self, make_client, args, report_ids, stats):
+        self.make_client = make_client
+        self.args = args
+        self.report_ids = report_ids
+        self.stats = stats
+        self.tech = self._login(args.tech_user, args.tech_password)
+        self.admin = self._login("admin", args.admin_password)
+
+    def _login(self, username, password):
+        client = self.make_client()
+        status, _, location = client.request("POST", "/login", {"username": username, "password": password})
+        if status != 302 or (location or "").rstrip("/").endswith("login"):
+            raise SystemExit(f"Login as {username} failed ({status}); check the credentials.")
+        return client
+
+    def _report_id(self):
+        return random.choice(self.report_ids)
+
+    def run(self, scenario):
+        return getattr(self, scenario)()
+
+    # Each scenario returns (status, body, location) of its request.
+    def login(self):
+        return self.make_client().request(
+            "POST", "/login", {"username": self.args.tech_user, "password": self.args.tech_password}
+        )
+
+    def dashboard(self):
+        params = random.choice([
+            {}, {"site": random.choice(SITES)[:3]}, {"status": random.choice(STATUSES)},
+            {"priority": random.choice(PRIORITIES)}, {"report_type": "Weekly", "site": random.choice(SITES)},
+        ])
+        return self.tech.request("GET", "/?" + urllib.parse.urlencode(params))
+
+    def detail(self):
+        return self.tech.request("GET", f"/report/{self._report_id()}")
+
+    def new_report(self):
+        result = self.tech.request("POST", "/report/new", report_form(self.args.issues, self.args.devices))
+        location = result[2] or ""
+        if result[0] == 302 and "/report/" in location:
+            self.report_ids.append(int(location.rstrip("/").rsplit("/", 1)[1]))
+        return result
+
+    def edit_report(self):
+        return self.tech.request("POST", f"/report/{self._report_id()}/edit", report_form(self.args.issues, self.args.devices))
+
+    def pdf(self):
+        return self.tech.request("GET", f"/report/{self._report_id()}/download")
+
+    def csv_export(self):
+        return self.admin.request("GET", "/download_all_csv")
+
+    def xlsx_export(self):
+        return self.admin.request("GET", "/download_all_xlsx")
+
+
+def run_user(user, deadline, stats, names, weights):
+    while time.monotonic() < deadline:
+        scenario = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            status, _, _ = user.run(scenario)
+            error = f"HTTP {status}" if status >= 400 else None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        stats.record(scenario, time.perf_counter() - start, error)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def print_report(stats, elapsed, concurrency):
+    print(f"\n{concurrency} virtual users for {elapsed:.1f}s\n")
+    print(f"{'scenario':<12} {'reqs':>6} {'errors':>7} {'err%':>6} {'req/s':>7} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = errors = 0
+    for scenario in SCENARIOS:
+        values = sorted(stats.latencies.get(scenario, []))
+        if not values:
+            continue
+        n, e = len(values), stats.errors.get(scenario, 0)
+        total += n
+        errors += e
+        print(f"{scenario:<12} {n:>6} {e:>7} {100 * e / n:>5.1f}% {n / elapsed:>7.1f} "
+              f"{percentile(values, 50) * 1000:>8.0f} {percentile(values, 90) * 1000:>8.0f} "
+              f"{percentile(values, 99) * 1000:>8.0f} {values[-1] * 1000:>8.0f}")
+    if total:
+        print(f"{'total':<12} {total:>6} {errors:>7} {100 * errors / total:>5.1f}% {total / elapsed:>7.1f}")
+    locked = sum(n for cause, n in stats.causes.items() if "database is locked" in cause)
+    print(f"\n'database is locked' errors: {locked}")
+    if stats.causes:
+        print("Error causes:")
+        for cause, n in sorted(stats.causes.items(), key=lambda item: -item[1]):
+            print(f"  {n:>6} x {cause}")
+
+
+def setup_in_process(args, tmp):
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "1" if args.rate_limits else "0")
+    import app as site_app
+    import jobs
+    import repository
+    from flask import got_request_exception
+
+    db_path = os.path.join(tmp, "site_reports.db")
+    source = os.path.join(site_app.app.instance_path, "site_reports.db")
+    if os.path.exists(source):
+        shutil.copyfile(source, db_path)
+    site_app.DB_PATH = db_path
+    jobs.configure(db_path)
+    repository.configure(db_path)
+    site_app.init_app_once()
+    return site_app.app, got_request_exception
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--seed", type=int, default=30, help="reports created before the run")
+    parser.add_argument("--issues", type=int, default=20, help="issues per saved report")
+    parser.add_argument("--devices", type=int, default=50, help="devices per saved report")
+    parser.add_argument("--url", help="base URL of a running server (default: drive the WSGI app in-process)")
+    parser.add_argument("--tech-user", default="IT")
+    parser.add_argument("--tech-password", default="Mes@2026")
+    parser.add_argument("--admin-password", default="Mes@2026")
+    parser.add_argument("--rate-limits", action="store_true", help="keep rate limiting on (in-process)")
+    args = parser.parse_args()
+
+    stats = Stats()
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            def make_client():
+                return HTTPClient(args.url)
+        else:
+            flask_app, got_request_exception = setup_in_process(args, tmp)
+
+            def on_exception(sender, exception, **extra):
+                stats.cause(f"exception: {type(exception).__name__}: {exception}")
+            got_request_exception.connect(on_exception, flask_app, weak=False)
+
+            def make_client():
+                return WSGIClient(flask_app)
+
+        report_ids = []
+        seeder = VirtualUser(make_client, args, report_ids, stats)
+        for _ in range(args.seed):
+            seeder.new_report()
+        if not report_ids:
+            raise SystemExit("Could not create seed reports.")
+        print(f"Seeded {len(report_ids)} report(s); starting {args.concurrency} virtual users")
+
+        users = [VirtualUser(make_client, args, report_ids, stats) for _ in range(args.concurrency)]
+        names, weights = list(SCENARIOS), list(SCENARIOS.values())
+        start = time.monotonic()
+        deadline = start + args.duration
+        threads = [threading.Thread(target=run_user, args=(u, deadline, stats, names, weights)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print_report(stats, time.monotonic() - start, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
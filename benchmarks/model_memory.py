@@ -0,0 +1,99 @@
+"""Compare loading report and issue lists as sqlite3.Row against the models.
+
+Usage:
+    python benchmarks/model_memory.py [--reports 20000] [--issues-per-report 5]
+
+Fills a throw-away database with reports and issues shaped like real ones
+(free-text fields unique per row, status fields from the form's choices),
+then loads every row with each row factory and prints the time and the
+traced bytes held per row.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as site_app  # noqa: E402
+import models  # noqa: E402
+import repository  # noqa: E402
+
+STATUSES = ["Operational", "Partially Operational", "Not Operational"]
+PARTS = ["Good", "Fair", "Poor"]
+ISSUE_STATUSES = ["Open", "In Progress", "Resolved"]
+PRIORITIES = ["Low", "Medium", "High", "Critical"]
+
+
+def fill(db_path, n_reports, per_report):
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow().isoformat()
+
+    def reports():
+        for i in range(n_reports):
+            report = models.Report(
+                site_name=f"Site {i % 200}", location=f"Block {i % 7}", report_type=random.choice(["Weekly", "Monthly"]),
+                period_start="2026-01-01", period_end="2026-01-07", prepared_by=f"tech{i % 40}",
+                executive_summary=f"Summary for report {i}: links checked, two cameras replaced.",
+                overall_status=random.choice(STATUSES), network_status=random.choice(PARTS),
+                power_status=random.choice(PARTS), hardware_status=random.choice(PARTS),
+                software_status=random.choice(PARTS), security_status=random.choice(PARTS),
+                cameras_live=12, cameras_down=i % 3, recommendations=f"Replace UPS battery at site {i}.",
+                created_at=now,
+            )
+            yield models.insert_params(report)
+    conn.executemany(repository.INSERT_REPORT_SQL, reports())
+
+    def issues():
+        for i in range(n_reports * per_report):
+            issue = models.Issue(
+                report_id=i // per_report + 1, issue_title=f"Issue {i}", area="Network", impact="Medium",
+                status=random.choice(ISSUE_STATUSES), owner="IT", priority=random.choice(PRIORITIES),
+                target_date="2026-03-01", target_date_iso="2026-03-01", responsible=f"tech{i % 40}",
+            )
+            yield models.insert_params(issue)
+    conn.executemany(repository.INSERT_ISSUE_SQL, issues())
+    conn.commit()
+    conn.close()
+
+
+def load(db_path, table, factory):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = factory
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = conn.execute(f"SELECT * FROM {table}").fetchall()
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    conn.close()
+    return len(rows), elapsed, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20000)
+    parser.add_argument("--issues-per-report", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(db_path)
+        site_app.init_report_tables(conn)
+        conn.close()
+        fill(db_path, args.reports, args.issues_per_report)
+
+        print(f"{'table':<8} {'rows as':<14} {'rows':>8} {'seconds':>8} {'bytes/row':>10}")
+        for table, model in (("reports", models.Report), ("issues", models.Issue)):
+            for label, factory in (("sqlite3.Row", sqlite3.Row), ("models", models.row_factory(model))):
+                n, elapsed, held = load(db_path, table, factory)
+                print(f"{table:<8} {label:<14} {n:>8} {elapsed:>8.3f} {held / n:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Time report PDF rendering as the issue and device tables grow.
+
+Usage:
+    python benchmarks/pdf_tables.py [--sizes 10,1000,10000]
+
+Each size renders a report with that many issues and that many devices.
+With chunked LongTables the per-row time should stay roughly flat.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_report import build_report_pdf  # noqa: E402
+from repository import REPORT_FIELDS  # noqa: E402
+
+
+def fake_report():
+    report = {name: f"{name} value" for name in REPORT_FIELDS}
+    report.update(site_name="Benchmark site", cameras_live=120, cameras_down=3, biometrics_live=10, biometrics_down=0)
+    return report
+
+
+def fake_issues(n):
+    return [{
+        "issue_title": f"Camera {i} offline after power cut & NVR reboot <{i}>",
+        "area": "CCTV", "impact": "Medium", "status": "Open", "priority": "High",
+        "owner": "IT support",
+    } for i in range(n)]
+
+
+def fake_devices(n):
+    return [{
+        "device_name": f"CAM-{i:05d}", "hostname": f"cam{i}.site.local", "serial_number": f"SN{i:08d}",
+        "software_version": "5.7.3", "hdd_capacity": "4TB", "username": "admin", "password": "secret",
+        "status": "Working" if i % 10 else "Broken",
+    } for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,10000")
+    args = parser.parse_args()
+
+    report = fake_report()
+    print(f"{'rows':>7} {'seconds':>9} {'ms/row':>8} {'KiB':>8}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        issues, devices = fake_issues(size), fake_devices(size)
+        start = time.perf_counter()
+        pdf = build_report_pdf(report, issues, devices)
+        elapsed = time.perf_counter() - start
+        rows = 2 * size
+        print(f"{rows:>7} {elapsed:>9.2f} {elapsed * 1000 / rows:>8.3f} {len(pdf.getbuffer()) / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compare request throughput of the dev server and `flask serve`.
+
+Usage:
+    python benchmarks/serve_throughput.py [--requests 2000] [--clients 32] [--workers 4]
+
+Both servers are started as subprocesses on free ports and hit with the
+same number of concurrent GET requests to /login (no DB writes).
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def hammer(url, total, clients):
+    def one(_):
+        with urllib.request.urlopen(url, timeout=30) as resp:
+            resp.read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def run(name, cmd, port, total, clients):
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}/login"
+        wait_until_up(url)
+        rps = hammer(url, total, clients)
+        print(f"{name:<28} {rps:8.1f} req/s")
+        return rps
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    port = free_port()
+    dev = run("dev server (threaded)",
+              [sys.executable, "-c", f"from app import app; app.run(port={port}, threaded=True)"],
+              port, args.requests, args.clients)
+    port = free_port()
+    prefork = run(f"flask serve ({args.workers}x{args.threads})",
+                  [sys.executable, "-m", "flask", "--app", "app", "serve", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(args.workers), "--threads", str(args.threads)],
+                  port, args.requests, args.clients)
+    print(f"speed-up: {prefork / dev:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark report saves from concurrent submitters: direct vs writer queue.
+
+Usage:
+    python benchmarks/write_throughput.py [--submitters 50] [--reports 20] [--issues 20] [--devices 50]
+
+Each submitter saves ``--reports`` reports with the given number of issues
+and devices. "direct" opens a connection per save like the old routes did;
+"queue" goes through writer.run_write (group commit). Runs against a
+throw-away database in a temp directory.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as site_app  # noqa: E402
+import repository  # noqa: E402
+from writer import run_write  # noqa: E402
+
+
+def report_unit(n_issues, n_devices):
+    values = ("Bench site", "Loc", "Weekly") + (None,) * 31 + (datetime.utcnow().isoformat(),)
+    issues = [(f"issue {i}", "Network", "Low", "Open", "IT", "", "", "High", "2026-01-01", "IT") for i in range(n_issues)]
+    devices = [(f"cam {i}", "host", "sn", "1.0", "1TB", "u", "p", "Working") for i in range(n_devices)]
+
+    def _save(cur):
+        cur.execute(repository.INSERT_REPORT_SQL, values)
+        report_id = cur.lastrowid
+        cur.executemany(repository.INSERT_ISSUE_SQL, [repository.issue_params(report_id, row) for row in issues])
+        cur.executemany(repository.INSERT_DEVICE_SQL, [(report_id,) + row for row in devices])
+        return report_id
+    return _save
+
+
+def save_direct(db_path, unit):
+    conn = sqlite3.connect(db_path)
+    try:
+        unit(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def save_queued(db_path, unit):
+    run_write(db_path, unit)
+
+
+def run(name, save, db_path, args):
+    errors = {}
+    lock = threading.Lock()
+
+    def submitter():
+        for _ in range(args.reports):
+            try:
+                save(db_path, report_unit(args.issues, args.devices))
+            except Exception as e:
+                with lock:
+                    key = f"{type(e).__name__}: {e}"
+                    errors[key] = errors.get(key, 0) + 1
+
+    threads = [threading.Thread(target=submitter) for _ in range(args.submitters)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = args.submitters * args.reports
+    failed = sum(errors.values())
+    print(f"{name:<8} {(total - failed) / elapsed:8.1f} saves/s  {failed} failed of {total}")
+    for message, count in errors.items():
+        print(f"         {count} x {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--submitters", type=int, default=50)
+    parser.add_argument("--reports", type=int, default=20)
+    parser.add_argument("--issues", type=int, default=20)
+    parser.add_argument("--devices", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, save in (("direct", save_direct), ("queue", save_queued)):
+            site_app.DB_PATH = os.path.join(tmp, f"{name}.db")
+            site_app.init_db()
+            run(name, save, site_app.DB_PATH, args)
+
+
+if __name__ == "__main__":
+    main()
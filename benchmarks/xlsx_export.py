@@ -0,0 +1,47 @@
+"""Check that the streaming XLSX writer keeps memory flat as rows grow.
+
+Usage:
+    python benchmarks/xlsx_export.py [--rows 10000,100000,1200000]
+
+Synthetic rows shaped like the Devices sheet are streamed through
+xlsx.iter_xlsx and discarded; prints time, output size and peak traced
+memory. 1.2M rows also exercises the continuation sheet.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xlsx import iter_xlsx  # noqa: E402
+
+HEADER = ["site_name", "report_type", "device_name", "hostname", "serial_number", "software_version",
+          "hdd_capacity", "username", "password", "status"]
+
+
+def rows(n):
+    for i in range(n):
+        yield ["Site %d" % (i % 50), "Weekly", f"CAM-{i:07d}", f"cam{i}.site.local", f"SN{i:010d}",
+               "5.7.3", 4000, "admin", "[HIDDEN]", "Working"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,100000,1200000")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'seconds':>8} {'MiB out':>8} {'peak KiB':>9}")
+    for n in [int(r) for r in args.rows.split(",")]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in iter_xlsx([("Devices", HEADER, rows(n))]))
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{n:>9} {elapsed:>8.1f} {size / 2**20:>8.1f} {peak / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
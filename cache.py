@@ -0,0 +1,74 @@
+"""Bounded in-process cache for read query results.
+
+Entries are keyed by (query name, parameters, role) and tagged with the
+database write generation they were computed at. Every write path bumps
+the counter in the ``write_generation`` table inside its own transaction
+(see repository.py), so when any worker process writes, every other
+worker sees a new generation on its next lookup and drops its entries --
+no cross-process messaging needed.
+
+Cached values are shared between threads and must be treated as read-only.
+
+Environment variables:
+  QUERY_CACHE_SIZE (entries kept per process, defaults to 256; 0 disables caching)
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+
+
+class ResultCache:
+    """LRU of query results valid for a single write generation."""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, name, params, role, generation, compute):
+        """Return the cached result for the key, calling ``compute()`` on a miss."""
+        if self.max_entries <= 0:
+            return compute()
+        key = (name, params, role)
+        with self._lock:
+            if generation != self._generation:
+                if self._entries:
+                    metrics.incr("cache.invalidations")
+                self._entries.clear()
+                self._generation = generation
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.incr("cache.hits")
+                return self._entries[key]
+
+        metrics.incr("cache.misses")
+        value = compute()
+        with self._lock:
+            # A write may have landed while computing; only keep current results.
+            if generation == self._generation:
+                self._entries[key] = value
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+
+query_cache = ResultCache()
+
+
+def _reset_after_fork():
+    query_cache._lock = threading.Lock()
+    query_cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,150 @@
+"""Gzip response compression as WSGI middleware.
+
+The middleware negotiates ``Accept-Encoding`` and compresses text-like
+responses chunk by chunk, so streamed and generator responses are never
+buffered as a whole. Bodies that are already compressed (PDF, PNG, zip)
+are passed through untouched. A compressed response's ETag is made weak,
+since its bytes differ from the identity encoding's.
+"""
+import zlib
+
+import metrics
+
+# Content types worth compressing. Anything else (PDF, images, archives)
+# is either already compressed or not worth the CPU.
+COMPRESSIBLE_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def accepts_gzip(accept_encoding):
+    """Return True if an Accept-Encoding header allows gzip.
+
+    An explicit ``gzip`` entry wins over ``*``, so ``*, gzip;q=0`` refuses it.
+    """
+    qvalues = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if token not in ("gzip", "*"):
+            continue
+        qvalue = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[token] = qvalue
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
+class GzipMiddleware:
+    """Compress eligible responses of the wrapped WSGI application."""
+
+    def __init__(self, wsgi_app, min_size=500, level=6):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "HEAD" or not accepts_gzip(environ.get("HTTP_ACCEPT_ENCODING")):
+            return self.wsgi_app(environ, start_response)
+
+        state = {"compress": False}
+
+        def _start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                state["compress"] = True
+                vary = [v for k, v in headers if k.lower() == "vary"]
+                headers = [(k, _weak_etag(v) if k.lower() == "etag" else v)
+                           for k, v in headers if k.lower() not in ("content-length", "vary")]
+                headers.append(("Content-Encoding", "gzip"))
+                headers.append(("Vary", ", ".join(vary + ["Accept-Encoding"])))
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, _start_response)
+        if not state["compress"]:
+            return body
+        return _GzipBody(body, self.level)
+
+    def _should_compress(self, status, headers):
+        # 206 bodies are byte ranges of the identity encoding; gzipping them
+        # would make the Content-Range offsets wrong.
+        if not status.startswith("2") or status.startswith(("204", "206")):
+            return False
+        content_type = ""
+        content_length = None
+        for key, value in headers:
+            lower = key.lower()
+            if lower in ("content-encoding", "content-range"):
+                return False
+            if lower == "content-type":
+                content_type = value.split(";", 1)[0].strip().lower()
+            elif lower == "content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+        if content_type not in COMPRESSIBLE_TYPES:
+            return False
+        # Streamed responses have no length; they are always worth compressing.
+        if content_length is not None and content_length < self.min_size:
+            return False
+        return True
+
+
+
+def _weak_etag(etag):
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class _GzipBody:
+    """Response body compressing the wrapped body chunk by chunk.
+
+    A class rather than a generator: a generator closed before its first
+    chunk never runs its ``finally``, so the wrapped body would not be closed.
+    """
+
+    def __init__(self, body, level):
+        self.body = body
+        self.level = level
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.closed = False
+
+    def __iter__(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in self.body:
+            if not chunk:
+                continue
+            self.bytes_in += len(chunk)
+            # A sync flush per chunk keeps streamed pages progressive.
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.bytes_out += len(data)
+            yield data
+        data = compressor.flush()
+        self.bytes_out += len(data)
+        yield data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            metrics.incr("compression.responses")
+            metrics.incr("compression.bytes_in", self.bytes_in)
+            metrics.incr("compression.bytes_out", self.bytes_out)
+            metrics.incr("compression.bytes_saved", self.bytes_in - self.bytes_out)
@@ -0,0 +1,32 @@
+"""SQLite connections with the settings every connection needs.
+
+SQLite leaves foreign-key enforcement off unless each connection turns it
+on, so without it the schema's ``ON DELETE CASCADE`` and ``SET NULL``
+clauses do nothing and deleting a report leaves its issues, devices and
+attachments behind. Every connection to a report database is opened with
+``connect`` for that reason.
+"""
+import sqlite3
+
+
+def connect(database, **kwargs):
+    """``sqlite3.connect`` with foreign keys enforced."""
+    conn = sqlite3.connect(database, **kwargs)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def prepare(conn):
+    """Apply the persistent settings of a report database; call before creating tables.
+
+    WAL lets readers and the writer run side by side: the dashboard streams rows
+    over a read connection held for the whole response, which in rollback-journal
+    mode would lock writers out until the slowest client finished.
+
+    ``auto_vacuum`` only takes effect before the first table is created, so
+    only new databases get it here; older ones are converted by
+    ``flask db-maintain --convert`` (see maintenance.py).
+    """
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        conn.execute("PRAGMA journal_mode = WAL")
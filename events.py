@@ -0,0 +1,256 @@
+"""Live dashboard updates over server-sent events.
+
+Every report create, edit and delete adds a row to ``dashboard_events`` in
+the same transaction as the write (see repository.py), carrying the
+report's dashboard columns. Each worker process runs one poller thread,
+started by its first stream, that reads new rows every
+``EVENTS_POLL_INTERVAL`` seconds into a ring buffer shared by all of the
+process's streams. A stream only keeps its position in that buffer, so an
+open dashboard costs a parked thread and a few bytes, however busy the
+site is.
+
+Event ids are cursors, ``<source>:<row id>`` per database (one source per
+region shard), so a browser that reconnects with ``Last-Event-ID`` gets
+whatever it missed from any worker. A browser that fell further behind
+than the buffer (or the table's retention) is told to reload instead.
+
+Environment variables:
+  EVENTS_MAX_STREAMS (open streams per worker process, defaults to 100)
+  EVENTS_HEARTBEAT (seconds of silence before a keep-alive comment, defaults to 15)
+  EVENTS_POLL_INTERVAL (seconds between polls for new events, defaults to 1)
+  EVENTS_BUFFER (events kept in memory per process, defaults to 1000)
+  EVENTS_STREAM_MAX_AGE (seconds before a stream is closed and the browser reconnects, defaults to 1800)
+  EVENTS_RETENTION (seconds events are kept in the database, defaults to 3600)
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import metrics
+
+MAX_STREAMS = int(os.getenv("EVENTS_MAX_STREAMS", "100"))
+HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER", "1000"))
+STREAM_MAX_AGE = float(os.getenv("EVENTS_STREAM_MAX_AGE", "1800"))
+RETENTION = int(os.getenv("EVENTS_RETENTION", "3600"))
+
+# Browsers wait this long before reconnecting a dropped stream
+RECONNECT_MS = 3000
+PRUNE_EVERY = 300
+
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+_buffer = deque()
+_seq = 0
+_cursors = {}
+_floors = {}
+_streams = 0
+_poller = None
+_closing = threading.Event()
+
+
+class TooManyStreams(Exception):
+    """Raised when this process already serves EVENTS_MAX_STREAMS streams."""
+
+
+def _reset_after_fork():
+    global _lock, _changed, _seq, _streams, _poller, _closing
+    _lock = threading.Lock()
+    _changed = threading.Condition(_lock)
+    _buffer.clear()
+    _seq = 0
+    _cursors.clear()
+    _floors.clear()
+    _streams = 0
+    _poller = None
+    _closing = threading.Event()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def format_cursor(cursors):
+    return ",".join(f"{source}:{event_id}" for source, event_id in sorted(cursors.items()))
+
+
+def parse_cursor(text):
+    cursors = {}
+    for part in (text or "").split(","):
+        source, _, event_id = part.strip().rpartition(":")
+        if source and event_id.isdigit():
+            cursors[source] = int(event_id)
+    return cursors
+
+
+def current_cursor(repo):
+    """Cursor just past the newest event of every source, for a freshly rendered page."""
+    return format_cursor({name: source.last_dashboard_event_id() for name, source in repo.event_sources().items()})
+
+
+# ----------------------------
+# Poller
+# ----------------------------
+def _append(source, rows):
+    # Caller holds _lock.
+    global _seq
+    for event_id, payload in rows:
+        if len(_buffer) >= BUFFER_SIZE:
+            _, old_source, old_id, _ = _buffer.popleft()
+            _floors[old_source] = old_id
+        _seq += 1
+        _buffer.append((_seq, source, event_id, payload))
+        _cursors[source] = event_id
+
+
+def _poll_loop(sources):
+    last_prune = 0
+    while not _closing.wait(POLL_INTERVAL):
+        try:
+            for name, source in sources.items():
+                while True:
+                    rows = source.dashboard_events(_cursors[name])
+                    if not rows:
+                        break
+                    with _changed:
+                        _append(name, rows)
+                        _changed.notify_all()
+            if time.monotonic() - last_prune > PRUNE_EVERY:
+                last_prune = time.monotonic()
+                cutoff = (datetime.utcnow() - timedelta(seconds=RETENTION)).isoformat()
+                for source in sources.values():
+                    source.prune_dashboard_events(cutoff)
+        except Exception as e:
+            print(f"[EVENTS] Poll failed: {type(e).__name__}: {e}")
+
+
+def _ensure_poller(repo):
+    """Start this process's poller, pre-filling the buffer with recent events."""
+    global _poller
+    if _poller is not None:
+        return
+    sources = repo.event_sources()
+    recent = {name: source.latest_dashboard_events(BUFFER_SIZE) for name, source in sources.items()}
+    with _lock:
+        if _poller is not None:
+            return
+        for name, rows in recent.items():
+            # Anything at or below the floor is no longer available to replay.
+            _floors[name] = rows[0][0] - 1 if rows else 0
+            _cursors[name] = _floors[name]
+            _append(name, rows)
+        _poller = threading.Thread(target=_poll_loop, args=(sources,), name="dashboard-events", daemon=True)
+        _poller.start()
+
+
+def close_streams():
+    """End every open stream (the browsers reconnect elsewhere) and stop the poller."""
+    _closing.set()
+    with _changed:
+        _changed.notify_all()
+
+
+# ----------------------------
+# Streams
+# ----------------------------
+def _message(event_id, data, event=None):
+    lines = [f"id: {event_id}"]
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(repo, cursor_text):
+    """Open a stream resuming after ``cursor_text``; returns the response body (SSE text).
+
+    Raises TooManyStreams when this process is at EVENTS_MAX_STREAMS.
+    """
+    global _streams
+    _ensure_poller(repo)
+    with _lock:
+        if _streams >= MAX_STREAMS:
+            metrics.incr("events.rejected")
+            raise TooManyStreams("Too many live dashboards on this worker; retrying shortly.")
+        _streams += 1
+    metrics.incr("events.streams")
+    return _Stream(parse_cursor(cursor_text))
+
+
+class _Stream:
+    """Response body holding one stream slot until it is exhausted or closed.
+
+    A class rather than a bare generator: a generator closed before its
+    first chunk never runs its ``finally``, which would leak the slot.
+    """
+
+    def __init__(self, cursors):
+        self.released = False
+        self._events = _run(cursors)
+
+    def __iter__(self):
+        try:
+            yield from self._events
+        finally:
+            self._release()
+
+    def close(self):
+        self._events.close()
+        self._release()
+
+    def _release(self):
+        global _streams
+        with _lock:
+            if not self.released:
+                self.released = True
+                _streams -= 1
+
+
+def _run(cursors):
+    deadline = time.monotonic() + STREAM_MAX_AGE
+    yield f"retry: {RECONNECT_MS}\n\n"
+    with _lock:
+        missed = [name for name, event_id in cursors.items() if event_id < _floors.get(name, 0)]
+        for name, event_id in _cursors.items():
+            cursors.setdefault(name, event_id)
+        # Replay what the browser has not seen from the buffer, then follow it live.
+        position = _seq - len(_buffer)
+    if missed:
+        metrics.incr("events.resets")
+        yield _message(format_cursor(cursors), "{}", "reset")
+        return
+
+    while not _closing.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        with _changed:
+            if _seq == position:
+                _changed.wait(min(HEARTBEAT, remaining))
+            if _buffer and _buffer[0][0] > position + 1:
+                fell_behind = True
+                pending = []
+            else:
+                fell_behind = False
+                pending = []
+                for entry in reversed(_buffer):
+                    if entry[0] <= position:
+                        break
+                    pending.append(entry)
+                position = _seq
+        if fell_behind:
+            metrics.incr("events.resets")
+            yield _message(format_cursor(cursors), "{}", "reset")
+            return
+        if not pending:
+            if _seq == position:
+                yield ": ping\n\n"
+            continue
+        for _, name, event_id, payload in reversed(pending):
+            if event_id <= cursors.get(name, 0):
+                continue
+            cursors[name] = event_id
+            yield _message(format_cursor(cursors), payload, "report")
@@ -0,0 +1,245 @@
+"""Export subsystem: point-in-time snapshots, CSV and XLSX rendering.
+
+Long exports read from a snapshot copy of ``site_reports.db`` instead of
+the live database, so technicians saving reports never wait behind a
+long read transaction. Snapshots are taken with the SQLite online backup
+API in small page steps with a pause between steps, reused by every
+export within ``EXPORT_SNAPSHOT_MAX_AGE`` seconds and deleted once stale.
+
+Environment variables:
+  EXPORT_SNAPSHOT_MAX_AGE (seconds a snapshot is reused, defaults to 60)
+  EXPORT_BACKUP_PAGES (pages copied per backup step, defaults to 256)
+  EXPORT_BACKUP_SLEEP (seconds to pause between steps, defaults to 0.01)
+"""
+import csv
+import glob
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+import dbconn
+
+SNAPSHOT_MAX_AGE = int(os.getenv("EXPORT_SNAPSHOT_MAX_AGE", "60"))
+BACKUP_PAGES = int(os.getenv("EXPORT_BACKUP_PAGES", "256"))
+BACKUP_SLEEP = float(os.getenv("EXPORT_BACKUP_SLEEP", "0.01"))
+
+# Heavy free-text columns left out of spreadsheet exports
+REPORT_EXPORT_EXCLUDE = {
+    'executive_summary',
+    'network_status',
+    'power_status',
+    'hardware_status',
+    'biomedical_status',
+    'recommendations',
+    'risks_constraints',
+    'conclusion',
+    # Default: omit 'id' and 'created_at' as well
+    'id',
+    'created_at',
+}
+
+# Fields that contain sensitive credentials and are exported as [HIDDEN]
+SENSITIVE_REPORT_FIELDS = {'wifi_password', 'router_password'}
+SENSITIVE_DEVICE_FIELDS = {'password'}
+
+# Report columns repeated on the Issues and Devices sheets to identify the report
+XLSX_REPORT_KEY = ['site_name', 'report_type', 'period_start', 'period_end']
+
+# One lock per source database, so shards are snapshotted in parallel
+_snapshot_locks = {}
+_snapshot_locks_guard = threading.Lock()
+
+
+def _reset_snapshot_lock():
+    global _snapshot_locks, _snapshot_locks_guard
+    _snapshot_locks = {}
+    _snapshot_locks_guard = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_snapshot_lock)
+
+
+def _snapshot_lock(db_path):
+    with _snapshot_locks_guard:
+        return _snapshot_locks.setdefault(os.path.abspath(db_path), threading.Lock())
+
+
+def backup_database(src_path, dest_path, pages=None, sleep=None):
+    """Copy ``src_path`` to ``dest_path`` with the online backup API.
+
+    The copy runs in steps of ``pages`` pages; the source is only read-locked
+    during a step, and the pause between steps lets writers in.
+    """
+    pages = BACKUP_PAGES if pages is None else pages
+    sleep = BACKUP_SLEEP if sleep is None else sleep
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+
+    def _pause(status, remaining, total):
+        if remaining:
+            time.sleep(sleep)
+
+    src = dbconn.connect(src_path, timeout=30)
+    dst = dbconn.connect(tmp_path)
+    try:
+        src.backup(dst, pages=pages, progress=_pause)
+        # The copy inherits WAL mode; a snapshot is read-only and should stay one file.
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+    # Readers only ever see a complete file.
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def _snapshot_dir(db_path):
+    path = os.path.join(os.path.dirname(db_path), "snapshots")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _snapshots(db_path):
+    """Existing snapshot files, newest first."""
+    files = glob.glob(os.path.join(_snapshot_dir(db_path), "snapshot-*.db"))
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+
+def cleanup_snapshots(db_path, max_age=None):
+    """Delete snapshots that are too old to be handed out again."""
+    max_age = SNAPSHOT_MAX_AGE if max_age is None else max_age
+    now = time.time()
+    removed = 0
+    # Keep the newest one regardless; exports may still be reading older
+    # files for a while, so only remove ones well past the reuse window.
+    for path in _snapshots(db_path)[1:]:
+        if now - os.path.getmtime(path) > 2 * max_age:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # still open on Windows; try again next time
+    return removed
+
+
+def get_snapshot(db_path, max_age=None):
+    """Return the path of a snapshot no older than ``max_age`` seconds."""
+    max_age = SNAPSHOT_MAX_AGE if max_age is None else max_age
+    with _snapshot_lock(db_path):
+        existing = _snapshots(db_path)
+        if existing and time.time() - os.path.getmtime(existing[0]) <= max_age:
+            return existing[0]
+        started = time.time()
+        path = os.path.join(_snapshot_dir(db_path), f"snapshot-{int(started * 1000)}.db")
+        backup_database(db_path, path)
+        print(f"[EXPORT] Snapshot {os.path.basename(path)} taken in {time.time() - started:.2f}s")
+        cleanup_snapshots(db_path, max_age)
+        return path
+
+
+@contextmanager
+def open_snapshot(db_path, max_age=None):
+    """Yield a read-only connection to a fresh-enough snapshot of ``db_path``."""
+    path = get_snapshot(db_path, max_age)
+    conn = dbconn.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def report_export_columns(conn):
+    """Report columns included in exports, in table order."""
+    all_cols = [d[0] for d in conn.execute("SELECT * FROM reports LIMIT 0").description]
+    return [c for c in all_cols if c not in REPORT_EXPORT_EXCLUDE]
+
+
+def mask_value(column, value, sensitive=SENSITIVE_REPORT_FIELDS):
+    if value is None:
+        return ""
+    if column in sensitive and value:
+        return '[HIDDEN]'
+    return value
+
+
+def iter_reports_csv(conn, batch_size=500, progress=None):
+    """Yield the all-reports CSV export as encoded chunks of ``batch_size`` rows.
+
+    ``progress``, if given, is called with the number of rows written so far.
+    """
+    cols = report_export_columns(conn)
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(cols)
+
+    cur = conn.execute(f"SELECT {', '.join(cols)} FROM reports ORDER BY id")
+    done = 0
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            writer.writerow([mask_value(c, row[c]) for c in cols])
+        done += len(rows)
+        if progress:
+            progress(done)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+
+def _table_columns(conn, table, exclude=()):
+    return [d[0] for d in conn.execute(f"SELECT * FROM {table} LIMIT 0").description if d[0] not in exclude]
+
+
+def _iter_masked(conn, sql, cols, sensitive, batch_size, counted):
+    cur = conn.execute(sql)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield [mask_value(c, row[i], sensitive) for i, c in enumerate(cols)]
+        counted(len(rows))
+
+
+def iter_reports_xlsx(conn, batch_size=500, progress=None):
+    """Yield the all-reports workbook (Reports, Issues and Devices sheets) as chunks.
+
+    Uses the same column exclusions and masking as the CSV export; issue and
+    device rows carry their report's XLSX_REPORT_KEY columns.
+    ``progress``, if given, is called with the number of rows written so far.
+    """
+    from xlsx import iter_xlsx
+
+    done = [0]
+
+    def counted(n):
+        done[0] += n
+        if progress:
+            progress(done[0])
+
+    def sheets():
+        cols = report_export_columns(conn)
+        yield "Reports", cols, _iter_masked(
+            conn, f"SELECT {', '.join(cols)} FROM reports ORDER BY id",
+            cols, SENSITIVE_REPORT_FIELDS, batch_size, counted
+        )
+        for title, table, alias, sensitive in (("Issues", "issues", "i", set()),
+                                               ("Devices", "devices", "d", SENSITIVE_DEVICE_FIELDS)):
+            child_cols = _table_columns(conn, table, exclude={'id', 'report_id'})
+            select = [f"r.{c}" for c in XLSX_REPORT_KEY] + [f"{alias}.{c}" for c in child_cols]
+            yield title, XLSX_REPORT_KEY + child_cols, _iter_masked(
+                conn,
+                f"SELECT {', '.join(select)} FROM {table} {alias} JOIN reports r ON r.id = {alias}.report_id "
+                f"ORDER BY r.id, {alias}.id",
+                XLSX_REPORT_KEY + child_cols, sensitive, batch_size, counted
+            )
+
+    yield from iter_xlsx(sheets(), flush_rows=batch_size)
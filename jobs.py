@@ -0,0 +1,382 @@
+"""Background jobs for long-running exports.
+
+Jobs are rows in the ``jobs`` table (created by ``init_db``) and run on a
+per-process thread pool. A job is claimed with a conditional UPDATE, so
+when several worker processes pick up the same queued job only one runs
+it. Result files are written to ``instance/jobs/`` and removed, together
+with their rows, ``JOB_RESULT_TTL`` seconds after the job finished.
+
+A process running jobs stamps their ``heartbeat_at`` every
+``JOB_HEARTBEAT`` seconds. Running jobs whose heartbeat is older than
+``JOB_STALE_AFTER`` belonged to a process that died (a crash, or a restart
+of the whole server); every process with a job pool checks for them on
+the same beat and re-queues them. ``flask serve`` does not wait that long
+for its own workers: when the parent reaps one, ``recover_worker``
+re-queues that worker's jobs before a replacement is started.
+
+Environment variables:
+  JOB_WORKERS (threads per process running jobs, defaults to 2)
+  JOB_MAX_PER_USER (queued + running jobs allowed per user, defaults to 2)
+  JOB_RESULT_TTL (seconds a finished job and its file are kept, defaults to 3600)
+  JOB_HEARTBEAT (seconds between heartbeats of running jobs, defaults to 10)
+  JOB_STALE_AFTER (seconds without a heartbeat before a running job is re-queued, defaults to 60)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import dbconn
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "2"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+
+_db_path = None
+_executor = None
+_executor_lock = threading.Lock()
+_heartbeat = None
+_running = set()
+_running_lock = threading.Lock()
+_runners = {}
+
+
+class JobLimitExceeded(Exception):
+    """Raised when a user already has JOB_MAX_PER_USER jobs in flight."""
+
+
+def _reset_after_fork():
+    # Pool threads do not survive fork; each worker starts its own pool.
+    global _executor, _executor_lock, _heartbeat, _running, _running_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _heartbeat = None
+    _running = set()
+    _running_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure(db_path):
+    global _db_path
+    _db_path = db_path
+
+
+def runner(kind):
+    """Register the function that executes jobs of ``kind``.
+
+    The function is called as ``fn(params, dest_path, progress)`` and returns
+    ``(download_name, mimetype)``; ``progress`` takes a float in [0, 1].
+    """
+    def decorator(fn):
+        _runners[kind] = fn
+        return fn
+    return decorator
+
+
+def _connect():
+    conn = dbconn.connect(_db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def results_dir():
+    path = os.path.join(os.path.dirname(_db_path), "jobs")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _get_executor():
+    global _executor, _heartbeat
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+                if _heartbeat is None:
+                    _heartbeat = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+                    _heartbeat.start()
+                # Pick up jobs queued before this process started (or recovered
+                # after a restart); claiming makes duplicates harmless.
+                conn = _connect()
+                queued = [r["id"] for r in conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()]
+                conn.close()
+                for job_id in queued:
+                    _executor.submit(_execute, job_id)
+    return _executor
+
+
+def ensure_worker():
+    """Start this process's job pool if it is not running yet."""
+    _get_executor()
+
+
+def shutdown(wait=True):
+    """Stop the pool; unstarted jobs stay queued for the next process."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def submit(user_id, kind, params=None):
+    """Queue a job and return its id."""
+    if kind not in _runners:
+        raise ValueError(f"Unknown job kind: {kind}")
+    cleanup_expired()
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        in_flight = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')",
+            (user_id,)
+        ).fetchone()[0]
+        if in_flight >= JOB_MAX_PER_USER:
+            conn.rollback()
+            raise JobLimitExceeded(f"You already have {in_flight} export(s) in progress.")
+        conn.execute(
+            "INSERT INTO jobs (id, user_id, kind, params, status, progress, created_at) VALUES (?, ?, ?, ?, 'queued', 0, ?)",
+            (job_id, user_id, kind, json.dumps(params or {}), _now())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    _get_executor().submit(_execute, job_id)
+    return job_id
+
+
+def get(job_id):
+    conn = _connect()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return job
+
+
+def _set_progress(job_id, value):
+    conn = _connect()
+    conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (round(value, 3), job_id))
+    conn.commit()
+    conn.close()
+
+
+def _execute(job_id):
+    conn = _connect()
+    now = _now()
+    claimed = conn.execute(
+        "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, worker_pid = ? "
+        "WHERE id = ? AND status = 'queued'",
+        (now, now, os.getpid(), job_id)
+    ).rowcount
+    conn.commit()
+    if not claimed:
+        conn.close()
+        return
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    with _running_lock:
+        _running.add(job_id)
+    try:
+        _run(job)
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def _run(job):
+    job_id = job["id"]
+    dest_path = os.path.join(results_dir(), job_id)
+    last_update = [0.0]
+
+    def progress(value):
+        # Progress is polled by clients; one write per half second is plenty.
+        now = time.monotonic()
+        if now - last_update[0] >= 0.5:
+            last_update[0] = now
+            _set_progress(job_id, value)
+
+    started = time.monotonic()
+    try:
+        name, mimetype = _runners[job["kind"]](json.loads(job["params"] or "{}"), dest_path, progress)
+        status, message = "done", None
+    except Exception as e:
+        print(f"[JOBS] Job {job_id} ({job['kind']}) failed: {type(e).__name__}: {e}")
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        name = mimetype = None
+        status, message = "failed", str(e)
+
+    conn = _connect()
+    conn.execute(
+        "UPDATE jobs SET status = ?, progress = ?, message = ?, result_path = ?, result_name = ?, result_mimetype = ?, finished_at = ? WHERE id = ?",
+        (status, 1 if status == "done" else job["progress"], message,
+         dest_path if status == "done" else None, name, mimetype, _now(), job_id)
+    )
+    conn.commit()
+    conn.close()
+    print(f"[JOBS] Job {job_id} ({job['kind']}) {status} in {time.monotonic() - started:.2f}s")
+
+
+def _beat():
+    """Stamp the heartbeat of the jobs this process is running."""
+    with _running_lock:
+        running = list(_running)
+    if not running:
+        return
+    conn = _connect()
+    try:
+        conn.execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({','.join('?' * len(running))})",
+            [_now()] + running
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        try:
+            _beat()
+            recovered = recover_interrupted()
+        except sqlite3.Error as e:
+            print(f"[JOBS] Heartbeat failed: {e}")
+            continue
+        executor = _executor
+        if executor is not None:
+            for job_id in recovered:
+                executor.submit(_execute, job_id)
+
+
+def _requeue(condition, params):
+    """Put running jobs matching ``condition`` back in the queue; returns their ids."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        ids = [r["id"] for r in conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'running' AND {condition}", params).fetchall()]
+        for job_id in ids:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL, worker_pid = NULL, "
+                "progress = 0 WHERE id = ?",
+                (job_id,)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    if ids:
+        print(f"[JOBS] Re-queued {len(ids)} interrupted job(s)")
+    return ids
+
+
+def recover_interrupted(stale_after=None):
+    """Re-queue running jobs without a heartbeat in ``stale_after`` seconds; returns their ids.
+
+    Runs at start-up and on every heartbeat of a process with a job pool, so
+    jobs of a process that died are picked up again within about
+    JOB_STALE_AFTER + JOB_HEARTBEAT seconds, whichever process notices.
+    """
+    stale_after = JOB_STALE_AFTER if stale_after is None else stale_after
+    cutoff = (datetime.utcnow() - timedelta(seconds=stale_after)).isoformat()
+    return _requeue("COALESCE(heartbeat_at, started_at, '') < ?", (cutoff,))
+
+
+def recover_worker(pid):
+    """Re-queue the running jobs of worker ``pid``, which the caller has just reaped."""
+    return _requeue("worker_pid = ?", (pid,))
+
+
+def cleanup_expired():
+    """Delete finished jobs older than JOB_RESULT_TTL and their result files."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=JOB_RESULT_TTL)).isoformat()
+    conn = _connect()
+    expired = conn.execute(
+        "SELECT id, result_path FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+        (cutoff,)
+    ).fetchall()
+    for job in expired:
+        if job["result_path"] and os.path.exists(job["result_path"]):
+            try:
+                os.remove(job["result_path"])
+            except OSError:
+                continue  # still being downloaded on Windows; retry later
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+    conn.commit()
+    conn.close()
+    return len(expired)
+
+
+def to_dict(job):
+    """Public status fields of a job row."""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "message": job["message"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+# ----------------------------
+# Job runners
+# ----------------------------
+@runner("csv_export")
+def _run_csv_export(params, dest_path, progress):
+    from exports import iter_reports_csv
+    from repository import get_repository
+
+    with get_repository().snapshot() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0] or 1
+        with open(dest_path, "wb") as f:
+            for chunk in iter_reports_csv(conn, progress=lambda done: progress(done / total)):
+                f.write(chunk)
+    return "all_site_reports.csv", "text/csv"
+
+
+@runner("xlsx_export")
+def _run_xlsx_export(params, dest_path, progress):
+    from exports import iter_reports_xlsx
+    from repository import get_repository
+
+    with get_repository().snapshot() as conn:
+        total = sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("reports", "issues", "devices")
+        ) or 1
+        with open(dest_path, "wb") as f:
+            for chunk in iter_reports_xlsx(conn, progress=lambda done: progress(done / total)):
+                f.write(chunk)
+    return "all_site_reports.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+@runner("report_pdf")
+def _run_report_pdf(params, dest_path, progress):
+    from pdf_report import build_report_pdf
+
+    from repository import get_repository, load_report
+
+    report_id = params["report_id"]
+    report, issues, devices, _ = load_report(get_repository(), report_id)
+    if not report:
+        raise LookupError("Report not found.")
+    progress(0.2)
+    pdf_buffer = build_report_pdf(report, issues, devices, show_credentials=params.get("show_credentials", False))
+    with open(dest_path, "wb") as f:
+        f.write(pdf_buffer.getbuffer())
+    return f"{report['site_name']}_Report_{report_id}.pdf", "application/pdf"
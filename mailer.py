@@ -0,0 +1,86 @@
+"""SMTP delivery of registration verification codes.
+
+Kept out of app.py so smtplib and the email MIME modules are only
+imported when a registration actually sends mail.
+"""
+import os
+import smtplib
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+
+def send_verification_email(email, username, verification_code, admin_email):
+    """Send verification code to admin email.
+
+    Supports configurable SMTP via environment variables:
+      SENDER_EMAIL (defaults to admin_email)
+      SENDER_PASSWORD (if provided, login will be attempted)
+      SENDER_SMTP (defaults to smtp.gmail.com)
+      SENDER_PORT (defaults to 587)
+      SENDER_USE_TLS (1/0 or true/false, defaults to 1)
+      SENDER_USE_SSL (1/0 or true/false, defaults to 0)
+
+    If no password is provided the function will attempt an unauthenticated send
+    (useful for localhost SMTP servers). Returns True on success, False on error.
+    """
+    try:
+        sender_email = os.getenv("SENDER_EMAIL", admin_email)
+        sender_password = os.getenv("SENDER_PASSWORD", "")
+        smtp_host = os.getenv("SENDER_SMTP", "smtp.gmail.com")
+        smtp_port = int(os.getenv("SENDER_PORT", "587"))
+        use_tls = os.getenv("SENDER_USE_TLS", "1").lower() in ("1", "true", "yes")
+        use_ssl = os.getenv("SENDER_USE_SSL", "0").lower() in ("1", "true", "yes")
+
+        # Debug logging
+        print(f"[EMAIL] Attempting to send verification code")
+        print(f"[EMAIL] SMTP: {smtp_host}:{smtp_port} (TLS={use_tls}, SSL={use_ssl})")
+        print(f"[EMAIL] From: {sender_email} | To: {admin_email}")
+        print(f"[EMAIL] Auth: {'Yes (with password)' if sender_password else 'No (unauthenticated)'}")
+
+        subject = f"New User Registration - Verification Code"
+        body = f"""
+A new user has registered with the following details:
+
+Username: {username}
+Email: {email}
+Verification Code: {verification_code}
+
+Please provide the verification code to the user to complete registration.
+"""
+
+        msg = MIMEMultipart()
+        msg["From"] = sender_email
+        msg["To"] = admin_email
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, "plain"))
+
+        # Connect to SMTP server (support SSL, TLS, or plain localhost delivery)
+        print(f"[EMAIL] Connecting to SMTP server...")
+        if use_ssl:
+            server = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10)
+        else:
+            server = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
+            if use_tls:
+                print(f"[EMAIL] Initiating STARTTLS...")
+                try:
+                    server.starttls()
+                    print(f"[EMAIL] STARTTLS successful")
+                except Exception as e:
+                    print(f"[EMAIL] STARTTLS failed (continuing): {e}")
+
+        # Authenticate if credentials provided
+        if sender_password:
+            print(f"[EMAIL] Authenticating with {sender_email}...")
+            server.login(sender_email, sender_password)
+            print(f"[EMAIL] Authentication successful")
+
+        print(f"[EMAIL] Sending message...")
+        server.send_message(msg)
+        print(f"[EMAIL] Message sent successfully")
+        server.quit()
+        return True
+    except Exception as e:
+        print(f"[EMAIL] ERROR: {type(e).__name__}: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
@@ -0,0 +1,285 @@
+"""Scheduled database maintenance.
+
+``run_maintenance`` refreshes planner statistics (``PRAGMA optimize`` /
+``ANALYZE``), returns free pages left behind by edits and deletes with
+``incremental_vacuum``, checkpoints the WAL and checks integrity, stopping
+early once its time budget is used up. It covers every database file:
+the main one, the region shards and the archive files. Space is only
+reclaimed in small steps from databases in ``auto_vacuum=INCREMENTAL``
+mode. New databases are created in that mode (``dbconn.prepare``);
+converting an older one takes a full VACUUM that locks it for the whole
+rewrite, so that only happens on an explicit ``flask db-maintain --convert``.
+
+``purge_orphans`` deletes issues, devices and attachment rows whose
+report no longer exists (left behind by deletes made before foreign keys
+were enforced), and dashboard events of deleted reports once they are
+older than ``EVENTS_RETENTION``, a batch of ids per transaction so writers
+are never held up for long. The attachment files themselves are removed
+by ``attachments.collect_garbage`` once no row refers to them.
+
+Every run is recorded in the ``maintenance_log`` table. The optional
+in-process scheduler uses that table to make sure only one worker process
+runs maintenance per interval.
+
+Environment variables:
+  DB_MAINTENANCE_INTERVAL (seconds between scheduled runs, defaults to 0 = off)
+  DB_MAINTENANCE_BUDGET (seconds each run may take, defaults to 30)
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import dbconn
+
+MAINTENANCE_INTERVAL = int(os.getenv("DB_MAINTENANCE_INTERVAL", "0"))
+MAINTENANCE_BUDGET = float(os.getenv("DB_MAINTENANCE_BUDGET", "30"))
+
+AUTO_VACUUM_INCREMENTAL = 2
+VACUUM_STEP_PAGES = 500
+
+# Rows of each child table examined per purge transaction
+ORPHAN_BATCH_SIZE = 5000
+ORPHAN_TABLES = ("issues", "devices", "attachments", "dashboard_events")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _start_log(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    log_id = conn.execute(
+        "INSERT INTO maintenance_log (started_at) VALUES (?)", (datetime.utcnow().isoformat(),)
+    ).lastrowid
+    conn.execute("COMMIT")
+    return log_id
+
+
+def database_files(db_path):
+    """Every database file the app keeps: main, region shards, then archives."""
+    import archive
+    import shards
+    paths = list(shards.shard_paths(db_path).values()) + [path for _, path in archive.archive_files(db_path)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _maintain(path, budget, analyze, convert):
+    """Maintenance steps for one database file, within ``budget`` seconds."""
+    started = time.monotonic()
+    deadline = started + budget
+    conn = dbconn.connect(path, timeout=30, isolation_level=None)
+    page_size = _pragma(conn, "page_size")
+    free_before = _pragma(conn, "freelist_count")
+    size_before = _pragma(conn, "page_count") * page_size
+    steps = []
+    integrity = "skipped"
+
+    try:
+        incremental = _pragma(conn, "auto_vacuum") == AUTO_VACUUM_INCREMENTAL
+        if not incremental and convert:
+            # auto_vacuum only changes on a full rebuild, which ignores the
+            # budget and locks the database; only done when asked for.
+            step_start = time.monotonic()
+            conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+            incremental = True
+            steps.append(f"vacuum (auto_vacuum=INCREMENTAL) {time.monotonic() - step_start:.2f}s")
+        elif not incremental:
+            steps.append("auto_vacuum conversion deferred (run db-maintain --convert)")
+
+        step_start = time.monotonic()
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if analyze or not has_stats:
+            conn.execute("ANALYZE")
+            steps.append(f"analyze {time.monotonic() - step_start:.2f}s")
+        else:
+            conn.execute("PRAGMA optimize")
+            steps.append(f"optimize {time.monotonic() - step_start:.2f}s")
+
+        step_start = time.monotonic()
+        vacuumed = 0
+        while incremental and time.monotonic() < deadline and _pragma(conn, "freelist_count"):
+            # execute() only steps the pragma once (one page); executescript runs it to completion.
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+            vacuumed += 1
+        if vacuumed:
+            steps.append(f"incremental_vacuum x{vacuumed} {time.monotonic() - step_start:.2f}s")
+
+        if _pragma(conn, "journal_mode") == "wal" and time.monotonic() < deadline:
+            busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            steps.append(f"wal_checkpoint {checkpointed}/{wal_pages} pages" + (" (busy)" if busy else ""))
+
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            step_start = time.monotonic()
+            # The full check reads every index; fall back to quick_check when short on time.
+            check = "integrity_check" if remaining > budget / 2 else "quick_check"
+            rows = [r[0] for r in conn.execute(f"PRAGMA {check}(20)").fetchall()]
+            integrity = "ok" if rows == ["ok"] else "; ".join(rows)
+            steps.append(f"{check} {time.monotonic() - step_start:.2f}s")
+    except sqlite3.Error as e:
+        integrity = f"error: {e}"
+        steps.append(f"aborted: {e}")
+
+    free_after = _pragma(conn, "freelist_count")
+    size_after = _pragma(conn, "page_count") * page_size
+    conn.close()
+    return {
+        "duration": round(time.monotonic() - started, 3),
+        "reclaimed_bytes": size_before - size_after,
+        "free_pages_before": free_before,
+        "free_pages_after": free_after,
+        "integrity": integrity,
+        "steps": steps,
+    }
+
+
+def run_maintenance(db_path, budget=None, analyze=False, log_id=None, convert=False):
+    """Maintain every database file (see database_files) until done or ``budget`` seconds have passed.
+
+    The budget is shared out between the files still to do, so time one
+    file does not need goes to the next. ``convert`` also rebuilds files not
+    yet in ``auto_vacuum=INCREMENTAL`` mode (a full VACUUM each, outside
+    the budget). The run is logged in the main database's maintenance_log.
+    Returns a dict describing what was done, with a ``databases`` entry per file.
+    """
+    budget = MAINTENANCE_BUDGET if budget is None else budget
+    started = time.monotonic()
+    deadline = started + budget
+    conn = dbconn.connect(db_path, timeout=30, isolation_level=None)
+    if log_id is None:
+        log_id = _start_log(conn)
+
+    paths = database_files(db_path)
+    databases = {}
+    for n, path in enumerate(paths):
+        name = os.path.relpath(path, os.path.dirname(db_path))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 and not convert:
+            databases[name] = {"reclaimed_bytes": 0, "integrity": "skipped", "steps": ["skipped (budget used up)"]}
+            continue
+        databases[name] = _maintain(path, max(remaining, 0) / (len(paths) - n), analyze, convert)
+        print(f"[MAINTENANCE] {name}: reclaimed {databases[name]['reclaimed_bytes']} bytes "
+              f"({databases[name]['free_pages_before']} -> {databases[name]['free_pages_after']} free pages) "
+              f"in {databases[name]['duration']}s; integrity: {databases[name]['integrity']}; "
+              f"steps: {', '.join(databases[name]['steps'])}")
+
+    problems = [f"{name}: {db['integrity']}" for name, db in databases.items() if db["integrity"] not in ("ok", "skipped")]
+    checked = any(db["integrity"] == "ok" for db in databases.values())
+    result = {
+        "duration": round(time.monotonic() - started, 3),
+        "reclaimed_bytes": sum(db["reclaimed_bytes"] for db in databases.values()),
+        "integrity": "; ".join(problems) if problems else ("ok" if checked else "skipped"),
+        "databases": databases,
+    }
+    steps = "; ".join(f"{name}: {', '.join(db['steps'])}" for name, db in databases.items())
+    conn.execute(
+        "UPDATE maintenance_log SET finished_at = ?, duration = ?, reclaimed_bytes = ?, integrity = ?, steps = ? WHERE id = ?",
+        (datetime.utcnow().isoformat(), result["duration"], result["reclaimed_bytes"], result["integrity"], steps, log_id)
+    )
+    conn.close()
+    print(f"[MAINTENANCE] Reclaimed {result['reclaimed_bytes']} bytes across {len(databases)} database(s) "
+          f"in {result['duration']}s; integrity: {result['integrity']}")
+    return result
+
+
+def purge_orphans(conn, batch_size=ORPHAN_BATCH_SIZE, dry_run=False):
+    """Delete rows of ORPHAN_TABLES whose report is gone; returns {table: rows}.
+
+    Each table is walked in id order, ``batch_size`` ids per transaction.
+    With ``dry_run`` the orphans are only counted.
+    """
+    import events
+    # Open dashboards still need recent events of deleted reports (the
+    # "deleted" event is what removes the row); older ones are only clutter.
+    events_cutoff = (datetime.utcnow() - timedelta(seconds=events.RETENTION)).isoformat()
+    found = {}
+    for table in ORPHAN_TABLES:
+        found[table] = 0
+        last_id = 0
+        while True:
+            ids = [row[0] for row in conn.execute(
+                f"SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()]
+            if not ids:
+                break
+            last_id = ids[-1]
+            marks = ",".join("?" * len(ids))
+            orphan_filter = f"id IN ({marks}) AND report_id NOT IN (SELECT id FROM reports)"
+            params = list(ids)
+            if table == "dashboard_events":
+                orphan_filter += " AND created_at < ?"
+                params.append(events_cutoff)
+            if dry_run:
+                found[table] += conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {orphan_filter}", params).fetchone()[0]
+                continue
+            found[table] += conn.execute(f"DELETE FROM {table} WHERE {orphan_filter}", params).rowcount
+            conn.commit()
+    if not dry_run and any(found.values()):
+        # Cached dashboard counts included the purged rows.
+        conn.execute("UPDATE write_generation SET generation = generation + 1 WHERE id = 1")
+        conn.commit()
+    return found
+
+
+def _claim_scheduled_run(db_path, interval):
+    """Record a new run if none started within ``interval``; returns its log id or None."""
+    conn = dbconn.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cutoff = (datetime.utcnow() - timedelta(seconds=interval)).isoformat()
+        recent = conn.execute("SELECT 1 FROM maintenance_log WHERE started_at > ?", (cutoff,)).fetchone()
+        if recent:
+            conn.execute("ROLLBACK")
+            return None
+        log_id = conn.execute(
+            "INSERT INTO maintenance_log (started_at) VALUES (?)", (datetime.utcnow().isoformat(),)
+        ).lastrowid
+        conn.execute("COMMIT")
+        return log_id
+    finally:
+        conn.close()
+
+
+def _scheduler_loop(db_path, interval, budget):
+    while True:
+        try:
+            log_id = _claim_scheduled_run(db_path, interval)
+            if log_id is not None:
+                run_maintenance(db_path, budget, log_id=log_id)
+        except sqlite3.Error as e:
+            print(f"[MAINTENANCE] Scheduled run failed: {e}")
+        # Check a few times per interval so a restarted worker picks up promptly.
+        time.sleep(max(interval / 4, 1))
+
+
+def ensure_scheduler(db_path, interval=None, budget=None):
+    """Start the background maintenance thread once per process if enabled."""
+    global _scheduler
+    interval = MAINTENANCE_INTERVAL if interval is None else interval
+    if interval <= 0 or _scheduler is not None:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_scheduler_loop, args=(db_path, interval, budget),
+                name="db-maintenance", daemon=True
+            )
+            _scheduler.start()
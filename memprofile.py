@@ -0,0 +1,314 @@
+"""Opt-in per-request memory profiling with tracemalloc.
+
+When ``MEMPROFILE_ENABLED=1``, tracemalloc runs for the life of the worker
+and a WSGI middleware records the peak traced memory of each request,
+including the time spent streaming its body, against the Flask endpoint
+that served it. A request whose peak goes over its budget is logged as
+``[MEMORY]``, counted in ``/admin/metrics`` as ``memory.over_budget.<endpoint>``
+and kept in a short list of recent alerts.
+
+tracemalloc has a single process-wide peak. It is reset only when no
+other request is running, so a request that overlapped others reports the
+peak of the whole overlap (marked ``concurrent``): an upper bound, never an
+under-count. Tracing slows Python allocations down noticeably; leave it off
+unless you are looking for something.
+
+Snapshots are kept in memory, per worker process, and can be compared with
+each other or with the current heap to find the allocation sites that grew.
+
+Environment variables:
+  MEMPROFILE_ENABLED (set to 1 to trace allocations, defaults to 0)
+  MEMPROFILE_FRAMES (traceback depth stored per allocation, defaults to 1)
+  MEMORY_BUDGET_MB (peak MiB allowed per request before alerting, defaults to 64)
+  MEMORY_BUDGETS (per-endpoint overrides, e.g. "download_all_csv=256,download_report=128")
+"""
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+from flask import request, session
+
+import metrics
+
+MEMPROFILE_ENABLED = os.getenv("MEMPROFILE_ENABLED", "0") == "1"
+MEMPROFILE_FRAMES = int(os.getenv("MEMPROFILE_FRAMES", "1"))
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "64"))
+
+# Snapshots kept per process; the oldest is dropped beyond this
+MAX_SNAPSHOTS = 5
+# Over-budget requests kept for /admin/memory
+MAX_ALERTS = 50
+
+MIB = 1024 * 1024
+
+# tracemalloc's own bookkeeping and the import system are noise in every listing
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _parse_budgets(value):
+    budgets = {}
+    for part in (value or "").split(","):
+        endpoint, _, mib = part.partition("=")
+        if endpoint.strip() and mib.strip():
+            budgets[endpoint.strip()] = float(mib)
+    return budgets
+
+
+BUDGETS = _parse_budgets(os.getenv("MEMORY_BUDGETS"))
+
+_lock = threading.Lock()
+_active = 0
+_overlapped = False
+_endpoints = {}
+_alerts = deque(maxlen=MAX_ALERTS)
+_snapshots = {}
+_next_snapshot = 1
+
+
+def _reset_after_fork():
+    global _lock, _active, _overlapped
+    _lock = threading.Lock()
+    _active = 0
+    _overlapped = False
+    _endpoints.clear()
+    _alerts.clear()
+    _snapshots.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def enabled():
+    return tracemalloc.is_tracing()
+
+
+def budget_for(endpoint):
+    """Peak bytes allowed for one request to ``endpoint``."""
+    return int(BUDGETS.get(endpoint, MEMORY_BUDGET_MB) * MIB)
+
+
+# ----------------------------
+# Per-request accounting
+# ----------------------------
+def _begin():
+    global _active, _overlapped
+    with _lock:
+        if _active == 0:
+            tracemalloc.reset_peak()
+            _overlapped = False
+        else:
+            _overlapped = True
+        _active += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _end(environ, baseline, started):
+    global _active
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        _active -= 1
+        concurrent = _overlapped
+        endpoint = environ.get("memprofile.endpoint") or "<unrouted>"
+        used = max(peak - baseline, 0)
+        stats = _endpoints.setdefault(endpoint, {"requests": 0, "peak_total": 0, "peak_max": 0, "over_budget": 0})
+        stats["requests"] += 1
+        stats["peak_total"] += used
+        stats["peak_max"] = max(stats["peak_max"], used)
+        budget = budget_for(endpoint)
+        if used <= budget:
+            return
+        stats["over_budget"] += 1
+        alert = {
+            "endpoint": endpoint,
+            "path": environ.get("PATH_INFO", ""),
+            "user_id": environ.get("memprofile.user"),
+            "peak_bytes": used,
+            "budget_bytes": budget,
+            "retained_bytes": max(current - baseline, 0),
+            "seconds": round(time.perf_counter() - started, 3),
+            "concurrent": concurrent,
+            "at": datetime.utcnow().isoformat(),
+        }
+        _alerts.append(alert)
+    metrics.incr(f"memory.over_budget.{endpoint}")
+    print(f"[MEMORY] {endpoint} {alert['path']} peaked at {used / MIB:.1f} MiB "
+          f"(budget {budget / MIB:.1f} MiB, {alert['retained_bytes'] / MIB:.1f} MiB still held"
+          f"{', overlapped other requests' if concurrent else ''})")
+
+
+class _MeasuredBody:
+    """Response body that ends the request's measurement once it is sent.
+
+    The measurement ends when the body is exhausted or closed, whichever
+    comes first. A class rather than a generator: a generator closed
+    before its first chunk never runs its ``finally``.
+    """
+
+    def __init__(self, body, environ, baseline, started):
+        self.body = body
+        self.environ = environ
+        self.baseline = baseline
+        self.started = started
+        self.finished = False
+
+    def __iter__(self):
+        yield from self.body
+        self._finish()
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if not self.finished:
+            self.finished = True
+            _end(self.environ, self.baseline, self.started)
+
+
+class MemoryProfilerMiddleware:
+    """Measure the traced memory peak of each request, body included."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        baseline = _begin()
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            _end(environ, baseline, started)
+            raise
+        return _MeasuredBody(body, environ, baseline, started)
+
+
+def init_app(app):
+    """Start tracing and wrap ``app`` when MEMPROFILE_ENABLED is set."""
+    if not MEMPROFILE_ENABLED:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMPROFILE_FRAMES)
+    app.wsgi_app = MemoryProfilerMiddleware(app.wsgi_app)
+
+    @app.before_request
+    def tag_endpoint():
+        # Read back by the middleware once the response body is done
+        request.environ["memprofile.endpoint"] = request.endpoint
+        request.environ["memprofile.user"] = session.get("_user_id")
+
+    print(f"[MEMORY] tracemalloc on ({MEMPROFILE_FRAMES} frame(s)), "
+          f"budget {MEMORY_BUDGET_MB:g} MiB per request")
+
+
+def endpoint_stats():
+    """Requests, mean and max peak per endpoint, largest max first."""
+    with _lock:
+        rows = [
+            {
+                "endpoint": endpoint,
+                "requests": s["requests"],
+                "peak_mean_bytes": s["peak_total"] // s["requests"],
+                "peak_max_bytes": s["peak_max"],
+                "budget_bytes": budget_for(endpoint),
+                "over_budget": s["over_budget"],
+            }
+            for endpoint, s in _endpoints.items()
+        ]
+    return sorted(rows, key=lambda r: r["peak_max_bytes"], reverse=True)
+
+
+def recent_alerts():
+    with _lock:
+        return list(reversed(_alerts))
+
+
+# ----------------------------
+# Snapshots
+# ----------------------------
+def _take():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _frames(traceback):
+    return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+
+
+def top_sites(snapshot=None, group_by="lineno", limit=20):
+    """Largest allocation sites of ``snapshot`` (the current heap if None)."""
+    snapshot = snapshot or _take()
+    stats = snapshot.statistics(group_by)
+    return [
+        {"site": _frames(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+        for stat in stats[:limit]
+    ]
+
+
+def take_snapshot(label=None):
+    """Keep a snapshot of the heap and return its id."""
+    global _next_snapshot
+    snapshot = _take()
+    with _lock:
+        snapshot_id = _next_snapshot
+        _next_snapshot += 1
+        _snapshots[snapshot_id] = (label or "", datetime.utcnow().isoformat(), snapshot,
+                                   sum(trace.size for trace in snapshot.traces))
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            del _snapshots[min(_snapshots)]
+    return snapshot_id
+
+
+def get_snapshot(snapshot_id):
+    with _lock:
+        entry = _snapshots.get(snapshot_id)
+    return entry[2] if entry else None
+
+
+def list_snapshots():
+    with _lock:
+        return [
+            {"id": snapshot_id, "label": label, "taken_at": taken_at, "traced_bytes": traced}
+            for snapshot_id, (label, taken_at, snapshot, traced) in sorted(_snapshots.items())
+        ]
+
+
+def diff(old, new=None, group_by="lineno", limit=20):
+    """Allocation sites that changed most between ``old`` and ``new`` (default: now)."""
+    new = new or _take()
+    stats = new.compare_to(old, group_by)
+    return [
+        {
+            "site": _frames(stat.traceback),
+            "size_bytes": stat.size,
+            "size_diff_bytes": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def status():
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "enabled": enabled(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "default_budget_bytes": budget_for(None),
+        "endpoints": endpoint_stats(),
+        "alerts": recent_alerts(),
+        "snapshots": list_snapshots(),
+    }
@@ -0,0 +1,21 @@
+"""Process-local counters exposed on the admin metrics page.
+
+Counters are plain integers keyed by dotted names (for example
+``compression.bytes_saved``). Each worker process keeps its own set.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def incr(name, value=1):
+    """Add ``value`` to the counter called ``name``."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Return a copy of all counters, sorted by name."""
+    with _lock:
+        return dict(sorted(_counters.items()))
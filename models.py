@@ -0,0 +1,283 @@
+"""Typed rows for users, reports, issues and devices.
+
+Each table's columns are listed once, in SCHEMA; the model classes, the
+form field lists and the INSERT/UPDATE statements in repository.py are all
+generated from it. Models are ``__slots__`` dataclasses, so a loaded report
+holds its values and nothing else (no per-row dict or column map), and the
+short repeated values of status-like columns are interned so a list of rows
+shares one copy of each.
+
+Models still answer ``row["column"]``, like the sqlite3.Row and psycopg2
+DictRow objects they replace, so templates and the PDF code read them
+unchanged. ``row[i]`` is the i-th model field (SCHEMA order), whatever
+the SELECT's column order was.
+
+* ``row_factory(model)``: a sqlite3 row factory (also callable per row for
+  other DB-API cursors) that maps result columns to fields by name.
+* ``bind_form(model, form)`` / ``bind_form_rows(model, form)``: the report
+  form's fields, or its repeated issue/device rows, as models.
+* ``insert_params`` / ``insert_rows`` / ``update_params``: parameter tuples
+  in the column order of ``insert_sql`` / ``update_sql``, ready for
+  ``execute`` and ``executemany``.
+"""
+import sys
+from collections import namedtuple
+from dataclasses import field, make_dataclass
+from datetime import datetime
+from itertools import zip_longest
+from operator import attrgetter
+
+# ``form`` is the create/edit form input the column is read from ("[]" marks
+# a repeated row input); ``written`` is False for columns INSERTs leave to
+# the database.
+Column = namedtuple("Column", "name type form written", defaults=(None, True))
+
+# Columns per table, in model field order. For each table, the written
+# columns in this order are the INSERT column order.
+SCHEMA = {
+    "users": (
+        Column("id", "INTEGER", written=False),
+        Column("username", "TEXT"),
+        Column("email", "TEXT"),
+        Column("password", "TEXT"),
+        Column("role", "TEXT"),
+        Column("verified", "INTEGER"),
+        Column("verification_code", "TEXT"),
+        Column("created_at", "TEXT"),
+    ),
+    "reports": (
+        Column("id", "INTEGER", written=False),
+        Column("site_name", "TEXT", "site_name"),
+        Column("location", "TEXT", "location"),
+        Column("report_type", "TEXT", "report_type"),
+        Column("period_start", "TEXT", "period_start"),
+        Column("period_end", "TEXT", "period_end"),
+        Column("prepared_by", "TEXT", "prepared_by"),
+        Column("department", "TEXT", "department"),
+        Column("date_submitted", "TEXT", "date_submitted"),
+        Column("prepared_by_title", "TEXT", "prepared_by_title"),
+        Column("office_manager", "TEXT", "office_manager"),
+        Column("director_it", "TEXT", "director_it"),
+        Column("site_manager_hr", "TEXT", "site_manager_hr"),
+        Column("internet_service_provider", "TEXT", "internet_service_provider"),
+        Column("internet_ip", "TEXT", "internet_ip"),
+        Column("kit_number", "TEXT", "kit_number"),
+        Column("recharge_contact", "TEXT", "recharge_contact"),
+        Column("wifi_password", "TEXT", "wifi_password"),
+        Column("router_password", "TEXT", "router_password"),
+        Column("internet_note", "TEXT", "internet_note"),
+        Column("executive_summary", "TEXT", "executive_summary"),
+        Column("overall_status", "TEXT", "overall_status"),
+        Column("network_status", "TEXT", "network_status"),
+        Column("power_status", "TEXT", "power_status"),
+        Column("hardware_status", "TEXT", "hardware_status"),
+        Column("biomedical_status", "TEXT", "biomedical_status"),
+        Column("cameras_live", "INTEGER", "cameras_live"),
+        Column("cameras_down", "INTEGER", "cameras_down"),
+        Column("biometrics_live", "INTEGER", "biometrics_live"),
+        Column("biometrics_down", "INTEGER", "biometrics_down"),
+        Column("software_status", "TEXT", "software_status"),
+        Column("security_status", "TEXT", "security_status"),
+        Column("recommendations", "TEXT", "recommendations"),
+        Column("risks_constraints", "TEXT", "risks_constraints"),
+        Column("conclusion", "TEXT", "conclusion"),
+        Column("created_at", "TEXT"),
+    ),
+    "issues": (
+        Column("id", "INTEGER", written=False),
+        Column("report_id", "INTEGER"),
+        Column("issue_title", "TEXT", "issue_title[]"),
+        Column("area", "TEXT", "area[]"),
+        Column("impact", "TEXT", "impact[]"),
+        Column("status", "TEXT", "issue_status[]"),
+        Column("owner", "TEXT", "owner[]"),
+        Column("action_taken", "TEXT", "action_taken[]"),
+        Column("root_cause", "TEXT", "root_cause[]"),
+        Column("priority", "TEXT", "priority[]"),
+        Column("target_date", "TEXT", "target_date[]"),
+        Column("responsible", "TEXT", "responsible[]"),
+        Column("target_date_iso", "TEXT"),
+        Column("pending_reason", "TEXT", written=False),
+    ),
+    "devices": (
+        Column("id", "INTEGER", written=False),
+        Column("report_id", "INTEGER"),
+        Column("device_name", "TEXT", "device_name[]"),
+        Column("hostname", "TEXT", "hostname[]"),
+        Column("serial_number", "TEXT", "serial_number[]"),
+        Column("software_version", "TEXT", "software_version[]"),
+        Column("hdd_capacity", "TEXT", "hdd_capacity[]"),
+        Column("username", "TEXT", "device_username[]"),
+        Column("password", "TEXT", "device_password[]"),
+        Column("status", "TEXT", "device_status[]"),
+    ),
+}
+
+# Columns holding a handful of distinct values (select inputs); interned on
+# load so every row shares one string per value.
+INTERNED_COLUMNS = frozenset({
+    "role", "report_type", "overall_status", "network_status", "power_status", "hardware_status",
+    "biomedical_status", "software_status", "security_status", "impact", "status", "priority",
+    "target_date_iso",
+})
+
+# Left out of the models' repr, which ends up in logs and tracebacks
+SECRET_COLUMNS = frozenset({"password", "wifi_password", "router_password", "verification_code"})
+
+# Issues also store target_date as YYYY-MM-DD (see normalize_date) so the
+# issue board can sort and range-filter it; undated issues sort last.
+NO_TARGET_DATE = "9999-12-31"
+
+# Accepted target_date spellings; the date input sends the first, older
+# reports were typed by hand.
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d %b %Y", "%d %B %Y")
+
+
+def normalize_date(value):
+    """``value`` as YYYY-MM-DD, or NO_TARGET_DATE if it is empty or unparseable."""
+    value = (value or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return NO_TARGET_DATE
+
+
+class _Model:
+    """Base of the generated models: dict- and index-style access for existing callers."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            key = self.COLUMNS[key]
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.COLUMNS
+
+
+def _model(name, table):
+    columns = SCHEMA[table]
+    fields = [(c.name, object, field(default=None, repr=c.name not in SECRET_COLUMNS)) for c in columns]
+    model = make_dataclass(name, fields, bases=(_Model,), slots=True)
+    model.__module__ = __name__
+    model.TABLE = table
+    model.COLUMNS = tuple(c.name for c in columns)
+    model.FORM_COLUMNS = tuple(c.name for c in columns if c.form)
+    model.FORM_INPUTS = tuple(c.form for c in columns if c.form)
+    model.INSERT_COLUMNS = tuple(c.name for c in columns if c.written)
+    model._insert_getter = attrgetter(*model.INSERT_COLUMNS)
+    model._update_getter = attrgetter(*model.FORM_COLUMNS, "id")
+    return model
+
+
+User = _model("User", "users")
+Report = _model("Report", "reports")
+Issue = _model("Issue", "issues")
+Device = _model("Device", "devices")
+
+
+# ----------------------------
+# SQL
+# ----------------------------
+def insert_sql(model):
+    columns = model.INSERT_COLUMNS
+    return f"INSERT INTO {model.TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def update_sql(model):
+    """UPDATE of the form-written columns by id."""
+    return f"UPDATE {model.TABLE} SET {', '.join(f'{c}=?' for c in model.FORM_COLUMNS)} WHERE id=?"
+
+
+def insert_params(item):
+    """``item``'s values for insert_sql."""
+    return item._insert_getter(item)
+
+
+def update_params(item):
+    """``item``'s values for update_sql."""
+    return item._update_getter(item)
+
+
+def insert_rows(items, report_id):
+    """executemany parameters for issues or devices, setting each one's report_id."""
+    rows = []
+    for item in items:
+        item.report_id = report_id
+        rows.append(item._insert_getter(item))
+    return rows
+
+
+# ----------------------------
+# Loading rows
+# ----------------------------
+def _plan(model, description):
+    """How to build ``model`` from rows with this cursor description."""
+    names = [d[0] for d in description]
+    positions = {name: i for i, name in enumerate(names)}
+    indexes = [positions.get(column) for column in model.COLUMNS]
+    interned = [i for i, column in zip(indexes, model.COLUMNS) if i is not None and column in INTERNED_COLUMNS]
+    if names == list(model.COLUMNS):
+        indexes = None
+    return indexes, interned
+
+
+def row_factory(model):
+    """Row factory building ``model`` instances; columns are matched by name, missing ones are None.
+
+    Use one factory per query or connection: it remembers the last cursor
+    description it planned for.
+    """
+    last = [None, None]
+
+    def factory(cursor, row):
+        description = cursor.description
+        if description is not last[0]:
+            last[0], last[1] = description, _plan(model, description)
+        indexes, interned = last[1]
+        if interned:
+            row = list(row)
+            for i in interned:
+                if type(row[i]) is str:
+                    row[i] = sys.intern(row[i])
+        if indexes is None:
+            return model(*row)
+        return model(*[None if i is None else row[i] for i in indexes])
+    return factory
+
+
+# ----------------------------
+# Forms
+# ----------------------------
+def bind_form(model, form):
+    """A model from the single-valued form fields (the report form)."""
+    values = {column: form.get(field) for column, field in zip(model.FORM_COLUMNS, model.FORM_INPUTS)}
+    return model(**values)
+
+
+def bind_form_rows(model, form):
+    """Models for the repeated row inputs (issue or device rows) in one pass.
+
+    The first input names the row (issue title, device name); rows where it
+    is blank are skipped and missing trailing inputs read as "".
+    """
+    columns = model.FORM_COLUMNS
+    items = []
+    for values in zip_longest(*(form.getlist(field) for field in model.FORM_INPUTS), fillvalue=""):
+        name = values[0].strip()
+        if not name:
+            continue
+        item = model(**dict(zip(columns, (name,) + values[1:])))
+        if model is Issue:
+            item.target_date_iso = normalize_date(item.target_date)
+        items.append(item)
+    return items
@@ -0,0 +1,326 @@
+"""PDF rendering of a single site report.
+
+ReportLab is heavy to import, so app.py imports this module only when a
+PDF is actually requested.
+
+Issue and device tables are emitted as a series of ``LongTable`` chunks of
+``TABLE_CHUNK_ROWS`` rows. Splitting one huge table across pages
+re-measures every remaining row on each page break, which grows
+quadratically with row count; chunks keep layout linear. The chunks read
+as one table: a chunk continuing on the same page has no header row, and
+the header is repeated at the top of every page.
+"""
+import os
+from functools import lru_cache
+from io import BytesIO
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle, FrameBreak
+from reportlab.platypus.doctemplate import FrameActionFlowable
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from assets import asset_path
+
+
+TABLE_CHUNK_ROWS = 200
+
+ROW_BACKGROUNDS = [colors.white, colors.HexColor('#f5f5f5')]
+
+# Cell styles shared by chunks with and without a header row
+_DATA_CELL_STYLE = [
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('TOPPADDING', (0, 0), (-1, -1), 4),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4)
+]
+
+DATA_TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), ROW_BACKGROUNDS),
+] + _DATA_CELL_STYLE
+
+CONTINUED_TABLE_STYLE = [('ROWBACKGROUNDS', (0, 0), (-1, -1), ROW_BACKGROUNDS)] + _DATA_CELL_STYLE
+
+
+@lru_cache(maxsize=4)
+def _asset_bytes(path):
+    # Paths are content-hashed (see assets.py), so cached bytes never go stale.
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _para(text, style):
+    # Paragraph text is markup; user input must not be able to break it.
+    return Paragraph(escape(str(text)) if text else "-", style)
+
+
+def _cell(text, style, width):
+    """Plain string if ``text`` fits on one line of ``width``, else a wrapping Paragraph.
+
+    Paragraphs are by far the most expensive part of a table row.
+    """
+    if not text:
+        return "-"
+    text = str(text)
+    if stringWidth(text, style.fontName, style.fontSize) <= width - 8:  # 4pt padding each side
+        return text
+    return _para(text, style)
+
+
+def _headed_table(header, rows, col_widths, row_heights=None):
+    # Row heights already measured (by a split) are not measured again.
+    if row_heights is not None:
+        row_heights = [None] + list(row_heights)
+    table = LongTable([header] + rows, colWidths=col_widths, rowHeights=row_heights, repeatRows=1)
+    table.setStyle(TableStyle(DATA_TABLE_STYLE))
+    return table
+
+
+class _ContinuedTable(LongTable):
+    """Rows continuing the table above on the same page, without a header row.
+
+    Rows that do not fit on the page go on with the header on the next one.
+    """
+
+    def __init__(self, data, header=None, **kwargs):
+        # Table.split() builds the parts with Table's own arguments.
+        super().__init__(data, **kwargs)
+        self.header = header
+        self.col_widths = kwargs.get("colWidths")
+
+    def split(self, availWidth, availHeight):
+        parts = super().split(availWidth, availHeight)
+        rows, heights = self._cellvalues, self._rowHeights
+        if not parts:
+            # Not even one row fits: move to the next page, where a header is due.
+            return [FrameBreak, _headed_table(self.header, rows, self.col_widths, heights)]
+        if len(parts) == 2:
+            done = len(parts[0]._cellvalues)
+            return [parts[0], _headed_table(self.header, rows[done:], self.col_widths, heights[done:])]
+        return parts
+
+
+class _TableChunk(FrameActionFlowable):
+    """A chunk after the first, laid out as a headed table only when it starts a page."""
+
+    def __init__(self, header, rows, col_widths):
+        self.header = header
+        self.rows = rows
+        self.col_widths = col_widths
+
+    def frameAction(self, frame):
+        # Runs at the chunk's place in the frame; the doc template lays out
+        # the generated flowables next.
+        if frame._atTop:
+            content = [_headed_table(self.header, self.rows, self.col_widths)]
+        elif frame._y <= frame._y1p:
+            # The page is full; the chunk would move on without a split.
+            content = [FrameBreak, _headed_table(self.header, self.rows, self.col_widths)]
+        else:
+            table = _ContinuedTable(self.rows, self.header, colWidths=self.col_widths)
+            table.setStyle(TableStyle(CONTINUED_TABLE_STYLE))
+            content = [table]
+        frame._generated_content = content
+
+
+def _chunked_tables(header, rows, col_widths, chunk_rows=TABLE_CHUNK_ROWS):
+    """Yield the flowables of a table of the ``rows`` iterator, ``chunk_rows`` rows at a time."""
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_rows))
+    if not chunk:
+        return
+    yield _headed_table(header, chunk, col_widths)
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield _TableChunk(header, chunk, col_widths)
+
+
+def build_report_pdf(report, issues, devices=(), show_credentials=False):
+    """Render a report with its issues and devices; returns a BytesIO positioned at 0.
+
+    Device passwords are printed only when ``show_credentials`` is true (admins).
+    """
+    # Create PDF in memory
+    pdf_buffer = BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        textColor=colors.HexColor("#1a2c47"),
+        spaceAfter=6,
+        alignment=TA_CENTER
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=12,
+        textColor=colors.HexColor('#1f4788'),
+        spaceAfter=6,
+        spaceBefore=12
+    )
+
+    # Title
+    story.append(Paragraph("SITE REPORT DETAIL", title_style))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Report header info
+    available_width = doc.width
+    label_col = 1.8 * inch
+    value_col = max(available_width - label_col, 2.5 * inch)
+
+    header_data = [
+        ["Site Name:", Paragraph(report["site_name"] or "-", styles['Normal'])],
+        ["Location:", Paragraph(report["location"] or "-", styles['Normal'])],
+        ["Report Type:", Paragraph(report["report_type"] or "-", styles['Normal'])],
+        ["Period Start:", Paragraph(report["period_start"] or "-", styles['Normal'])],
+        ["Period End:", Paragraph(report["period_end"] or "-", styles['Normal'])],
+        ["Prepared By:", Paragraph(report["prepared_by"] or "-", styles['Normal'])],
+        ["Prepared By Title:", Paragraph(report["prepared_by_title"] or "-", styles['Normal'])],
+        ["Department:", Paragraph(report["department"] or "-", styles['Normal'])],
+        ["Office Manager:", Paragraph(report["office_manager"] or "-", styles['Normal'])],
+        ["Director of IT Department:", Paragraph(report["director_it"] or "-", styles['Normal'])],
+        ["Site Manager/HR:", Paragraph(report["site_manager_hr"] or "-", styles['Normal'])],
+        ["Date Submitted:", Paragraph(report["date_submitted"] or "-", styles['Normal'])],
+        ["Overall Status:", Paragraph(report["overall_status"] or "-", styles['Normal'])]
+    ]
+    header_table = Table(header_data, colWidths=[label_col, value_col])
+    header_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e8f0f8')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+    ]))
+    story.append(header_table)
+    story.append(Spacer(1, 0.3*inch))
+
+    # Executive Summary
+    story.append(Paragraph("EXECUTIVE SUMMARY", heading_style))
+    story.append(Paragraph(report["executive_summary"] or "-", styles['Normal']))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Status Overview
+    story.append(Paragraph("STATUS OVERVIEW", heading_style))
+    status_data = [
+        ["Category", "Status"],
+        ["Network", Paragraph(report["network_status"] or "-", styles['Normal'])],
+        ["Power", Paragraph(report["power_status"] or "-", styles['Normal'])],
+        ["Hardware", Paragraph(report["hardware_status"] or "-", styles['Normal'])],
+        ["Cameras", Paragraph(f"{report['cameras_live'] or '-'} live / {report['cameras_down'] or '-'} down", styles['Normal'])],
+        ["Biometrics", Paragraph(f"{report['biometrics_live'] or '-'} live / {report['biometrics_down'] or '-'} down", styles['Normal'])],
+        ["Software", Paragraph(report["software_status"] or "-", styles['Normal'])],
+        ["Security", Paragraph(report["security_status"] or "-", styles['Normal'])]
+    ]
+    status_table = Table(status_data, colWidths=[available_width * 0.35, available_width * 0.65])
+    status_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6)
+    ]))
+    story.append(status_table)
+    story.append(Spacer(1, 0.2*inch))
+
+    # Issues
+    small = ParagraphStyle('TableCell', parent=styles['Normal'], fontSize=9, leading=11)
+    if issues:
+        story.append(Paragraph("ISSUES LOGGED", heading_style))
+        widths = [available_width * 0.35] + [available_width * 0.13] * 5
+        issue_rows = (
+            [
+                _cell(issue["issue_title"], small, widths[0]),
+                _cell(issue["area"], small, widths[1]),
+                _cell(issue["impact"], small, widths[2]),
+                _cell(issue["status"], small, widths[3]),
+                _cell(issue["priority"], small, widths[4]),
+                _cell(issue["owner"], small, widths[5])
+            ]
+            for issue in issues
+        )
+        story.extend(_chunked_tables(["Issue Title", "Area", "Impact", "Status", "Priority", "Owner"], issue_rows, widths))
+        story.append(Spacer(1, 0.2*inch))
+
+    # Devices
+    if devices:
+        story.append(Paragraph("DEVICES", heading_style))
+        widths = [available_width * w for w in (0.18, 0.15, 0.14, 0.1, 0.09, 0.12, 0.12, 0.1)]
+        device_rows = (
+            [
+                _cell(device["device_name"], small, widths[0]),
+                _cell(device["hostname"], small, widths[1]),
+                _cell(device["serial_number"], small, widths[2]),
+                _cell(device["software_version"], small, widths[3]),
+                _cell(device["hdd_capacity"], small, widths[4]),
+                _cell(device["username"], small, widths[5]),
+                _cell(device["password"], small, widths[6]) if show_credentials else (device["password"] and "[HIDDEN]" or "-"),
+                _cell(device["status"], small, widths[7])
+            ]
+            for device in devices
+        )
+        story.extend(_chunked_tables(
+            ["Device", "Hostname", "Serial", "Version", "HDD", "Username", "Password", "Status"], device_rows, widths
+        ))
+        story.append(Spacer(1, 0.2*inch))
+
+    # Recommendations
+    story.append(Paragraph("RECOMMENDATIONS", heading_style))
+    story.append(Paragraph(report["recommendations"] or "-", styles['Normal']))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Risks & Constraints
+    story.append(Paragraph("RISKS & CONSTRAINTS", heading_style))
+    story.append(Paragraph(report["risks_constraints"] or "-", styles['Normal']))
+    story.append(Spacer(1, 0.2*inch))
+
+    # Conclusion
+    story.append(Paragraph("CONCLUSION", heading_style))
+    story.append(Paragraph(report["conclusion"] or "-", styles['Normal']))
+
+    # Build PDF
+    def on_first_page(canvas, doc_obj):
+        canvas.saveState()
+        width, height = doc_obj.pagesize
+        logo_path = asset_path('logo.png')
+
+        if os.path.exists(logo_path):
+            try:
+                logo_width = 1.8 * inch
+                logo_height = 0.45 * inch
+                logo_x = doc_obj.leftMargin
+                logo_y = height - logo_height - 0.35 * inch
+                logo = ImageReader(BytesIO(_asset_bytes(logo_path)))
+                canvas.drawImage(logo, logo_x, logo_y, width=logo_width, height=logo_height, preserveAspectRatio=True)
+            except Exception:
+                pass
+        canvas.restoreState()
+
+    doc.build(story, onFirstPage=on_first_page)
+    pdf_buffer.seek(0)
+
+    return pdf_buffer
@@ -0,0 +1,180 @@
+"""Token-bucket rate limiting and load shedding for expensive routes.
+
+Routes are grouped into classes (``auth``, ``pdf``, ``export``,
+``passwords``). Each class has a token bucket per client IP and, once
+logged in, per user; a request that finds either bucket empty gets a 429
+with ``Retry-After``. Heavy classes also share a per-process concurrency
+cap: when ``HEAVY_CONCURRENCY`` of them are already running, further ones
+get a 503 with ``Retry-After`` instead of queueing behind them.
+
+Limits are kept in memory, so they apply per worker process. Client IPs
+are ``request.remote_addr``; behind a reverse proxy, set ``PROXY_HOPS`` so
+ProxyFix takes it from ``X-Forwarded-For`` (otherwise every client shares
+the proxy's address, and its bucket).
+
+Environment variables:
+  RATE_LIMIT_ENABLED (set to 0 to turn limiting off, defaults to 1)
+  RATE_LIMIT_AUTH / RATE_LIMIT_PDF / RATE_LIMIT_EXPORT / RATE_LIMIT_PASSWORDS
+    ("<requests>/<seconds>" per client, defaults below)
+  HEAVY_CONCURRENCY (heavy requests running at once per process, defaults to 4)
+  HEAVY_WAIT (seconds a heavy request waits for a free slot, defaults to 0.5)
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+from flask_login import current_user
+
+import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+HEAVY_CONCURRENCY = int(os.getenv("HEAVY_CONCURRENCY", "4"))
+HEAVY_WAIT = float(os.getenv("HEAVY_WAIT", "0.5"))
+
+# Route class -> default "<requests>/<seconds>" per client
+DEFAULT_LIMITS = {
+    "auth": "10/60",       # login/register/verify: PBKDF2 per attempt
+    "pdf": "30/60",        # ReportLab render
+    "export": "5/60",      # full-table CSV
+    "passwords": "5/60",   # PBKDF2 + every device credential
+}
+
+# Idle buckets are dropped beyond this many keys
+MAX_BUCKETS = 10000
+
+
+def _parse_limit(value):
+    count, seconds = value.split("/")
+    return int(count), float(seconds)
+
+
+LIMITS = {
+    name: _parse_limit(os.getenv(f"RATE_LIMIT_{name.upper()}", default))
+    for name, default in DEFAULT_LIMITS.items()
+}
+
+
+class TokenBucket:
+    """``capacity`` tokens, refilled continuously at ``rate`` tokens per second."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def wait(self):
+        """Refill; returns 0 if a token is available or the seconds until one is."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take a token; returns 0 on success or the seconds until one is available."""
+        wait = self.wait()
+        if not wait:
+            self.tokens -= 1
+        return wait
+
+
+_buckets = OrderedDict()
+_lock = threading.Lock()
+_heavy = threading.BoundedSemaphore(HEAVY_CONCURRENCY)
+
+
+def _reset_after_fork():
+    global _lock, _heavy
+    _buckets.clear()
+    _lock = threading.Lock()
+    _heavy = threading.BoundedSemaphore(HEAVY_CONCURRENCY)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def check(route_class, keys):
+    """Take a token from each ``(scope, key)`` bucket of ``route_class``.
+
+    Returns 0 if the request may proceed, otherwise the seconds to wait.
+    Tokens are only taken when every bucket has one, so a rejected request
+    does not use up the buckets it would have passed.
+    """
+    count, seconds = LIMITS[route_class]
+    with _lock:
+        buckets = []
+        for key in keys:
+            bucket_key = (route_class,) + key
+            bucket = _buckets.get(bucket_key)
+            if bucket is None:
+                bucket = _buckets[bucket_key] = TokenBucket(count, count / seconds)
+                if len(_buckets) > MAX_BUCKETS:
+                    _buckets.popitem(last=False)
+            else:
+                _buckets.move_to_end(bucket_key)
+            buckets.append(bucket)
+        wait = max((bucket.wait() for bucket in buckets), default=0)
+        if not wait:
+            for bucket in buckets:
+                bucket.take()
+    return wait
+
+
+def _client_keys():
+    # Behind a reverse proxy, remote_addr is the client address from
+    # X-Forwarded-For (ProxyFix, see PROXY_HOPS in app.py).
+    keys = [("ip", request.remote_addr)]
+    if current_user.is_authenticated:
+        keys.append(("user", current_user.id))
+    return keys
+
+
+def _reject(status, route_class, retry_after, message):
+    kind = "rejected" if status == 429 else "shed"
+    metrics.incr(f"ratelimit.{kind}")
+    metrics.incr(f"ratelimit.{kind}.{route_class}")
+    return Response(message, status, {"Retry-After": str(max(1, math.ceil(retry_after)))}, mimetype="text/plain")
+
+
+def limit(route_class, methods=None, heavy=True):
+    """Rate-limit a view (and cap its concurrency if ``heavy``).
+
+    ``methods`` restricts limiting to those HTTP methods (e.g. only POST to /login).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED or (methods and request.method not in methods):
+                return f(*args, **kwargs)
+
+            wait = check(route_class, _client_keys())
+            if wait:
+                return _reject(429, route_class, wait, "Too many requests. Please slow down and try again shortly.")
+            if not heavy:
+                return f(*args, **kwargs)
+
+            semaphore = _heavy
+            if not semaphore.acquire(timeout=HEAVY_WAIT):
+                return _reject(503, route_class, 2, "The server is busy. Please try again in a moment.")
+            try:
+                response = f(*args, **kwargs)
+            except BaseException:
+                semaphore.release()
+                raise
+            if getattr(response, "is_streamed", False):
+                # Streamed bodies do their work after the view returns.
+                response.call_on_close(semaphore.release)
+            else:
+                semaphore.release()
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,187 @@
+"""JSON read API: report list, report detail, issue board and site summaries.
+
+The same endpoints are served two ways:
+
+* by the Flask app (``init_app``), on the threaded WSGI workers;
+* by the asyncio tier in asgi.py, which holds each connection as a
+  coroutine and runs only the queries on a small thread pool, for many
+  slow or polling clients.
+
+Both call ``handle``, so they return identical bodies. Results go through
+the query cache (see cache.py), and every response carries the database's
+write generation as a weak ETag: a client polling with ``If-None-Match``
+gets a 304 for the cost of reading one counter until something changes.
+
+Device, Wi-Fi and router credentials are never returned.
+"""
+import json
+from datetime import date
+from itertools import islice
+
+import models
+from cache import query_cache
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class ApiError(Exception):
+    """A request the API answers with an error status and message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _row(row):
+    return {key: row[key] for key in row.keys() if key not in models.SECRET_COLUMNS}
+
+
+def _int(args, name, default, low=0, high=None):
+    value = args.get(name, "")
+    if value == "":
+        return default
+    if not value.isdigit():
+        raise ApiError(400, f"{name} must be a non-negative integer.")
+    value = max(int(value), low)
+    return min(value, high) if high is not None else value
+
+
+def _text(args, name):
+    return (args.get(name) or "").strip()
+
+
+# ----------------------------
+# Endpoints: (repo, query args, *path parameters) -> JSON-ready value
+# ----------------------------
+def _reports(repo, args):
+    filters = {
+        "site": _text(args, "site"),
+        "status": _text(args, "status"),
+        "report_type": _text(args, "report_type"),
+        "priority": _text(args, "priority"),
+        "include_archive": args.get("include_archive") == "1",
+    }
+    limit = _int(args, "limit", DEFAULT_LIMIT, low=1, high=MAX_LIMIT)
+    offset = _int(args, "offset", 0)
+    rows = repo.iter_reports(**filters)
+    try:
+        page = [_row(row) for row in islice(rows, offset, offset + limit + 1)]
+    finally:
+        rows.close()
+    return {
+        "summary": repo.report_summary(**filters),
+        "reports": page[:limit],
+        "next_offset": offset + limit if len(page) > limit else None,
+    }
+
+
+def _report(repo, args, report_id):
+    report = repo.get_report(report_id)
+    archived = False
+    if report:
+        issues, devices = repo.get_issues(report_id), repo.get_devices(report_id)
+    else:
+        found = repo.find_archived_report(report_id)
+        if not found:
+            raise ApiError(404, "Report not found.")
+        report, issues, devices = found
+        archived = True
+    return {
+        "report": _row(report),
+        "issues": [_row(issue) for issue in issues],
+        "devices": [_row(device) for device in devices],
+        "archived": archived,
+    }
+
+
+def _issues(repo, args):
+    after = None
+    if args.get("after_date") and args.get("after_id", "").isdigit():
+        after = (args["after_date"], int(args["after_id"]))
+    rows, next_key = repo.issue_board(
+        limit=_int(args, "limit", 50, low=1, high=MAX_LIMIT),
+        status=_text(args, "status"), priority=_text(args, "priority"),
+        area=_text(args, "area"), responsible=_text(args, "responsible"),
+        overdue_before=date.today().isoformat() if args.get("overdue") == "1" else None,
+        descending=args.get("sort") == "desc", after=after,
+    )
+    return {
+        "issues": [_row(row) for row in rows],
+        "next": {"after_date": next_key[0], "after_id": next_key[1]} if next_key else None,
+    }
+
+
+def _sites(repo, args):
+    return {"sites": [_row(row) for row in repo.site_summaries()]}
+
+
+ENDPOINTS = {
+    "reports": _reports,
+    "report": _report,
+    "issues": _issues,
+    "sites": _sites,
+}
+
+
+def handle(repo, endpoint, args, role, params=(), if_none_match=None):
+    """Answer one API request; returns (status, headers, body bytes).
+
+    ``args`` is a dict of query parameters and ``params`` the path
+    parameters (the report id).
+    """
+    generation = repo.write_generation()
+    etag = f'W/"{generation}"'
+    headers = [("ETag", etag), ("Cache-Control", "private, no-cache")]
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return 304, headers, b""
+    key = (endpoint, params, tuple(sorted(args.items())))
+    try:
+        value = query_cache.get_or_compute(
+            "api", key, role, generation, lambda: ENDPOINTS[endpoint](repo, args, *params)
+        )
+    except ApiError as e:
+        return e.status, [("Cache-Control", "no-store")], _json({"error": str(e)})
+    return 200, headers, _json(value)
+
+
+def _json(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+# ----------------------------
+# WSGI routes
+# ----------------------------
+def init_app(app):
+    """Serve the API from the Flask app under /api."""
+    from flask import Response, request
+    from flask_login import current_user, login_required
+
+    from repository import get_repository
+
+    def respond(endpoint, *params):
+        status, headers, body = handle(
+            get_repository(), endpoint, request.args.to_dict(), current_user.role, params,
+            request.headers.get("If-None-Match"),
+        )
+        return Response(body, status=status, headers=headers, mimetype="application/json")
+
+    @app.route("/api/reports")
+    @login_required
+    def api_reports():
+        return respond("reports")
+
+    @app.route("/api/reports/<int:report_id>")
+    @login_required
+    def api_report(report_id):
+        return respond("report", report_id)
+
+    @app.route("/api/issues")
+    @login_required
+    def api_issues():
+        return respond("issues")
+
+    @app.route("/api/sites")
+    @login_required
+    def api_sites():
+        return respond("sites")
@@ -0,0 +1,822 @@
+"""Data access for users, reports, issues and devices.
+
+Routes talk to a repository instead of opening SQLite connections
+themselves, so the storage backend can be chosen by configuration:
+
+* ``sqlite`` (default): ``instance/site_reports.db``. Reads open a short
+  connection; writes go through the group-commit writer queue (writer.py).
+* ``postgres``: a PostgreSQL database reached through a thread-safe
+  psycopg2 connection pool, so several web hosts can share one database.
+
+Both implementations share the SQL below (written with ``?`` placeholders,
+which the Postgres backend rewrites to ``%s``) and return rows that support
+both ``row["column"]`` and ``row[0]`` access. Users, reports, issues and
+devices are returned as the typed models of models.py, which also generate
+the INSERT and UPDATE statements below.
+
+Jobs, snapshots, archives and maintenance still use the local SQLite file;
+archives are only searched with the SQLite backend. With SHARD_REGIONS set,
+the SQLite backend spreads reports over region databases (see shards.py).
+
+Environment variables:
+  DB_BACKEND (sqlite or postgres, defaults to sqlite)
+  DATABASE_URL (libpq connection string for the postgres backend)
+  DB_POOL_MIN (connections kept open per worker process, defaults to 1)
+  DB_POOL_MAX (connections allowed per worker process, defaults to 10)
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import archive
+import dbconn
+import models
+from models import NO_TARGET_DATE, normalize_date  # noqa: F401 (used as repository.*)
+from writer import run_write
+
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite").lower()
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Report and issue columns written by the create/edit forms, in form order
+REPORT_FIELDS = models.Report.FORM_COLUMNS
+ISSUE_FIELDS = models.Issue.FORM_COLUMNS
+
+INTEGER_REPORT_FIELDS = tuple(c.name for c in models.SCHEMA["reports"] if c.form and c.type == "INTEGER")
+
+# REPORT_FIELDS then created_at
+INSERT_REPORT_SQL = models.insert_sql(models.Report)
+# REPORT_FIELDS then id
+UPDATE_REPORT_SQL = models.update_sql(models.Report)
+# report_id, ISSUE_FIELDS, target_date_iso
+INSERT_ISSUE_SQL = models.insert_sql(models.Issue)
+
+# Issue board indexes, one per filter shape, each ending in the board's
+# (target_date_iso, id) sort key so a page is an index range scan. The
+# default "unresolved" view uses the partial ones.
+ISSUE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_issues_report ON issues(report_id)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_open_due ON issues(target_date_iso, id) WHERE status != 'Resolved'",
+    "CREATE INDEX IF NOT EXISTS idx_issues_open_priority_due "
+    "ON issues(priority, target_date_iso, id) WHERE status != 'Resolved'",
+    "CREATE INDEX IF NOT EXISTS idx_issues_status_due ON issues(status, target_date_iso, id)",
+    "CREATE INDEX IF NOT EXISTS idx_issues_status_priority_due ON issues(status, priority, target_date_iso, id)",
+]
+
+ISSUE_PAGE_SIZE = 50
+
+# Report ids per DELETE statement in delete_reports (keeps under SQLite's variable limit)
+DELETE_BATCH_SIZE = 500
+
+INSERT_DEVICE_SQL = models.insert_sql(models.Device)
+
+INSERT_ATTACHMENT_SQL = (
+    "INSERT INTO attachments (report_id, issue_id, sha256, filename, content_type, size, uploaded_by, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+INSERT_USER_SQL = models.insert_sql(models.User)
+
+INSERT_EVENT_SQL = "INSERT INTO dashboard_events (kind, report_id, payload, created_at) VALUES (?, ?, ?, ?)"
+
+# Dashboard columns of one report, as sent in live-update events (see events.py)
+REPORT_STATE_SQL = """
+    SELECT r.id, r.site_name, r.report_type, r.period_start, r.period_end, r.overall_status, r.created_at,
+    (SELECT COUNT(*) FROM issues i WHERE i.report_id = r.id AND i.status != 'Resolved') AS open_issues,
+    (SELECT COUNT(*) FROM devices d WHERE d.report_id = r.id) AS devices,
+    (SELECT COUNT(*) FROM devices d WHERE d.report_id = r.id AND d.status = 'Broken') AS broken_devices,
+    r.location
+    FROM reports r WHERE r.id = ?
+"""
+
+# Bumped in every write transaction; cache.py drops results from older generations.
+BUMP_GENERATION_SQL = "UPDATE write_generation SET generation = generation + 1 WHERE id = 1"
+
+# Tables for the postgres backend; mirrors init_db() in app.py.
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'technician',
+        verified INTEGER DEFAULT 0,
+        verification_code TEXT,
+        created_at TEXT NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS reports (
+        id SERIAL PRIMARY KEY,
+        {', '.join(f"{c} INTEGER DEFAULT 0" if c in INTEGER_REPORT_FIELDS else f"{c} TEXT" for c in REPORT_FIELDS)},
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS issues (
+        id SERIAL PRIMARY KEY,
+        report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+        issue_title TEXT NOT NULL,
+        area TEXT,
+        impact TEXT,
+        status TEXT,
+        owner TEXT,
+        action_taken TEXT,
+        root_cause TEXT,
+        pending_reason TEXT,
+        priority TEXT,
+        target_date TEXT,
+        responsible TEXT,
+        target_date_iso TEXT NOT NULL DEFAULT '9999-12-31'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS devices (
+        id SERIAL PRIMARY KEY,
+        report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+        device_name TEXT NOT NULL,
+        hostname TEXT,
+        serial_number TEXT,
+        software_version TEXT,
+        hdd_capacity TEXT,
+        username TEXT,
+        password TEXT,
+        status TEXT
+    )
+    """,
+    *ISSUE_INDEXES,
+    "CREATE INDEX IF NOT EXISTS idx_devices_report ON devices(report_id)",
+    """
+    CREATE TABLE IF NOT EXISTS attachments (
+        id SERIAL PRIMARY KEY,
+        report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+        issue_id INTEGER REFERENCES issues(id) ON DELETE SET NULL,
+        sha256 TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        content_type TEXT,
+        size BIGINT NOT NULL,
+        uploaded_by TEXT,
+        created_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_attachments_report ON attachments(report_id)",
+    """
+    CREATE TABLE IF NOT EXISTS dashboard_events (
+        id BIGSERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        report_id INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS write_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT INTO write_generation (id, generation) VALUES (1, 0) ON CONFLICT DO NOTHING",
+]
+
+_db_path = None
+_repository = None
+_repository_lock = threading.Lock()
+_inherited = []
+
+
+class DuplicateUser(Exception):
+    """Raised when a username or email is already registered."""
+
+
+def issue_params(report_id, row):
+    """INSERT_ISSUE_SQL parameters for a plain tuple of ISSUE_FIELDS values (bulk loads, benchmarks)."""
+    return (report_id,) + tuple(row) + (normalize_date(row[ISSUE_FIELDS.index("target_date")]),)
+
+
+def _reset_after_fork():
+    # Pooled sockets belong to the parent. Keep the inherited repository
+    # referenced so its connections are never closed (and the parent's
+    # sessions terminated) from the child; the child opens its own.
+    global _repository, _repository_lock
+    if _repository is not None:
+        _inherited.append(_repository)
+    _repository = None
+    _repository_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _Repository:
+    """Queries shared by every backend; subclasses provide connections."""
+
+    like = "LIKE"
+
+    @contextmanager
+    def _read(self, include_archive=False):
+        raise NotImplementedError
+
+    def _write(self, fn):
+        """Run ``fn(cursor)`` in a write transaction and return its result."""
+        raise NotImplementedError
+
+    def _insert(self, cur, sql, params):
+        """Execute an INSERT and return the new row id."""
+        raise NotImplementedError
+
+    def _tables(self, include_archive):
+        return "reports", "issues", "devices"
+
+    def _report_values(self, values):
+        return tuple(values)
+
+    def _fetch(self, model, sql, params, one=False):
+        """Rows of ``sql`` as ``model`` instances (the first one, or None, if ``one``)."""
+        with self._read() as cur:
+            cur = cur.execute(sql, params)
+            factory = models.row_factory(model)
+            if one:
+                row = cur.fetchone()
+                return None if row is None else factory(cur, row)
+            return [factory(cur, row) for row in cur.fetchall()]
+
+    # Users
+    def get_user(self, user_id):
+        return self._fetch(models.User, "SELECT id, username, email, role FROM users WHERE id = ?", (user_id,), one=True)
+
+    def get_user_by_username(self, username):
+        return self._fetch(
+            models.User, "SELECT id, username, email, password, role, verified FROM users WHERE username = ?",
+            (username,), one=True
+        )
+
+    def user_exists(self, username, email):
+        with self._read() as cur:
+            return cur.execute(
+                "SELECT id FROM users WHERE username = ? OR email = ?", (username, email)
+            ).fetchone() is not None
+
+    def create_user(self, username, email, password_hash, role, verified, created_at):
+        """Insert a user and return its id; raises DuplicateUser on a taken username/email."""
+        params = (username, email, password_hash, role, verified, None, created_at)
+
+        def _save(cur):
+            user_id = self._insert(cur, INSERT_USER_SQL, params)
+            cur.execute(BUMP_GENERATION_SQL)
+            return user_id
+        try:
+            return self._write(_save)
+        except self.integrity_errors as e:
+            raise DuplicateUser(str(e))
+
+    def ensure_default_user(self, username, email, password_hash, role):
+        """Create a built-in account, or make sure it is verified with the right role."""
+        def _save(cur):
+            if cur.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone():
+                cur.execute("UPDATE users SET verified = 1, role = ?, email = ? WHERE username = ?", (role, email, username))
+            else:
+                self._insert(cur, INSERT_USER_SQL, (username, email, password_hash, role, 1, None, datetime.utcnow().isoformat()))
+            cur.execute(BUMP_GENERATION_SQL)
+        self._write(_save)
+
+    # Reports
+    def get_report(self, report_id):
+        return self._fetch(models.Report, "SELECT * FROM reports WHERE id = ?", (report_id,), one=True)
+
+    def get_issues(self, report_id):
+        return self._fetch(models.Issue, "SELECT * FROM issues WHERE report_id = ? ORDER BY id DESC", (report_id,))
+
+    def get_devices(self, report_id):
+        return self._fetch(models.Device, "SELECT * FROM devices WHERE report_id = ? ORDER BY id DESC", (report_id,))
+
+    def find_archived_report(self, report_id):
+        """(report, issues, devices) from the archive files, or None."""
+        return None
+
+    def create_report(self, report, issues, devices):
+        """Insert a models.Report with its models.Issue and models.Device lists; returns its id."""
+        values = self._report_values(models.insert_params(report))
+
+        def _save(cur):
+            report_id = self._insert(cur, INSERT_REPORT_SQL, values)
+            cur.executemany(INSERT_ISSUE_SQL, models.insert_rows(issues, report_id))
+            cur.executemany(INSERT_DEVICE_SQL, models.insert_rows(devices, report_id))
+            self._record_event(cur, "created", report_id)
+            cur.execute(BUMP_GENERATION_SQL)
+            return report_id
+        return self._write(_save)
+
+    def update_report(self, report, issues, devices):
+        """Update report ``report.id``'s REPORT_FIELDS and replace its issues and devices.
+
+        Issues get new ids; attachments follow the new issue with the same title.
+        """
+        report_id = report.id
+        values = self._report_values(models.update_params(report))
+
+        def _save(cur):
+            previous = cur.execute("SELECT site_name, location FROM reports WHERE id = ?", (report_id,)).fetchone()
+            cur.execute(UPDATE_REPORT_SQL, values)
+            linked = cur.execute(
+                "SELECT a.id, i.issue_title FROM attachments a JOIN issues i ON i.id = a.issue_id WHERE a.report_id = ?",
+                (report_id,)
+            ).fetchall()
+            # Clear old issues and devices then re-add
+            cur.execute("DELETE FROM issues WHERE report_id = ?", (report_id,))
+            cur.execute("DELETE FROM devices WHERE report_id = ?", (report_id,))
+            cur.executemany(INSERT_ISSUE_SQL, models.insert_rows(issues, report_id))
+            cur.executemany(INSERT_DEVICE_SQL, models.insert_rows(devices, report_id))
+            if linked:
+                by_title = {}
+                for row in cur.execute("SELECT id, issue_title FROM issues WHERE report_id = ? ORDER BY id", (report_id,)).fetchall():
+                    by_title.setdefault(row[1], row[0])
+                cur.executemany(
+                    "UPDATE attachments SET issue_id = ? WHERE id = ?",
+                    [(by_title.get(title), attachment_id) for attachment_id, title in linked]
+                )
+            self._record_event(cur, "updated", report_id, previous)
+            cur.execute(BUMP_GENERATION_SQL)
+        self._write(_save)
+
+    def delete_report(self, report_id):
+        return self.delete_reports([report_id])
+
+    def delete_reports(self, report_ids):
+        """Delete reports with their issues, devices and attachment rows in one transaction.
+
+        Returns the number of reports deleted.
+        """
+        report_ids = list(report_ids)
+
+        def _save(cur):
+            deleted = 0
+            for start in range(0, len(report_ids), DELETE_BATCH_SIZE):
+                batch = report_ids[start:start + DELETE_BATCH_SIZE]
+                marks = ",".join("?" * len(batch))
+                existing = cur.execute(f"SELECT id, site_name, location FROM reports WHERE id IN ({marks})", batch).fetchall()
+                # The foreign keys would cascade row by row; one statement per table is cheaper.
+                for table in ("attachments", "issues", "devices"):
+                    cur.execute(f"DELETE FROM {table} WHERE report_id IN ({marks})", batch)
+                deleted += cur.execute(f"DELETE FROM reports WHERE id IN ({marks})", batch).rowcount
+                for row in existing:
+                    self._record_event(cur, "deleted", row[0], row[1:])
+            cur.execute(BUMP_GENERATION_SQL)
+            return deleted
+        return self._write(_save)
+
+    # Dashboard events (live updates, see events.py)
+    def _record_event(self, cur, kind, report_id, previous=None):
+        """Add a dashboard event in the writing transaction, with the report's dashboard columns.
+
+        ``previous`` is the (site_name, location) the report had before an
+        update or delete; the site typeahead uses it (see suggest.py).
+        """
+        report = None
+        if kind != "deleted":
+            row = cur.execute(REPORT_STATE_SQL, (report_id,)).fetchone()
+            report = {key: row[i] for i, key in enumerate(
+                ("id", "site_name", "report_type", "period_start", "period_end", "overall_status", "created_at",
+                 "open_issues", "devices", "broken_devices", "location"))}
+            report["priorities"] = sorted({r[0] for r in cur.execute(
+                "SELECT DISTINCT priority FROM issues WHERE report_id = ?", (report_id,)).fetchall() if r[0]})
+        event = {"type": kind, "id": report_id, "report": report}
+        if previous:
+            event["previous"] = {"site_name": previous[0], "location": previous[1]}
+        payload = json.dumps(event, separators=(",", ":"))
+        cur.execute(INSERT_EVENT_SQL, (kind, report_id, payload, datetime.utcnow().isoformat()))
+
+    def event_sources(self):
+        """{name: repository} of the databases holding dashboard events."""
+        return {"main": self}
+
+    def dashboard_events(self, after_id, limit=500):
+        """Events with id > ``after_id``, oldest first, as (id, payload) rows."""
+        with self._read() as cur:
+            return cur.execute(
+                "SELECT id, payload FROM dashboard_events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+
+    def latest_dashboard_events(self, limit):
+        with self._read() as cur:
+            rows = cur.execute(
+                "SELECT id, payload FROM dashboard_events ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return rows[::-1]
+
+    def last_dashboard_event_id(self):
+        with self._read() as cur:
+            return cur.execute("SELECT MAX(id) FROM dashboard_events").fetchone()[0] or 0
+
+    def prune_dashboard_events(self, before):
+        """Delete events created before ``before`` (ISO time), always keeping the newest."""
+        def _save(cur):
+            return cur.execute(
+                "DELETE FROM dashboard_events WHERE created_at < ? "
+                "AND id < (SELECT MAX(id) FROM dashboard_events)", (before,)
+            ).rowcount
+        return self._write(_save)
+
+    def site_name_stats(self):
+        """(kind, name, reports, last created_at) for every distinct site and location name."""
+        with self._read() as cur:
+            return cur.execute("""
+                SELECT 'site', site_name, COUNT(*), MAX(created_at) FROM reports
+                WHERE site_name IS NOT NULL AND site_name != '' GROUP BY site_name
+                UNION ALL
+                SELECT 'location', location, COUNT(*), MAX(created_at) FROM reports
+                WHERE location IS NOT NULL AND location != '' GROUP BY location
+            """).fetchall()
+
+    # Attachments (files are stored by attachments.py)
+    def get_attachments(self, report_id, include_archive=False):
+        """A report's attachments; ``include_archive`` also looks in the archive files."""
+        with self._read() as cur:
+            return cur.execute("SELECT * FROM attachments WHERE report_id = ? ORDER BY id", (report_id,)).fetchall()
+
+    def get_attachment(self, attachment_id, include_archive=False):
+        with self._read() as cur:
+            return cur.execute("SELECT * FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+
+    def add_attachment(self, report_id, issue_id, sha256, filename, content_type, size, uploaded_by):
+        params = (report_id, issue_id, sha256, filename, content_type, size, uploaded_by, datetime.utcnow().isoformat())
+
+        def _save(cur):
+            attachment_id = self._insert(cur, INSERT_ATTACHMENT_SQL, params)
+            cur.execute(BUMP_GENERATION_SQL)
+            return attachment_id
+        return self._write(_save)
+
+    def delete_attachment(self, attachment_id):
+        def _save(cur):
+            deleted = cur.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,)).rowcount
+            cur.execute(BUMP_GENERATION_SQL)
+            return deleted
+        return self._write(_save)
+
+    def report_attachment_hashes(self, report_ids):
+        """SHA-256 of the attachments of these reports."""
+        report_ids = list(report_ids)
+        hashes = set()
+        with self._read() as cur:
+            for start in range(0, len(report_ids), DELETE_BATCH_SIZE):
+                batch = report_ids[start:start + DELETE_BATCH_SIZE]
+                marks = ",".join("?" * len(batch))
+                hashes.update(row[0] for row in cur.execute(
+                    f"SELECT DISTINCT sha256 FROM attachments WHERE report_id IN ({marks})", batch).fetchall())
+        return hashes
+
+    def attachment_hashes(self):
+        """SHA-256 of every attachment still referenced."""
+        with self._read() as cur:
+            return {row[0] for row in cur.execute("SELECT DISTINCT sha256 FROM attachments").fetchall()}
+
+    def write_generation(self):
+        """Counter bumped by every write; see cache.py."""
+        with self._read() as cur:
+            row = cur.execute("SELECT generation FROM write_generation WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def _report_filter(self, site, status, report_type, priority, issues_t):
+        where, params = [], []
+        if site:
+            where.append(f"r.site_name {self.like} ?")
+            params.append(f"%{site}%")
+        if status:
+            where.append("r.overall_status = ?")
+            params.append(status)
+        if report_type:
+            where.append("r.report_type = ?")
+            params.append(report_type)
+        if priority:
+            where.append(f"EXISTS (SELECT 1 FROM {issues_t} p WHERE p.report_id = r.id AND p.priority = ?)")
+            params.append(priority)
+        return " AND ".join(where) or "1=1", params
+
+    def _iterate(self, query, params, include_archive=False):
+        """Yield result rows one at a time; the connection is held until the generator finishes or is closed."""
+        with self._read(include_archive) as cur:
+            yield from cur.execute(query, params)
+
+    def iter_reports(self, site="", status="", report_type="", priority="", include_archive=False):
+        """Dashboard rows, newest first: the displayed columns plus open_issues, read lazily."""
+        reports_t, issues_t, devices_t = self._tables(include_archive)
+        where, params = self._report_filter(site, status, report_type, priority, issues_t)
+        # Device counts let the page apply live-update events to its totals (see events.py).
+        query = f"""
+            SELECT r.id, r.site_name, r.report_type, r.period_start, r.period_end, r.overall_status, r.created_at,
+            (SELECT COUNT(*) FROM {issues_t} i WHERE i.report_id = r.id AND i.status != 'Resolved') AS open_issues,
+            (SELECT COUNT(*) FROM {devices_t} d WHERE d.report_id = r.id) AS devices,
+            (SELECT COUNT(*) FROM {devices_t} d WHERE d.report_id = r.id AND d.status = 'Broken') AS broken_devices
+            FROM {reports_t} r
+            WHERE {where}
+            ORDER BY r.created_at DESC
+        """
+        return self._iterate(query, params, include_archive)
+
+    def report_summary(self, site="", status="", report_type="", priority="", include_archive=False):
+        """Dashboard totals for the same filters as iter_reports."""
+        reports_t, issues_t, devices_t = self._tables(include_archive)
+        where, params = self._report_filter(site, status, report_type, priority, issues_t)
+        matching = f"SELECT r.id FROM {reports_t} r WHERE {where}"
+        with self._read(include_archive) as cur:
+            by_status = cur.execute(
+                f"SELECT r.overall_status, COUNT(*) FROM {reports_t} r WHERE {where} GROUP BY r.overall_status", params
+            ).fetchall()
+            open_issues = cur.execute(
+                f"SELECT COUNT(*) FROM {issues_t} WHERE status != 'Resolved' AND report_id IN ({matching})", params
+            ).fetchone()[0]
+            devices = cur.execute(
+                f"SELECT COUNT(*), COUNT(CASE WHEN status = 'Broken' THEN 1 END) FROM {devices_t} "
+                f"WHERE report_id IN ({matching})", params
+            ).fetchone()
+        return {
+            "total_reports": sum(row[1] for row in by_status),
+            "total_open_issues": open_issues,
+            "by_status": {row[0]: row[1] for row in by_status},
+            "device_total": devices[0],
+            "device_broken": devices[1],
+        }
+
+    def site_summaries(self):
+        """Per site: report count, newest report time and status, and unresolved issues."""
+        with self._read() as cur:
+            return cur.execute("""
+                SELECT r.site_name, COUNT(*) AS reports, MAX(r.created_at) AS last_report_at,
+                (SELECT l.overall_status FROM reports l WHERE l.site_name = r.site_name
+                 ORDER BY l.created_at DESC LIMIT 1) AS last_status,
+                (SELECT COUNT(*) FROM issues i JOIN reports o ON o.id = i.report_id
+                 WHERE o.site_name = r.site_name AND i.status != 'Resolved') AS open_issues
+                FROM reports r
+                GROUP BY r.site_name
+                ORDER BY r.site_name
+            """).fetchall()
+
+    def _issue_board_query(self, status="", priority="", area="", responsible="", overdue_before=None,
+                           descending=False, after=None, limit=ISSUE_PAGE_SIZE):
+        where, params = [], []
+        if status:
+            where.append("i.status = ?")
+            params.append(status)
+        else:
+            # Spelled exactly like the partial indexes' WHERE clause.
+            where.append("i.status != 'Resolved'")
+        if priority:
+            where.append("i.priority = ?")
+            params.append(priority)
+        if area:
+            where.append(f"i.area {self.like} ?")
+            params.append(f"%{area}%")
+        if responsible:
+            where.append(f"i.responsible {self.like} ?")
+            params.append(f"%{responsible}%")
+        if overdue_before:
+            where.append("i.target_date_iso < ?")
+            params.append(overdue_before)
+        if after:
+            where.append(f"(i.target_date_iso, i.id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        query = f"""
+            SELECT i.id, i.report_id, i.issue_title, i.area, i.status, i.priority,
+                   i.target_date, i.target_date_iso, i.responsible, r.site_name
+            FROM issues i
+            JOIN reports r ON r.id = i.report_id
+            WHERE {' AND '.join(where)}
+            ORDER BY i.target_date_iso {direction}, i.id {direction}
+            LIMIT ?
+        """
+        return query, params + [limit + 1]
+
+    def issue_board(self, limit=ISSUE_PAGE_SIZE, **filters):
+        """One page of issues across all reports, ordered by (target_date_iso, id).
+
+        Filters: ``status`` ("" means every issue not yet Resolved),
+        ``priority``, ``area`` and ``responsible`` (substring),
+        ``overdue_before`` (YYYY-MM-DD), ``descending``, and ``after``, the
+        sort key of the previous page's last row. Returns (rows, next_key),
+        where next_key is None on the last page.
+        """
+        query, params = self._issue_board_query(limit=limit, **filters)
+        with self._read() as cur:
+            rows = cur.execute(query, params).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, (rows[-1]["target_date_iso"], rows[-1]["id"])
+        return rows, None
+
+    def device_credentials(self):
+        """Every device's credentials with its site, for the admin password page."""
+        with self._read() as cur:
+            return cur.execute("""
+                SELECT r.site_name, d.device_name, d.username, d.password, r.wifi_password, r.router_password
+                FROM devices d
+                JOIN reports r ON d.report_id = r.id
+                ORDER BY r.site_name, d.device_name
+            """).fetchall()
+
+
+class SQLiteRepository(_Repository):
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def _read(self, include_archive=False):
+        if include_archive:
+            conn = archive.connect_with_archives(self.db_path)
+        else:
+            conn = dbconn.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+        try:
+            yield conn.cursor()
+        finally:
+            conn.close()
+
+    def _write(self, fn):
+        return run_write(self.db_path, fn)
+
+    def _fetch(self, model, sql, params, one=False):
+        # Built straight from the row tuples, without a sqlite3.Row in between.
+        conn = dbconn.connect(self.db_path)
+        conn.row_factory = models.row_factory(model)
+        try:
+            cur = conn.execute(sql, params)
+            return cur.fetchone() if one else cur.fetchall()
+        finally:
+            conn.close()
+
+    def find_archived_report(self, report_id):
+        return archive.find_archived_report(self.db_path, report_id)
+
+    def get_attachments(self, report_id, include_archive=False):
+        rows = super().get_attachments(report_id)
+        if include_archive and not rows:
+            rows = archive.find_archived_attachments(self.db_path, report_id)
+        return rows
+
+    def get_attachment(self, attachment_id, include_archive=False):
+        row = super().get_attachment(attachment_id)
+        if include_archive and row is None:
+            row = archive.find_archived_attachment(self.db_path, attachment_id)
+        return row
+
+    def attachment_hashes(self):
+        return super().attachment_hashes() | archive.archived_attachment_hashes(self.db_path)
+
+    def _insert(self, cur, sql, params):
+        return cur.execute(sql, params).lastrowid
+
+    def _tables(self, include_archive):
+        # The archive toggle swaps the hot tables for hot+archive union views.
+        if include_archive:
+            return "all_reports", "all_issues", "all_devices"
+        return "reports", "issues", "devices"
+
+    @contextmanager
+    def snapshot(self):
+        """Read-only connection to a point-in-time copy (see exports.py)."""
+        from exports import open_snapshot
+        with open_snapshot(self.db_path) as conn:
+            yield conn
+
+
+def _to_pyformat(sql):
+    return sql.replace("?", "%s")
+
+
+class _PostgresCursor:
+    """psycopg2 cursor with the sqlite3-style calls used above (``?`` placeholders, chained fetch)."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, sql, params=()):
+        self._cur.execute(_to_pyformat(sql), tuple(params))
+        return self._cur
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(_to_pyformat(sql), seq)
+        return self._cur
+
+
+class PostgresRepository(_Repository):
+    like = "ILIKE"  # SQLite's LIKE is case-insensitive; keep the site filter that way
+
+    def __init__(self, dsn, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+        try:
+            import psycopg2
+            import psycopg2.extras
+            import psycopg2.pool
+        except ImportError:
+            raise RuntimeError("DB_BACKEND=postgres requires psycopg2 (pip install psycopg2-binary)")
+        if not dsn:
+            raise RuntimeError("DB_BACKEND=postgres requires DATABASE_URL")
+        self.integrity_errors = (psycopg2.IntegrityError,)
+        self._cursor_factory = psycopg2.extras.DictCursor
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=self._cursor_factory) as cur:
+                yield conn, _PostgresCursor(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.putconn(conn)
+
+    @contextmanager
+    def _read(self, include_archive=False):
+        with self._connection() as (conn, cur):
+            yield cur
+
+    def _write(self, fn):
+        with self._connection() as (conn, cur):
+            return fn(cur)
+
+    def _insert(self, cur, sql, params):
+        return cur.execute(sql + " RETURNING id", params).fetchone()[0]
+
+    def _report_values(self, values):
+        # Empty number inputs arrive as "", which INTEGER columns reject.
+        values = list(values)
+        for name in INTEGER_REPORT_FIELDS:
+            i = REPORT_FIELDS.index(name)
+            if values[i] == "":
+                values[i] = None
+        return tuple(values)
+
+    def _iterate(self, query, params, include_archive=False):
+        # A named (server-side) cursor fetches rows in batches instead of
+        # buffering the whole result client-side.
+        with self._connection() as (conn, _):
+            with conn.cursor(name=f"iter_{uuid.uuid4().hex}", cursor_factory=self._cursor_factory) as cur:
+                cur.itersize = 500
+                cur.execute(_to_pyformat(query), tuple(params))
+                yield from cur
+
+    @contextmanager
+    def snapshot(self):
+        """Read-only REPEATABLE READ transaction: a consistent view without copying."""
+        with self._connection() as (conn, cur):
+            conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            try:
+                yield cur
+            finally:
+                conn.rollback()
+                conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+    def init_schema(self):
+        with self._connection() as (conn, cur):
+            for statement in POSTGRES_SCHEMA:
+                cur.execute(statement)
+
+
+def load_report(repo, report_id):
+    """(report, issues, devices, archived) for ``report_id``, falling back to the archive files.
+
+    Works with any repository (including ShardedRepository); report is
+    None if the id is unknown.
+    """
+    report = repo.get_report(report_id)
+    if report:
+        return report, repo.get_issues(report_id), repo.get_devices(report_id), False
+    found = repo.find_archived_report(report_id)
+    if found:
+        return found + (True,)
+    return None, [], [], False
+
+
+def configure(db_path):
+    global _db_path
+    _db_path = db_path
+
+
+def get_repository():
+    """This process's repository for the configured DB_BACKEND."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                if DB_BACKEND == "postgres":
+                    _repository = PostgresRepository(DATABASE_URL)
+                elif DB_BACKEND == "sqlite":
+                    import shards
+                    if shards.REGIONS:
+                        _repository = shards.ShardedRepository(_db_path)
+                    else:
+                        _repository = SQLiteRepository(_db_path)
+                else:
+                    raise RuntimeError(f"Unknown DB_BACKEND: {DB_BACKEND}")
+    return _repository
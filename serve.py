@@ -0,0 +1,247 @@
+"""Pre-fork production server for the site reports app.
+
+The parent process loads the app, runs database migrations and warm-up
+once, binds the listening socket and then forks the workers. Each worker
+serves requests from a fixed-size thread pool, re-initialises its
+database state after the fork, exits gracefully on SIGTERM and recycles
+itself after ``max_requests`` requests (counted per request, so a
+kept-alive connection counts each of its requests).
+
+A connection holds a pool thread from the moment it is accepted, also
+while it has not sent its request line yet (or its next one, on a
+kept-alive connection), so such idle connections are closed after
+``idle_timeout`` seconds rather than the longer I/O ``timeout``.
+Connections waiting for a thread are capped at ``max_queue`` per worker;
+beyond that a worker answers 503 at once instead of queueing without limit.
+
+The parent replaces workers that exit, re-queueing the export jobs they
+were running, and forwards SIGTERM/SIGINT to all of them.
+
+On platforms without ``os.fork`` (Windows) a single threaded worker runs
+in the current process.
+"""
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import jobs
+import metrics
+
+REJECT_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+)
+
+
+class _RequestHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    idle_timeout = 5
+
+    def handle_one_request(self):
+        # Wait for the request line only briefly; the full timeout applies once it starts.
+        self.connection.settimeout(self.idle_timeout)
+        try:
+            self.rfile.peek(1)
+        except OSError:
+            self.close_connection = True
+            return
+        finally:
+            self.connection.settimeout(self.timeout)
+        self.raw_requestline = b""
+        super().handle_one_request()
+        if self.raw_requestline and self.server.request_done():
+            # Let the client reconnect to a worker that is not on its way out.
+            self.close_connection = True
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that hands connections to a bounded thread pool."""
+
+    multithread = True
+
+    def __init__(self, app, fd, threads, max_requests, timeout, idle_timeout=5, max_queue=64):
+        handler = type("RequestHandler", (_RequestHandler,), {"timeout": timeout, "idle_timeout": idle_timeout})
+        super().__init__("0.0.0.0", 0, app, handler=handler, fd=fd)
+        # All workers select() on the same listening socket; only one wins the
+        # accept(), so the others must not block in it.
+        self.socket.setblocking(False)
+        self.max_requests = max_requests
+        self.max_queue = max_queue
+        self.handled = 0
+        self._queued = 0
+        self._count_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self._stopping = False
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            full = self._queued >= self.max_queue
+            if not full:
+                self._queued += 1
+        if full:
+            self._reject(request)
+            return
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _reject(self, request):
+        metrics.incr("serve.rejected")
+        try:
+            request.settimeout(1)
+            request.sendall(REJECT_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _process_request_thread(self, request, client_address):
+        with self._count_lock:
+            self._queued -= 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def request_done(self):
+        """Count a served request; returns True once the worker is stopping."""
+        with self._count_lock:
+            self.handled += 1
+            recycle = self.max_requests and self.handled == self.max_requests
+        if recycle:
+            print(f"[SERVE] Worker {os.getpid()} reached {self.max_requests} requests, recycling")
+            self.stop()
+        return self._stopping
+
+    def stop(self):
+        """Stop accepting connections; in-flight requests are drained by close()."""
+        if self._stopping:
+            return
+        self._stopping = True
+        # shutdown() blocks until serve_forever() returns, so never call it
+        # from the thread running the accept loop.
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self.server_close()
+
+
+def bind_socket(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload():
+    """Import the app and run migrations and warm-up in the parent."""
+    from app import app, init_app_once, warm_up
+
+    with app.app_context():
+        init_app_once()
+        warm_up()
+    return app
+
+
+def run_worker(app, sock, threads, max_requests, timeout, idle_timeout=5, max_queue=64):
+    import events
+
+    # Each live dashboard stream parks a thread; they get their own share of the
+    # pool (threads are created on demand) so they never starve ordinary requests.
+    server = PooledWSGIServer(app, sock.fileno(), threads + events.MAX_STREAMS, max_requests, timeout,
+                              idle_timeout, max_queue)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: server.stop())
+    print(f"[SERVE] Worker {os.getpid()} started ({threads} threads + {events.MAX_STREAMS} for event streams)")
+    try:
+        server.serve_forever()
+    finally:
+        # Open streams would otherwise hold close() up until they expire.
+        events.close_streams()
+        server.close()
+        from app import drain_background_work
+        drain_background_work()
+    print(f"[SERVE] Worker {os.getpid()} stopped after {server.handled} requests")
+
+
+def _spawn(app, sock, *worker_args):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        run_worker(app, sock, *worker_args)
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(host="0.0.0.0", port=8000, workers=2, threads=8, max_requests=0, timeout=30, idle_timeout=5, max_queue=64):
+    """Run the app with ``workers`` processes of ``threads`` threads each."""
+    app = preload()
+    sock = bind_socket(host, port)
+    print(f"[SERVE] Listening on http://{host}:{port} with {workers} worker(s) x {threads} thread(s)")
+    worker_args = (threads, max_requests, timeout, idle_timeout, max_queue)
+
+    if not hasattr(os, "fork"):
+        run_worker(app, sock, *worker_args)
+        return
+
+    children = {}
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    for _ in range(workers):
+        pid = _spawn(app, sock, *worker_args)
+        children[pid] = time.time()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        # Re-queue the dead worker's export jobs before its replacement (which
+        # may be given the same pid) starts.
+        try:
+            jobs.recover_worker(pid)
+        except sqlite3.Error as e:
+            print(f"[SERVE] Could not re-queue jobs of worker {pid}: {e}")
+        if stopping:
+            continue
+        if time.time() - started < 1:
+            # Crashing straight after start; back off instead of fork-looping.
+            time.sleep(1)
+        new_pid = _spawn(app, sock, *worker_args)
+        children[new_pid] = time.time()
+
+    sock.close()
+    print("[SERVE] All workers stopped")
@@ -0,0 +1,402 @@
+"""Per-region database shards (SQLite backend).
+
+With SHARD_REGIONS set, each region's reports, issues and devices live in
+their own database, ``instance/shards/<region>/site_reports.db``, with its
+own write queue, snapshots and archive files. The main database keeps
+users, jobs and the maintenance log, plus the reports created before
+sharding was turned on and those of sites not mapped to a region.
+
+Routing:
+
+* a new report goes to the shard of its site (SHARD_SITE_REGIONS);
+* an existing report is found from its id. Shard ``n`` (1-based, in
+  SHARD_REGIONS order) hands out ids from ``n * SHARD_ID_SPAN``; the main
+  database keeps the ids below SHARD_ID_SPAN.
+
+Views over all reports (dashboard, issue board, device passwords, exports)
+query every shard in parallel on a thread pool and merge the per-shard
+results in sort order; streamed views read each shard on a thread of its
+own instead. Exports attach point-in-time copies of the shards to
+one connection, so at most MAX_SHARDS databases (main included) can be
+exported together.
+
+Environment variables:
+  SHARD_REGIONS (comma-separated region names; empty disables sharding)
+  SHARD_SITE_REGIONS (comma-separated site=region pairs; site names are case-insensitive)
+  SHARD_FANOUT_WORKERS (threads for cross-shard queries per process, defaults to 8)
+  SHARD_STREAM_STALL (seconds a streamed merge waits for a shard's next row before giving up, defaults to 30)
+"""
+import heapq
+import os
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import dbconn
+from repository import ISSUE_PAGE_SIZE, SQLiteRepository
+
+MAIN = "main"
+SHARD_ID_SPAN = 10 ** 9
+# SQLite's default limit on attached databases
+MAX_SHARDS = 10
+
+FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+STREAM_STALL = float(os.getenv("SHARD_STREAM_STALL", "30"))
+
+
+def _parse_regions(value):
+    regions = [r.strip() for r in value.split(",") if r.strip()]
+    for region in regions:
+        if region == MAIN or not re.fullmatch(r"[A-Za-z0-9_-]+", region):
+            raise RuntimeError(f"Invalid shard region name: {region!r}")
+    return regions
+
+
+def _parse_site_regions(value, regions):
+    mapping = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        site, _, region = pair.partition("=")
+        region = region.strip()
+        if region not in regions:
+            raise RuntimeError(f"SHARD_SITE_REGIONS maps {site.strip()!r} to unknown region {region!r}")
+        mapping[site.strip().lower()] = region
+    return mapping
+
+
+REGIONS = _parse_regions(os.getenv("SHARD_REGIONS", ""))
+SITE_REGIONS = _parse_site_regions(os.getenv("SHARD_SITE_REGIONS", ""), REGIONS)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Pool threads do not survive fork; each worker starts its own pool.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="shard")
+    return _executor
+
+
+# ----------------------------
+# Routing
+# ----------------------------
+def shard_path(main_db_path, region):
+    """Database file of ``region`` (the main database for MAIN)."""
+    if region == MAIN:
+        return main_db_path
+    return os.path.join(os.path.dirname(main_db_path), "shards", region, os.path.basename(main_db_path))
+
+
+def shard_paths(main_db_path):
+    """{region: path} of every database holding reports, main first."""
+    return {region: shard_path(main_db_path, region) for region in [MAIN] + REGIONS}
+
+
+def region_for_site(site_name):
+    return SITE_REGIONS.get((site_name or "").strip().lower(), MAIN)
+
+
+def region_for_id(row_id):
+    """Region owning a report or attachment id, or None if it is outside every shard's range."""
+    n = row_id // SHARD_ID_SPAN
+    if n == 0:
+        return MAIN
+    if 1 <= n <= len(REGIONS):
+        return REGIONS[n - 1]
+    return None
+
+
+def reserve_id_range(conn, region):
+    """Start ``region``'s AUTOINCREMENT counters at the bottom of its id range."""
+    floor = (REGIONS.index(region) + 1) * SHARD_ID_SPAN
+    for table in ("reports", "issues", "devices", "attachments"):
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?", (floor, table, floor))
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+            (table, floor, table)
+        )
+    conn.commit()
+
+
+# ----------------------------
+# Fan-out
+# ----------------------------
+def fan_out(fn, items):
+    """``[fn(item) for item in items]``, run in parallel on the shard pool."""
+    return list(_get_executor().map(fn, items))
+
+
+_DONE = object()
+
+
+def _put(out, item, stop):
+    """Queue ``item`` unless the merge is closed first; returns whether it was queued."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(make_rows, out, stop):
+    # Runs on its own thread: the shard's connection is opened and used here only.
+    rows = None
+    try:
+        rows = make_rows()
+        for row in rows:
+            if not _put(out, row, stop):
+                return
+        _put(out, _DONE, stop)
+    except Exception as e:
+        _put(out, e, stop)
+    finally:
+        if rows is not None:
+            rows.close()
+
+
+def _consume(out):
+    while True:
+        try:
+            item = out.get(timeout=STREAM_STALL)
+        except queue.Empty:
+            raise RuntimeError("Shard query stalled")
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def merge_streams(sources, key, reverse=False, buffer=256):
+    """Lazily merge sorted row generators, each read on its own thread.
+
+    ``sources`` are callables returning generators. Every source feeds a
+    queue of ``buffer`` rows, so memory stays bounded however long the
+    results are; closing the returned generator stops the producers.
+
+    The producers do not use the fan-out pool: a stream lasts as long as its
+    client takes to download it, and a few slow clients would otherwise hold
+    every pool thread. There is one producer per shard per open stream, and
+    streams are bounded by the server's request threads.
+    """
+    stop = threading.Event()
+    queues = []
+    for make_rows in sources:
+        out = queue.Queue(maxsize=buffer)
+        threading.Thread(target=_produce, args=(make_rows, out, stop), name="shard-stream", daemon=True).start()
+        queues.append(out)
+    try:
+        yield from heapq.merge(*(_consume(out) for out in queues), key=key, reverse=reverse)
+    finally:
+        stop.set()
+        for out in queues:
+            # Unblock producers waiting on a full queue.
+            while not out.empty():
+                out.get_nowait()
+
+
+# ----------------------------
+# Repository
+# ----------------------------
+class ShardedRepository:
+    """Routes report queries to region shards; users stay in the main database."""
+
+    def __init__(self, main_db_path, shard_class=SQLiteRepository):
+        self.paths = shard_paths(main_db_path)
+        self.shards = {region: shard_class(path) for region, path in self.paths.items()}
+        self.main = self.shards[MAIN]
+
+    def _shard(self, row_id):
+        # Report and attachment ids both fall in their shard's id range.
+        return self.shards.get(region_for_id(row_id))
+
+    # Users
+    def get_user(self, user_id):
+        return self.main.get_user(user_id)
+
+    def get_user_by_username(self, username):
+        return self.main.get_user_by_username(username)
+
+    def user_exists(self, username, email):
+        return self.main.user_exists(username, email)
+
+    def create_user(self, *args, **kwargs):
+        return self.main.create_user(*args, **kwargs)
+
+    def ensure_default_user(self, *args, **kwargs):
+        return self.main.ensure_default_user(*args, **kwargs)
+
+    # Single reports
+    def get_report(self, report_id):
+        shard = self._shard(report_id)
+        return shard.get_report(report_id) if shard else None
+
+    def get_issues(self, report_id):
+        shard = self._shard(report_id)
+        return shard.get_issues(report_id) if shard else []
+
+    def get_devices(self, report_id):
+        shard = self._shard(report_id)
+        return shard.get_devices(report_id) if shard else []
+
+    def find_archived_report(self, report_id):
+        shard = self._shard(report_id)
+        return shard.find_archived_report(report_id) if shard else None
+
+    def create_report(self, report, issues, devices):
+        return self.shards[region_for_site(report.site_name)].create_report(report, issues, devices)
+
+    def update_report(self, report, issues, devices):
+        # A report stays in the shard it was created in, even if its site changes.
+        shard = self._shard(report.id)
+        if shard:
+            shard.update_report(report, issues, devices)
+
+    def delete_report(self, report_id):
+        shard = self._shard(report_id)
+        return shard.delete_report(report_id) if shard else 0
+
+    def delete_reports(self, report_ids):
+        # Each shard deletes its own reports in one transaction; there is none spanning shard files.
+        by_shard = {}
+        for report_id in report_ids:
+            shard = self._shard(report_id)
+            if shard:
+                by_shard.setdefault(shard, []).append(report_id)
+        return sum(shard.delete_reports(ids) for shard, ids in by_shard.items())
+
+    # Attachments live next to their report; their ids carry the shard's range too.
+    def get_attachments(self, report_id, include_archive=False):
+        shard = self._shard(report_id)
+        return shard.get_attachments(report_id, include_archive) if shard else []
+
+    def get_attachment(self, attachment_id, include_archive=False):
+        shard = self._shard(attachment_id)
+        return shard.get_attachment(attachment_id, include_archive) if shard else None
+
+    def add_attachment(self, report_id, *args):
+        return self._shard(report_id).add_attachment(report_id, *args)
+
+    def delete_attachment(self, attachment_id):
+        shard = self._shard(attachment_id)
+        return shard.delete_attachment(attachment_id) if shard else 0
+
+    def report_attachment_hashes(self, report_ids):
+        by_shard = {}
+        for report_id in report_ids:
+            shard = self._shard(report_id)
+            if shard:
+                by_shard.setdefault(shard, []).append(report_id)
+        return set().union(*(shard.report_attachment_hashes(ids) for shard, ids in by_shard.items()))
+
+    def attachment_hashes(self):
+        return set().union(*fan_out(lambda shard: shard.attachment_hashes(), self.shards.values()))
+
+    def event_sources(self):
+        # Each shard records the dashboard events of its own writes.
+        return dict(self.shards)
+
+    def write_generation(self):
+        # Each shard's counter only grows, so the sum moves whenever any shard is written.
+        return sum(shard.write_generation() for shard in self.shards.values())
+
+    # Views over every shard
+    def iter_reports(self, **filters):
+        return merge_streams(
+            [lambda shard=shard: shard.iter_reports(**filters) for shard in self.shards.values()],
+            key=lambda row: row["created_at"] or "", reverse=True,
+        )
+
+    def report_summary(self, **filters):
+        parts = fan_out(lambda shard: shard.report_summary(**filters), self.shards.values())
+        summary = {"total_reports": 0, "total_open_issues": 0, "by_status": {}, "device_total": 0, "device_broken": 0}
+        for part in parts:
+            for name in ("total_reports", "total_open_issues", "device_total", "device_broken"):
+                summary[name] += part[name]
+            for status, count in part["by_status"].items():
+                summary["by_status"][status] = summary["by_status"].get(status, 0) + count
+        return summary
+
+    def issue_board(self, limit=ISSUE_PAGE_SIZE, **filters):
+        pages = fan_out(lambda shard: shard.issue_board(limit=limit, **filters), self.shards.values())
+        rows = list(heapq.merge(
+            *(page_rows for page_rows, _ in pages),
+            key=lambda row: (row["target_date_iso"], row["id"]), reverse=filters.get("descending", False),
+        ))
+        if len(rows) > limit or any(next_key for _, next_key in pages):
+            rows = rows[:limit]
+            return rows, (rows[-1]["target_date_iso"], rows[-1]["id"])
+        return rows, None
+
+    def site_summaries(self):
+        # A site's reports are in its region's shard, plus any from before sharding in main.
+        sites = {}
+        for part in fan_out(lambda shard: shard.site_summaries(), self.shards.values()):
+            for row in part:
+                row = dict(zip(("site_name", "reports", "last_report_at", "last_status", "open_issues"), row))
+                merged = sites.get(row["site_name"])
+                if merged is None:
+                    sites[row["site_name"]] = row
+                    continue
+                merged["reports"] += row["reports"]
+                merged["open_issues"] += row["open_issues"]
+                if (row["last_report_at"] or "") > (merged["last_report_at"] or ""):
+                    merged["last_report_at"], merged["last_status"] = row["last_report_at"], row["last_status"]
+        return [sites[name] for name in sorted(sites, key=lambda name: name or "")]
+
+    def device_credentials(self):
+        parts = fan_out(lambda shard: shard.device_credentials(), self.shards.values())
+        return list(heapq.merge(*parts, key=lambda row: (row["site_name"] or "", row["device_name"] or "")))
+
+    @contextmanager
+    def snapshot(self):
+        """One read-only connection over point-in-time copies of every shard.
+
+        The copies are taken in parallel and attached to an in-memory
+        database whose TEMP views ``reports``, ``issues`` and ``devices``
+        union them, so the exports run unchanged.
+        """
+        from exports import get_snapshot
+
+        if len(self.paths) > MAX_SHARDS:
+            raise RuntimeError(f"Exports support at most {MAX_SHARDS} databases ({len(self.paths)} configured)")
+        paths = fan_out(get_snapshot, list(self.paths.values()))
+        conn = dbconn.connect("file::memory:", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            schemas = []
+            for i, path in enumerate(paths):
+                conn.execute(f"ATTACH DATABASE ? AS shard{i}", (f"file:{path}?mode=ro",))
+                schemas.append(f"shard{i}")
+            for table in ("reports", "issues", "devices"):
+                cols = [r[1] for r in conn.execute(f"PRAGMA shard0.table_info({table})").fetchall()]
+                selects = []
+                for schema in schemas:
+                    present = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()}
+                    selects.append("SELECT " + ", ".join(c if c in present else f"NULL AS {c}" for c in cols)
+                                   + f" FROM {schema}.{table}")
+                conn.execute(f"CREATE TEMP VIEW {table} AS " + " UNION ALL ".join(selects))
+            yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,41 @@
+// Typeahead for inputs marked data-suggest="site" or data-suggest="location":
+// known names from /api/sites/suggest are offered in a <datalist> as the user types.
+(function () {
+  const url = document.currentScript.dataset.url;
+  if (!url) return;
+
+  document.querySelectorAll('input[data-suggest]').forEach(function (input, n) {
+    const list = document.createElement('datalist');
+    list.id = 'suggest-list-' + n;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer = null;
+    let pending = null;
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      const q = input.value.trim();
+      if (!q) {
+        list.replaceChildren();
+        return;
+      }
+      timer = setTimeout(function () {
+        if (pending) pending.abort();
+        pending = new AbortController();
+        const params = new URLSearchParams({q: q, kind: input.dataset.suggest});
+        fetch(url + '?' + params, {signal: pending.signal, credentials: 'same-origin'})
+          .then(function (r) { return r.ok ? r.json() : {suggestions: []}; })
+          .then(function (data) {
+            list.replaceChildren(...data.suggestions.map(function (s) {
+              const option = document.createElement('option');
+              option.value = s.name;
+              option.label = s.reports + (s.reports === 1 ? ' report' : ' reports');
+              return option;
+            }));
+          })
+          .catch(function () {});
+      }, 150);
+    });
+  });
+})();
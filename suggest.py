@@ -0,0 +1,238 @@
+"""Site and location name suggestions for the typeahead fields.
+
+Each worker process keeps the distinct site and location names in memory,
+with how many reports use each and when one was last created. Lookups go
+through a sorted list of lowercase keys, one per name and per later word
+of it ("north clinic" also files "clinic"), so a query is a bisect to the
+first key with its prefix and a scan of the keys that share it; nothing
+touches the database. Results are memoized until the index next changes,
+so the short, broad prefixes typed first are ranked once, not per keystroke.
+
+The index is built from one GROUP BY per database, then kept current from
+the dashboard change log (``dashboard_events``, see events.py): report
+events carry the site and location before and after the write, so other
+workers' creates, renames and deletes are applied here too, at most
+``SUGGEST_REFRESH`` seconds late. It is rebuilt from scratch every
+``SUGGEST_REBUILD`` seconds, or when it has been idle longer than events
+are kept, which also picks up reports moved to the archive.
+
+Suggestions are ranked by report count, weighted down by the age of the
+newest report: a name's weight halves every ``SUGGEST_HALF_LIFE_DAYS``
+since it was last used. Spellings that differ only in case are one entry,
+shown with the spelling most reports use.
+
+Environment variables:
+  SUGGEST_REFRESH (seconds between checks for new report events, defaults to 1)
+  SUGGEST_REBUILD (seconds between full rebuilds, defaults to 3600)
+  SUGGEST_HALF_LIFE_DAYS (days for a name's weight to halve, defaults to 90)
+"""
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import events
+
+REFRESH = float(os.getenv("SUGGEST_REFRESH", "1"))
+REBUILD = float(os.getenv("SUGGEST_REBUILD", "3600"))
+HALF_LIFE_DAYS = float(os.getenv("SUGGEST_HALF_LIFE_DAYS", "90"))
+
+KINDS = ("site", "location")
+MAX_LIMIT = 20
+# Memoized lookups kept between index changes
+MAX_CACHED = 2000
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_entries = {}
+_keys = []
+_results = {}
+_cursors = {}
+_built_at = None
+_checked_at = 0.0
+
+
+def _reset_after_fork():
+    # The index itself stays valid in a forked worker; only the locks are reset.
+    global _lock, _refresh_lock
+    _lock = threading.Lock()
+    _refresh_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _Entry:
+    __slots__ = ("kind", "spellings", "reports", "last_used")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.spellings = {}
+        self.reports = 0
+        self.last_used = ""
+
+    def name(self):
+        return max(self.spellings.items(), key=lambda item: (item[1], item[0]))[0]
+
+
+def _fold(name):
+    return " ".join(name.split()).casefold()
+
+
+def _tokens(folded):
+    words = folded.split(" ")
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def _add(kind, name, reports, last_used):
+    # Caller holds _lock.
+    name = " ".join((name or "").split())
+    if not name:
+        return
+    key = (kind, _fold(name))
+    _results.clear()
+    entry = _entries.get(key)
+    if entry is None:
+        entry = _entries[key] = _Entry(kind)
+        for token in _tokens(key[1]):
+            bisect.insort(_keys, (token, key))
+    entry.spellings[name] = entry.spellings.get(name, 0) + reports
+    entry.reports += reports
+    if last_used and last_used > entry.last_used:
+        entry.last_used = last_used
+
+
+def _remove(kind, name):
+    # Caller holds _lock. last_used is left as it was: the newest report
+    # with this name is not known without a query, and it only affects ranking.
+    name = " ".join((name or "").split())
+    key = (kind, _fold(name))
+    entry = _entries.get(key)
+    if entry is None:
+        return
+    _results.clear()
+    entry.reports -= 1
+    if name in entry.spellings:
+        entry.spellings[name] -= 1
+        if entry.spellings[name] <= 0:
+            del entry.spellings[name]
+    if entry.reports > 0 and entry.spellings:
+        return
+    del _entries[key]
+    for token in _tokens(key[1]):
+        i = bisect.bisect_left(_keys, (token, key))
+        if i < len(_keys) and _keys[i] == (token, key):
+            del _keys[i]
+
+
+def build(repo):
+    """Rebuild the index from the databases' report names."""
+    global _built_at, _checked_at
+    sources = repo.event_sources()
+    # Cursors first, so no write is missed; one made during the scan may be
+    # counted twice until the next rebuild, which only nudges its rank.
+    cursors = {name: source.last_dashboard_event_id() for name, source in sources.items()}
+    stats = [row for source in sources.values() for row in source.site_name_stats()]
+    with _lock:
+        _entries.clear()
+        _results.clear()
+        del _keys[:]
+        for kind, name, reports, last_used in stats:
+            _add(kind, name, reports, last_used)
+        _cursors.clear()
+        _cursors.update(cursors)
+        _built_at = _checked_at = time.monotonic()
+    print(f"[SUGGEST] Indexed {len(_entries)} site/location name(s) from {len(sources)} database(s)")
+
+
+def _apply(payload):
+    # Caller holds _lock.
+    event = json.loads(payload)
+    previous = event.get("previous")
+    report = event.get("report")
+    if previous:
+        _remove("site", previous.get("site_name"))
+        _remove("location", previous.get("location"))
+    if report:
+        _add("site", report.get("site_name"), 1, report.get("created_at") or "")
+        _add("location", report.get("location"), 1, report.get("created_at") or "")
+
+
+def refresh(repo):
+    """Apply report events written since the last check; rebuild when due.
+
+    Called on every lookup; costs one indexed query per database at most
+    once per SUGGEST_REFRESH seconds, and nothing while another thread is
+    already refreshing.
+    """
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at < REFRESH:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        if _built_at is None or now - _built_at > REBUILD or now - _checked_at > events.RETENTION / 2:
+            build(repo)
+            return
+        for name, source in repo.event_sources().items():
+            while True:
+                rows = source.dashboard_events(_cursors.get(name, 0))
+                if not rows:
+                    break
+                with _lock:
+                    for event_id, payload in rows:
+                        _apply(payload)
+                    _cursors[name] = rows[-1][0]
+        _checked_at = time.monotonic()
+    finally:
+        _refresh_lock.release()
+
+
+def _score(entry, now):
+    try:
+        age_days = max((now - datetime.fromisoformat(entry.last_used)).total_seconds() / 86400, 0)
+    except ValueError:
+        age_days = HALF_LIFE_DAYS * 4
+    return entry.reports * 0.5 ** (age_days / HALF_LIFE_DAYS)
+
+
+def lookup(query, kind=None, limit=10):
+    """Up to ``limit`` names with a word starting with ``query``, best first.
+
+    ``kind`` restricts the results to "site" or "location" names.
+    """
+    prefix = _fold(query or "")
+    if not prefix:
+        return []
+    with _lock:
+        cached = _results.get((prefix, kind, limit))
+        if cached is not None:
+            return cached
+        now = datetime.utcnow()
+        matched = set()
+        i = bisect.bisect_left(_keys, (prefix,))
+        while i < len(_keys) and _keys[i][0].startswith(prefix):
+            key = _keys[i][1]
+            if kind is None or key[0] == kind:
+                matched.add(key)
+            i += 1
+        ranked = heapq.nlargest(limit, ((_score(_entries[key], now), key) for key in matched))
+        results = [
+            {
+                "name": _entries[key].name(),
+                "kind": key[0],
+                "reports": _entries[key].reports,
+                "last_used": _entries[key].last_used or None,
+            }
+            for score, key in ranked
+        ]
+        if len(_results) >= MAX_CACHED:
+            _results.clear()
+        _results[(prefix, kind, limit)] = results
+        return results
+
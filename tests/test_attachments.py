@@ -0,0 +1,99 @@
+"""Chunked attachment uploads."""
+import io
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attachments  # noqa: E402
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    import app as site_app
+    db_path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", db_path)
+    monkeypatch.setattr(attachments, "_db_path", db_path)
+    site_app.init_db()
+    return attachments.create_upload(1, 1, None, "photo.jpg", "image/jpeg", 8)
+
+
+def part_bytes(upload):
+    with open(attachments._part_path(upload["id"]), "rb") as f:
+        return f.read()
+
+
+class _SlowStream:
+    """Request body that sends ``first``, then waits to be let go before sending ``rest``."""
+
+    def __init__(self, first, rest):
+        self.blocks = [first, rest]
+        self.started = threading.Event()
+        self.resume = threading.Event()
+
+    def read(self, size):
+        if len(self.blocks) == 1:
+            self.started.set()
+            self.resume.wait(5)
+        return self.blocks.pop(0) if self.blocks else b""
+
+
+class _DroppedStream:
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size):
+        block = self.data.read(size)
+        if not block:
+            raise ConnectionResetError("client went away")
+        return block
+
+
+def test_chunks_and_resume(upload):
+    assert attachments.write_chunk(upload, 0, io.BytesIO(b"abcd"), 4) == 4
+    with pytest.raises(attachments.OffsetMismatch) as excinfo:
+        attachments.write_chunk(upload, 0, io.BytesIO(b"abcd"), 4)
+    assert excinfo.value.offset == 4
+
+    with pytest.raises(ConnectionResetError):
+        attachments.write_chunk(upload, 4, _DroppedStream(b"ef"), 4)
+    # The bytes that arrived before the drop are kept.
+    assert attachments.get_upload(upload["id"])["received"] == 6
+    assert attachments.write_chunk(upload, 6, io.BytesIO(b"gh"), 2) == 8
+    assert part_bytes(upload) == b"abcdefgh"
+
+
+def test_concurrent_chunks_at_the_same_offset(upload):
+    slow = _SlowStream(b"AAAA", b"AAAA")
+    result = {}
+    writer = threading.Thread(target=lambda: result.setdefault("offset", attachments.write_chunk(upload, 0, slow, 8)))
+    writer.start()
+    assert slow.started.wait(5)
+
+    # The same chunk again, e.g. a client retry that raced the first request.
+    with pytest.raises(attachments.OffsetMismatch) as excinfo:
+        attachments.write_chunk(upload, 0, io.BytesIO(b"BBBBBBBB"), 8)
+    assert excinfo.value.offset == 0
+
+    slow.resume.set()
+    writer.join(5)
+    assert result == {"offset": 8}
+    assert part_bytes(upload) == b"AAAAAAAA"
+    row = attachments.get_upload(upload["id"])
+    assert (row["received"], row["writer"]) == (8, None)
+
+
+def test_lapsed_claim_is_taken_over(upload):
+    # A claim left behind by a process that died mid-chunk.
+    conn = attachments._connect()
+    conn.execute(
+        "UPDATE attachment_uploads SET writer = 'dead', writer_seen = ? WHERE id = ?",
+        ((datetime.utcnow() - timedelta(seconds=attachments.CLAIM_TIMEOUT + 1)).isoformat(), upload["id"])
+    )
+    conn.commit()
+    conn.close()
+    assert attachments.write_chunk(upload, 0, io.BytesIO(b"12345678"), 8) == 8
@@ -0,0 +1,117 @@
+"""Gzip negotiation and response handling of GzipMiddleware."""
+import gzip
+import os
+import sys
+
+import pytest
+from flask import Flask, Response, request
+from werkzeug.test import Client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import GzipMiddleware, accepts_gzip  # noqa: E402
+
+PAGE = "<p>site report</p>" * 100
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("deflate, gzip;q=0.5", True),
+    ("*", True),
+    ("*;q=0, gzip", True),
+    ("*, gzip;q=0", False),
+    ("gzip;q=0, *", False),
+    ("*;q=0", False),
+    ("gzip;q=0", False),
+    ("identity", False),
+    ("", False),
+    (None, False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+class _Body:
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        yield PAGE.encode()
+
+    def close(self):
+        self.closed = True
+
+
+def _wsgi_app(body, status="200 OK", headers=()):
+    def app(environ, start_response):
+        start_response(status, [("Content-Type", "text/html")] + list(headers))
+        return body
+    return app
+
+
+def _call(app, accept_encoding="gzip"):
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"], captured["headers"] = status, dict(headers)
+
+    body = GzipMiddleware(app)({"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": accept_encoding}, start_response)
+    return body, captured
+
+
+def test_body_closed_when_never_iterated():
+    inner = _Body()
+    body, captured = _call(_wsgi_app(inner))
+    assert captured["headers"]["Content-Encoding"] == "gzip"
+    body.close()
+    assert inner.closed
+
+
+def test_body_closed_after_iteration():
+    inner = _Body()
+    body, _ = _call(_wsgi_app(inner))
+    data = b"".join(body)
+    body.close()
+    assert inner.closed
+    assert gzip.decompress(data) == PAGE.encode()
+
+
+@pytest.mark.parametrize("status, headers", [
+    ("206 Partial Content", [("Content-Range", "bytes 0-99/1800")]),
+    ("200 OK", [("Content-Range", "bytes 0-1799/1800")]),
+    ("200 OK", [("Content-Encoding", "br")]),
+])
+def test_ranges_and_encoded_bodies_pass_through(status, headers):
+    inner = _Body()
+    body, captured = _call(_wsgi_app(inner, status, headers))
+    assert body is inner
+    assert captured["headers"].get("Content-Encoding") == dict(headers).get("Content-Encoding")
+
+
+def test_explicit_gzip_refusal_wins():
+    inner = _Body()
+    body, captured = _call(_wsgi_app(inner), accept_encoding="*, gzip;q=0")
+    assert body is inner
+    assert "Content-Encoding" not in captured["headers"]
+
+
+def test_compressed_etag_is_weak_and_still_revalidates():
+    app = Flask(__name__)
+
+    @app.route("/page")
+    def page():
+        response = Response(PAGE, mimetype="text/html")
+        response.set_etag("v1")
+        return response.make_conditional(request)
+
+    client = Client(GzipMiddleware(app.wsgi_app))
+    first = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert first.headers["ETag"] == 'W/"v1"'
+
+    again = client.get("/page", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+    plain = client.get("/page")
+    assert plain.headers["ETag"] == '"v1"'
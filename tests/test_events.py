@@ -0,0 +1,126 @@
+"""Live dashboard events: the cursor a page starts from and what streams replay."""
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attachments  # noqa: E402
+import events  # noqa: E402
+import jobs  # noqa: E402
+import models  # noqa: E402
+import repository  # noqa: E402
+
+
+@pytest.fixture
+def site_app(tmp_path, monkeypatch):
+    import app as site_app
+    db_path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", db_path)
+    for module in (repository, jobs, attachments):
+        monkeypatch.setattr(module, "_db_path", db_path)
+    monkeypatch.setattr(repository, "_repository", None)
+    site_app.init_db()
+    return site_app
+
+
+@pytest.fixture
+def client(site_app):
+    client = site_app.app.test_client()
+    response = client.post("/login", data={"username": "admin", "password": "Mes@2026"})
+    assert response.status_code == 302
+    return client
+
+
+def make_report(repo, site="North Clinic"):
+    report = models.Report(
+        site_name=site, location="Block A", report_type="Weekly", overall_status="Stable",
+        prepared_by="tech1", created_at=datetime.utcnow().isoformat(),
+    )
+    return repo.create_report(report, [], [])
+
+
+def test_index_cursor_is_taken_before_the_summary(client, monkeypatch):
+    repo = repository.get_repository()
+    make_report(repo, "Before")
+    report_summary = repo.report_summary
+    written = []
+
+    def summary_with_concurrent_write(**filters):
+        # Another request saves a report while this page is being built.
+        written.append(make_report(repo, "During"))
+        return report_summary(**filters)
+
+    monkeypatch.setattr(repo, "report_summary", summary_with_concurrent_write)
+    page = client.get("/?site=cursor-test").get_data(as_text=True)
+    cursor = re.search(r'data-cursor="([^"]*)"', page).group(1)
+
+    # The write may or may not be on the page, so its event must come after the cursor.
+    after = events.parse_cursor(cursor)["main"]
+    replayed = [event_id for event_id, _ in repo.dashboard_events(after)]
+    assert written and replayed
+    assert repo.last_dashboard_event_id() in replayed
+
+
+@pytest.fixture
+def repo(site_app, monkeypatch):
+    monkeypatch.setattr(events, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(events, "HEARTBEAT", 0.1)
+    events._reset_after_fork()
+    yield repository.get_repository()
+    # Stops the poller and any stream still open.
+    events.close_streams()
+    if events._poller is not None:
+        events._poller.join(5)
+    events._reset_after_fork()
+
+
+def next_message(body, timeout=5):
+    """The next event of a stream body, skipping retry hints and pings."""
+    deadline = time.monotonic() + timeout
+    for text in body:
+        fields = dict(line.split(": ", 1) for line in text.strip().splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            return fields
+        assert time.monotonic() < deadline
+    return None
+
+
+def test_stream_replays_after_cursor_then_follows_live(repo):
+    make_report(repo, "First")
+    make_report(repo, "Second")
+    body = iter(events.stream(repo, "main:1"))
+
+    replayed = next_message(body)
+    assert replayed["event"] == "report"
+    assert replayed["id"] == "main:2"
+    assert json.loads(replayed["data"])["report"]["site_name"] == "Second"
+
+    make_report(repo, "Third")
+    live = next_message(body)
+    assert live["id"] == "main:3"
+    assert json.loads(live["data"])["report"]["site_name"] == "Third"
+
+
+def test_cursor_older_than_the_buffer_gets_a_reset(repo, monkeypatch):
+    monkeypatch.setattr(events, "BUFFER_SIZE", 2)
+    for i in range(4):
+        make_report(repo, f"Site {i}")
+    assert next_message(iter(events.stream(repo, "main:0")))["event"] == "reset"
+    assert next_message(iter(events.stream(repo, "main:2")))["id"] == "main:3"
+
+
+def test_stream_slots_are_freed_on_close(repo, monkeypatch):
+    monkeypatch.setattr(events, "MAX_STREAMS", 1)
+    body = events.stream(repo, "")
+    with pytest.raises(events.TooManyStreams):
+        events.stream(repo, "")
+    # Closed without ever being iterated, as when the client is gone at once.
+    body.close()
+    events.stream(repo, "").close()
+    assert events._streams == 0
@@ -0,0 +1,24 @@
+"""`import app` must not load the PDF and email stacks (they are imported on first use)."""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from import_time import HEAVY_MODULES  # noqa: E402
+
+
+def test_import_app_skips_heavy_modules():
+    # A fresh interpreter: this test process may already have imported them.
+    proc = subprocess.run(
+        [sys.executable, "-c", "import json, sys; import app; print(json.dumps(sorted(sys.modules)))"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = json.loads(proc.stdout.splitlines()[-1])
+    heavy = [name for name in modules if any(name == m or name.startswith(m + ".") for m in HEAVY_MODULES)]
+    assert heavy == []
+    # The check itself must see a real import: app and its own modules are loaded.
+    assert "app" in modules and "repository" in modules
@@ -0,0 +1,83 @@
+"""Recovery of export jobs whose worker process died."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jobs  # noqa: E402
+
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    import app as site_app
+    db_path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", db_path)
+    monkeypatch.setattr(jobs, "_db_path", db_path)
+    site_app.init_db()
+    return db_path
+
+
+def add_job(job_id, status="running", worker_pid=None, heartbeat_age=None, kind="csv_export"):
+    now = datetime.utcnow()
+    heartbeat = None if heartbeat_age is None else (now - timedelta(seconds=heartbeat_age)).isoformat()
+    conn = jobs._connect()
+    conn.execute(
+        "INSERT INTO jobs (id, user_id, kind, params, status, progress, worker_pid, created_at, started_at, heartbeat_at) "
+        "VALUES (?, 1, ?, '{}', ?, 0.5, ?, ?, ?, ?)",
+        (job_id, kind, status, worker_pid, now.isoformat(), heartbeat, heartbeat)
+    )
+    conn.commit()
+    conn.close()
+
+
+def status(job_id):
+    return jobs.get(job_id)["status"]
+
+
+def test_recover_interrupted_requeues_only_stale_jobs(job_db):
+    # The pids are those of live processes: liveness must not matter, only the heartbeat.
+    add_job("fresh", worker_pid=os.getppid(), heartbeat_age=5)
+    add_job("stale", worker_pid=os.getppid(), heartbeat_age=600)
+    add_job("queued", status="queued")
+
+    assert jobs.recover_interrupted(stale_after=60) == ["stale"]
+    assert (status("fresh"), status("stale"), status("queued")) == ("running", "queued", "queued")
+    job = jobs.get("stale")
+    assert (job["worker_pid"], job["heartbeat_at"], job["progress"]) == (None, None, 0)
+
+
+def test_recover_worker_requeues_only_that_workers_jobs(job_db):
+    add_job("dead", worker_pid=4001, heartbeat_age=1)
+    add_job("alive", worker_pid=4002, heartbeat_age=1)
+
+    assert jobs.recover_worker(4001) == ["dead"]
+    assert (status("dead"), status("alive")) == ("queued", "running")
+    assert jobs.recover_worker(4001) == []
+
+
+def test_heartbeat_keeps_a_long_job_from_being_recovered(job_db, monkeypatch):
+    seen = {}
+
+    def slow_job(params, dest_path, progress):
+        # Simulate a job that has been running well past JOB_STALE_AFTER.
+        conn = jobs._connect()
+        conn.execute("UPDATE jobs SET heartbeat_at = '2000-01-01T00:00:00' WHERE id = 'slow'")
+        conn.commit()
+        conn.close()
+        jobs._beat()
+        seen["recovered"] = jobs.recover_interrupted(stale_after=60)
+        seen["status"] = status("slow")
+        with open(dest_path, "w") as f:
+            f.write("done")
+        return "slow.txt", "text/plain"
+
+    monkeypatch.setitem(jobs._runners, "slow", slow_job)
+    add_job("slow", status="queued", kind="slow")
+    jobs._execute("slow")
+
+    assert seen == {"recovered": [], "status": "running"}
+    assert status("slow") == "done"
+    assert jobs._running == set()
@@ -0,0 +1,72 @@
+"""Database maintenance on newly created databases."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import archive  # noqa: E402
+import dbconn  # noqa: E402
+import maintenance  # noqa: E402
+import shards  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    import app as site_app
+    path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", path)
+    monkeypatch.setattr(shards, "REGIONS", ["east"])
+    site_app.init_db()
+    site_app.init_shard_db("east")
+    return path
+
+
+def pragma(path, name):
+    conn = dbconn.connect(path)
+    try:
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def add_reports(path, count, created_at="2026-01-01T00:00:00"):
+    conn = dbconn.connect(path)
+    conn.executemany(
+        "INSERT INTO reports (site_name, report_type, executive_summary, created_at) VALUES (?, 'Weekly', ?, ?)",
+        [(f"Site {i}", "x" * 2000, created_at) for i in range(count)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_new_databases_are_incremental_and_wal(db_path):
+    for path in (db_path, shards.shard_path(db_path, "east")):
+        assert pragma(path, "auto_vacuum") == maintenance.AUTO_VACUUM_INCREMENTAL
+        assert pragma(path, "journal_mode") == "wal"
+
+
+def test_new_archive_files_are_incremental(db_path):
+    add_reports(db_path, 3, created_at="2020-06-01T00:00:00")
+    assert archive.archive_reports(db_path, older_than_days=30) == 3
+    [(year, path)] = archive.archive_files(db_path)
+    assert year == 2020
+    assert pragma(path, "auto_vacuum") == maintenance.AUTO_VACUUM_INCREMENTAL
+
+
+def test_scheduled_run_reclaims_space_without_convert(db_path):
+    add_reports(db_path, 500)
+    conn = dbconn.connect(db_path)
+    conn.execute("DELETE FROM reports")
+    conn.commit()
+    conn.close()
+    assert pragma(db_path, "freelist_count") > 0
+
+    result = maintenance.run_maintenance(db_path, budget=30)
+    main = result["databases"]["site_reports.db"]
+    assert not any("deferred" in step for step in main["steps"])
+    assert any(step.startswith("incremental_vacuum") for step in main["steps"])
+    assert any(step.startswith("wal_checkpoint") for step in main["steps"])
+    assert main["integrity"] == "ok"
+    assert pragma(db_path, "freelist_count") == 0
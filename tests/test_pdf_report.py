@@ -0,0 +1,56 @@
+"""Layout of the chunked issue and device tables in report PDFs."""
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("reportlab")
+
+from reportlab.lib.pagesizes import letter  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate, Spacer, Table  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_report  # noqa: E402
+
+HEADER = ["Issue Title", "Status"]
+
+
+class _RecordingDoc(SimpleDocTemplate):
+    """Records (page, first row, row count) of every table drawn."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drawn = []
+
+    def afterFlowable(self, flowable):
+        if isinstance(flowable, Table):
+            rows = flowable._cellvalues
+            self.drawn.append((self.page, list(rows[0]), len(rows)))
+
+
+def layout(row_count, space_above, chunk_rows):
+    doc = _RecordingDoc(BytesIO(), pagesize=letter)
+    rows = ([f"Issue {i}", "Open"] for i in range(row_count))
+    story = [Spacer(1, space_above)] + list(pdf_report._chunked_tables(HEADER, rows, [300, 100], chunk_rows))
+    doc.build(story)
+    return doc.drawn
+
+
+@pytest.mark.parametrize("space_above", [0, 7, 250, 480, 611])
+def test_header_only_at_the_top_of_each_page(space_above):
+    drawn = layout(200, space_above, chunk_rows=7)
+    pages = [page for page, _, _ in drawn]
+    assert len(set(pages)) > 5
+
+    data_rows = 0
+    for index, (page, first_row, row_count) in enumerate(drawn):
+        starts_page = index == 0 or drawn[index - 1][0] != page
+        assert (first_row == HEADER) is starts_page, (index, page)
+        data_rows += row_count - (first_row == HEADER)
+    assert data_rows == 200
+
+
+def test_no_rows_no_table():
+    assert list(pdf_report._chunked_tables(HEADER, iter([]), [300, 100])) == []
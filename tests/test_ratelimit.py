@@ -0,0 +1,103 @@
+"""Token buckets, 429s and the heavy-request concurrency cap."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask, Response
+from flask_login import LoginManager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_buckets", type(ratelimit._buckets)())
+    monkeypatch.setattr(ratelimit, "LIMITS", dict(ratelimit.LIMITS))
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+
+
+def test_bucket_refills_over_time():
+    bucket = ratelimit.TokenBucket(2, 20)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    wait = bucket.take()
+    assert 0 < wait <= 0.05
+    time.sleep(wait + 0.01)
+    assert bucket.take() == 0
+
+
+def test_rejected_request_takes_no_tokens():
+    ratelimit.LIMITS["pdf"] = (1, 60)
+    assert ratelimit.check("pdf", [("ip", "10.0.0.1"), ("user", 1)]) == 0
+    # User 1 is out of tokens; the new IP's bucket must not pay for the rejection.
+    assert ratelimit.check("pdf", [("ip", "10.0.0.2"), ("user", 1)]) > 0
+    assert ratelimit.check("pdf", [("ip", "10.0.0.2")]) == 0
+
+
+def test_route_classes_have_separate_buckets():
+    ratelimit.LIMITS["pdf"] = (1, 60)
+    ratelimit.LIMITS["export"] = (1, 60)
+    assert ratelimit.check("pdf", [("ip", "10.0.0.1")]) == 0
+    assert ratelimit.check("export", [("ip", "10.0.0.1")]) == 0
+    assert ratelimit.check("pdf", [("ip", "10.0.0.1")]) > 0
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    LoginManager(app).user_loader(lambda user_id: None)
+
+    @app.route("/light", methods=["GET", "POST"])
+    @ratelimit.limit("auth", methods=("POST",), heavy=False)
+    def light():
+        return "ok"
+
+    @app.route("/heavy")
+    @ratelimit.limit("export")
+    def heavy():
+        return "ok"
+
+    @app.route("/stream")
+    @ratelimit.limit("export")
+    def stream():
+        return Response((chunk for chunk in ("a", "b")), mimetype="text/plain")
+
+    return app.test_client()
+
+
+def test_limited_route_answers_429_with_retry_after(client):
+    ratelimit.LIMITS["auth"] = (2, 60)
+    assert [client.post("/light").status_code for _ in range(2)] == [200, 200]
+    rejected = client.post("/light")
+    assert rejected.status_code == 429
+    assert 1 <= int(rejected.headers["Retry-After"]) <= 30
+    # Only POST is limited.
+    assert client.get("/light").status_code == 200
+
+
+def test_busy_heavy_routes_shed_load(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "_heavy", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(ratelimit, "HEAVY_WAIT", 0.05)
+    ratelimit._heavy.acquire()
+    try:
+        shed = client.get("/heavy")
+    finally:
+        ratelimit._heavy.release()
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == "2"
+    assert client.get("/heavy").status_code == 200
+
+
+def test_streamed_response_holds_its_slot_until_closed(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "_heavy", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(ratelimit, "HEAVY_WAIT", 0.05)
+    streaming = client.get("/stream", buffered=False)
+    assert streaming.status_code == 200
+    assert client.get("/heavy").status_code == 503
+    assert b"".join(streaming.response) == b"ab"
+    streaming.close()
+    assert client.get("/heavy").status_code == 200
@@ -0,0 +1,162 @@
+"""The JSON read API, served by the Flask app and by the asyncio tier (asgi.py)."""
+import asyncio
+import gzip
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgi  # noqa: E402
+import attachments  # noqa: E402
+import jobs  # noqa: E402
+import models  # noqa: E402
+import repository  # noqa: E402
+
+
+@pytest.fixture
+def site_app(tmp_path, monkeypatch):
+    import app as site_app
+    db_path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", db_path)
+    for module in (repository, jobs, attachments):
+        monkeypatch.setattr(module, "_db_path", db_path)
+    monkeypatch.setattr(repository, "_repository", None)
+    site_app.init_db()
+    return site_app
+
+
+@pytest.fixture
+def client(site_app):
+    client = site_app.app.test_client()
+    response = client.post("/login", data={"username": "admin", "password": "Mes@2026"})
+    assert response.status_code == 302
+    return client
+
+
+def make_report(site="North Clinic", status="Stable"):
+    report = models.Report(
+        site_name=site, location="Block A", report_type="Weekly", overall_status=status,
+        wifi_password="wifi-secret", created_at=datetime.utcnow().isoformat(),
+    )
+    device = models.Device(device_name="NVR-1", password="device-secret", status="Working")
+    return repository.get_repository().create_report(report, [], [device])
+
+
+def test_reports_are_paged_without_secrets(client):
+    ids = [make_report(f"Site {i}") for i in range(3)]
+    first = client.get("/api/reports?limit=2").get_json()
+    assert first["summary"]["total_reports"] == 3
+    assert len(first["reports"]) == 2 and first["next_offset"] == 2
+    rest = client.get("/api/reports?limit=2&offset=2").get_json()
+    assert rest["next_offset"] is None
+    assert sorted(r["id"] for r in first["reports"] + rest["reports"]) == ids
+    assert all("wifi_password" not in r for r in first["reports"])
+
+    detail = client.get(f"/api/reports/{ids[0]}").get_json()
+    assert detail["devices"][0]["device_name"] == "NVR-1"
+    assert "password" not in detail["devices"][0]
+    assert "secret" not in json.dumps(detail)
+
+
+def test_errors(client):
+    assert client.get("/api/reports/999").status_code == 404
+    bad = client.get("/api/reports?limit=x")
+    assert bad.status_code == 400
+    assert "limit" in bad.get_json()["error"]
+
+
+def test_etag_revalidates_until_a_write(client):
+    make_report()
+    first = client.get("/api/sites")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert client.get("/api/sites", headers={"If-None-Match": etag}).status_code == 304
+    make_report("South Clinic")
+    changed = client.get("/api/sites", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_sign_in_required(site_app):
+    response = site_app.app.test_client().get("/api/reports")
+    assert response.status_code == 302
+    assert response.headers["Location"].startswith("/login")
+
+
+# ----------------------------
+# asyncio tier
+# ----------------------------
+@pytest.fixture
+def api(site_app, monkeypatch):
+    monkeypatch.setattr(asgi, "_executor", None)
+    monkeypatch.setattr(asgi, "_repository", None)
+    monkeypatch.setattr(asgi, "_users", {})
+    monkeypatch.setattr(asgi, "_pending", 0)
+    yield asgi
+    if asgi._executor is not None:
+        asgi._executor.shutdown(wait=True)
+
+
+def call(path, method="GET", query=b"", headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query,
+             "headers": [(name.encode(), value.encode()) for name, value in headers]}
+    asyncio.run(asgi.application(scope, receive, send))
+    start, body = messages
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body["body"]
+
+
+def session_cookie(client):
+    return ("cookie", f"session={client.get_cookie('session').value}")
+
+
+def test_asgi_answers_like_the_flask_app(client, api):
+    for i in range(20):
+        make_report(f"Site {i}")
+    wsgi = client.get("/api/reports?limit=5")
+    status, headers, body = call("/api/reports", query=b"limit=5", headers=[session_cookie(client)])
+    assert status == 200
+    assert headers["content-type"] == "application/json"
+    assert json.loads(body) == wsgi.get_json()
+    assert headers["etag"] == wsgi.headers["ETag"]
+
+    status, headers, _ = call("/api/reports", query=b"limit=5",
+                              headers=[session_cookie(client), ("if-none-match", headers["etag"])])
+    assert status == 304
+
+    status, headers, body = call("/api/reports", query=b"limit=50",
+                                 headers=[session_cookie(client), ("accept-encoding", "gzip")])
+    assert headers["content-encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(body))["reports"]) == 20
+
+
+def test_asgi_rejections(client, api, monkeypatch):
+    assert call("/api/reports")[0] == 401
+    assert call("/api/reports", headers=[("cookie", "session=forged")])[0] == 401
+    assert call("/api/nothing", headers=[session_cookie(client)])[0] == 404
+    status, headers, _ = call("/api/reports", method="POST", headers=[session_cookie(client)])
+    assert status == 405 and headers["allow"] == "GET, HEAD"
+
+    status, _, body = call("/api/sites", method="HEAD", headers=[session_cookie(client)])
+    assert status == 200 and body == b""
+
+    monkeypatch.setattr(asgi, "MAX_PENDING", 0)
+    status, headers, _ = call("/api/sites", headers=[session_cookie(client)])
+    assert status == 503 and headers["retry-after"] == "1"
+
+
+def test_asgi_repository_is_read_only(client, api):
+    call("/api/sites", headers=[session_cookie(client)])
+    with pytest.raises(RuntimeError):
+        asgi._repository.create_report(models.Report(site_name="X"), [], [])
@@ -0,0 +1,258 @@
+"""Repository behaviour, run against every backend.
+
+SQLite always runs, on a fresh database file per test. Postgres runs when
+TEST_DATABASE_URL points at a database the tests may wipe (its tables are
+dropped and recreated for every test); otherwise those cases are skipped.
+
+    TEST_DATABASE_URL=postgresql://localhost/mes_test python -m pytest tests
+"""
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbconn  # noqa: E402
+import models  # noqa: E402
+import repository  # noqa: E402
+from repository import DuplicateUser, PostgresRepository, SQLiteRepository  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+POSTGRES_TABLES = ("attachments", "devices", "issues", "reports", "users", "dashboard_events", "write_generation")
+
+
+@pytest.fixture
+def sqlite_repo(tmp_path, monkeypatch):
+    import app as site_app
+    db_path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", db_path)
+    site_app.init_db()
+    return SQLiteRepository(db_path)
+
+
+@pytest.fixture
+def postgres_repo():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    pytest.importorskip("psycopg2")
+    repo = PostgresRepository(TEST_DATABASE_URL, minconn=1, maxconn=4)
+    with repo._connection() as (conn, cur):
+        cur.execute(f"DROP TABLE IF EXISTS {', '.join(POSTGRES_TABLES)} CASCADE")
+    repo.init_schema()
+    yield repo
+    repo._pool.closeall()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def repo(request):
+    return request.getfixturevalue(f"{request.param}_repo")
+
+
+def make_report(repo, site="North Clinic", status="Operational", report_type="Weekly", issues=(), devices=(),
+                created_at=None):
+    report = models.Report(
+        site_name=site, location="Block A", report_type=report_type, overall_status=status,
+        prepared_by="tech1", cameras_live="12", cameras_down="", wifi_password="wifi-secret",
+        created_at=created_at or datetime.utcnow().isoformat(),
+    )
+    issue_models = []
+    for title, issue_status, priority, target_date in issues:
+        issue = models.Issue(issue_title=title, area="Network", status=issue_status, priority=priority,
+                             target_date=target_date, responsible="tech1")
+        issue.target_date_iso = models.normalize_date(target_date)
+        issue_models.append(issue)
+    device_models = [models.Device(device_name=name, password="dev-secret", status=status)
+                     for name, status in devices]
+    return repo.create_report(report, issue_models, device_models)
+
+
+# ----------------------------
+# Placeholder adaptation
+# ----------------------------
+def test_to_pyformat():
+    assert repository._to_pyformat("SELECT * FROM t WHERE a = ? AND b IN (?, ?)") == \
+        "SELECT * FROM t WHERE a = %s AND b IN (%s, %s)"
+
+
+# ----------------------------
+# Users
+# ----------------------------
+def test_user_crud(repo):
+    now = datetime.utcnow().isoformat()
+    user_id = repo.create_user("alice", "alice@example.com", "hash", "technician", 1, now)
+    user = repo.get_user(user_id)
+    assert (user.username, user.email, user.role) == ("alice", "alice@example.com", "technician")
+    user = repo.get_user_by_username("alice")
+    assert (user.id, user.password, user.verified) == (user_id, "hash", 1)
+    assert repo.user_exists("alice", "other@example.com")
+    assert repo.user_exists("bob", "alice@example.com")
+    assert not repo.user_exists("bob", "bob@example.com")
+    with pytest.raises(DuplicateUser):
+        repo.create_user("alice", "alice2@example.com", "hash", "technician", 0, now)
+    assert repo.get_user(user_id + 1000) is None
+
+
+# ----------------------------
+# Reports
+# ----------------------------
+def test_report_crud(repo):
+    generation = repo.write_generation()
+    report_id = make_report(
+        repo, issues=[("Camera down", "Open", "High", "2026-03-01"), ("Link flap", "Resolved", "Low", "")],
+        devices=[("NVR", "Broken")],
+    )
+    assert repo.write_generation() > generation
+
+    report = repo.get_report(report_id)
+    assert report.site_name == "North Clinic"
+    assert report.cameras_live == 12
+    # Newest first
+    assert [issue.issue_title for issue in repo.get_issues(report_id)] == ["Link flap", "Camera down"]
+    assert [issue.target_date_iso for issue in repo.get_issues(report_id)] == [models.NO_TARGET_DATE, "2026-03-01"]
+    assert [(device.device_name, device.password) for device in repo.get_devices(report_id)] == [("NVR", "dev-secret")]
+
+    report.site_name = "South Clinic"
+    issue = models.Issue(issue_title="Replaced UPS", status="Open", priority="Medium", target_date="01/04/2026")
+    issue.target_date_iso = models.normalize_date(issue.target_date)
+    repo.update_report(report, [issue], [])
+    assert repo.get_report(report_id).site_name == "South Clinic"
+    assert [(i.issue_title, i.target_date_iso) for i in repo.get_issues(report_id)] == [("Replaced UPS", "2026-04-01")]
+    assert repo.get_devices(report_id) == []
+
+    assert repo.delete_report(report_id) == 1
+    assert repo.get_report(report_id) is None
+    assert repo.get_issues(report_id) == []
+    assert repo.delete_report(report_id) == 0
+
+
+def test_delete_reports_cascades_attachments(repo):
+    first = make_report(repo, issues=[("Camera down", "Open", "High", "")], devices=[("NVR", "OK")])
+    second = make_report(repo, site="East Depot")
+    kept = make_report(repo, site="West Yard")
+    repo.add_attachment(first, None, "a" * 64, "photo.jpg", "image/jpeg", 10, "tech1")
+    repo.add_attachment(second, None, "b" * 64, "photo.jpg", "image/jpeg", 10, "tech1")
+
+    assert repo.report_attachment_hashes([first, second]) == {"a" * 64, "b" * 64}
+    assert repo.delete_reports([first, second]) == 2
+    assert repo.attachment_hashes() == set()
+    assert repo.get_report(kept) is not None
+    kinds = [json.loads(payload)["type"] for event_id, payload in repo.dashboard_events(0)]
+    assert kinds == ["created"] * 3 + ["deleted"] * 2
+
+
+# ----------------------------
+# Dashboard filters and summaries
+# ----------------------------
+def test_filters_and_summary(repo):
+    make_report(repo, site="North Clinic", status="Operational", issues=[("Camera down", "Open", "High", "")],
+                devices=[("NVR", "Broken"), ("Switch", "OK")], created_at="2026-01-01T08:00:00")
+    make_report(repo, site="north clinic annex", status="Not Operational", report_type="Monthly",
+                issues=[("Power cut", "Resolved", "Critical", "")], created_at="2026-01-02T08:00:00")
+    make_report(repo, site="East Depot", status="Operational", created_at="2026-01-03T08:00:00")
+
+    def sites(**filters):
+        rows = repo.iter_reports(**filters)
+        try:
+            return [row["site_name"] for row in rows]
+        finally:
+            rows.close()
+
+    assert sites() == ["East Depot", "north clinic annex", "North Clinic"]
+    # The site filter is a case-insensitive substring match on both backends.
+    assert sites(site="NORTH") == ["north clinic annex", "North Clinic"]
+    assert sites(status="Operational") == ["East Depot", "North Clinic"]
+    assert sites(report_type="Monthly") == ["north clinic annex"]
+    assert sites(priority="High") == ["North Clinic"]
+
+    summary = repo.report_summary(site="north")
+    assert summary["total_reports"] == 2
+    assert summary["total_open_issues"] == 1
+    assert summary["by_status"] == {"Operational": 1, "Not Operational": 1}
+    assert (summary["device_total"], summary["device_broken"]) == (2, 1)
+
+    rows = {row["site_name"]: row for row in repo.site_summaries()}
+    assert rows["North Clinic"]["open_issues"] == 1
+    assert rows["East Depot"]["reports"] == 1
+
+
+def test_iter_reports_streams_large_results(repo):
+    for i in range(1200):
+        make_report(repo, site=f"Site {i:04d}", created_at=f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}")
+    rows = repo.iter_reports()
+    try:
+        seen = [row["site_name"] for row in rows]
+    finally:
+        rows.close()
+    assert len(seen) == 1200
+    assert seen[0] == "Site 1199" and seen[-1] == "Site 0000"
+
+
+def test_streaming_read_does_not_block_writers(sqlite_repo):
+    make_report(sqlite_repo)
+    make_report(sqlite_repo, site="East Depot")
+    rows = sqlite_repo.iter_reports()
+    try:
+        next(rows)
+        # A slow client is mid-download; a save must still commit.
+        conn = dbconn.connect(sqlite_repo.db_path, timeout=0.5)
+        try:
+            conn.execute("UPDATE reports SET site_name = 'Moved'")
+            conn.commit()
+        finally:
+            conn.close()
+    finally:
+        rows.close()
+    assert {report.site_name for report in [sqlite_repo.get_report(1), sqlite_repo.get_report(2)]} == {"Moved"}
+
+
+# ----------------------------
+# Issue board paging
+# ----------------------------
+def test_issue_board_keyset_paging(repo):
+    issues = [(f"Issue {i}", "Open", "High" if i % 2 else "Low", f"2026-02-{i % 28 + 1:02d}") for i in range(45)]
+    issues.append(("Undated", "Open", "Low", ""))
+    issues.append(("Done", "Resolved", "Low", "2026-02-01"))
+    make_report(repo, issues=issues)
+
+    def walk(**filters):
+        keys, after = [], None
+        while True:
+            rows, after = repo.issue_board(limit=10, after=after, **filters)
+            keys += [(row["target_date_iso"], row["id"]) for row in rows]
+            if after is None:
+                return keys
+
+    unresolved = walk(status="")
+    assert len(unresolved) == 46 and len(set(unresolved)) == 46
+    assert unresolved == sorted(unresolved)
+    assert unresolved[-1][0] == models.NO_TARGET_DATE
+
+    descending = walk(status="", descending=True)
+    assert descending == sorted(unresolved, reverse=True)
+
+    high = walk(status="", priority="High")
+    assert len(high) == 22
+
+    overdue = walk(status="", overdue_before="2026-02-05")
+    assert overdue and all(key[0] < "2026-02-05" for key in overdue)
+
+
+# ----------------------------
+# Snapshots
+# ----------------------------
+def test_snapshot_is_consistent(repo):
+    make_report(repo, issues=[("Camera down", "Open", "High", "")])
+    with repo.snapshot() as snap:
+        before = snap.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+        make_report(repo, site="East Depot")
+        repo.delete_reports([row["id"] for row in snap.execute("SELECT id FROM reports").fetchall()])
+        assert snap.execute("SELECT COUNT(*) FROM reports").fetchone()[0] == before == 1
+        assert snap.execute("SELECT COUNT(*) FROM issues").fetchone()[0] == 1
+    rows = repo.iter_reports()
+    try:
+        assert [row["site_name"] for row in rows] == ["East Depot"]
+    finally:
+        rows.close()
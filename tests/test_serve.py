@@ -0,0 +1,110 @@
+"""Request counting, idle connections and queueing of the pre-fork server's workers."""
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serve import PooledWSGIServer, bind_socket  # noqa: E402
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def hello(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(app=hello, threads=2, max_requests=0, idle_timeout=5, max_queue=64):
+        sock = bind_socket("127.0.0.1", 0)
+        server = PooledWSGIServer(app, sock.fileno(), threads, max_requests, 5, idle_timeout, max_queue)
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        servers.append((server, thread, sock))
+        return server, thread, sock.getsockname()[1]
+
+    yield start
+    for server, thread, sock in servers:
+        server.stop()
+        thread.join(5)
+        server.close()
+        sock.close()
+
+
+def read_response(conn):
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = conn.recv(4096)
+        if not chunk:
+            return data
+        data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    length = int([line.split(b":")[1] for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")][0])
+    while len(body) < length:
+        body += conn.recv(4096)
+    return head
+
+
+def test_max_requests_counts_requests(start_server):
+    server, thread, port = start_server(max_requests=3)
+    for _ in range(3):
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as conn:
+            conn.sendall(REQUEST)
+            assert read_response(conn).startswith(b"HTTP/1.1 200")
+    # Counted once each response is out; the third one stops the worker.
+    thread.join(5)
+    assert not thread.is_alive()
+    assert server.handled == 3
+
+
+def test_connection_without_request_is_not_counted(start_server):
+    server, thread, port = start_server(max_requests=1, idle_timeout=0.2)
+    socket.create_connection(("127.0.0.1", port), timeout=5).close()
+    time.sleep(0.3)
+    assert server.handled == 0
+    assert thread.is_alive()
+
+
+def test_idle_connection_is_closed(start_server):
+    server, thread, port = start_server(idle_timeout=0.3)
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as conn:
+        started = time.monotonic()
+        assert conn.recv(1) == b""
+        assert time.monotonic() - started < 3
+    # The thread it held serves the next connection.
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as conn:
+        conn.sendall(REQUEST)
+        assert read_response(conn).startswith(b"HTTP/1.1 200")
+
+
+def test_full_queue_gets_503(start_server):
+    release = threading.Event()
+
+    def slow(environ, start_response):
+        release.wait(5)
+        return hello(environ, start_response)
+
+    server, thread, port = start_server(app=slow, threads=1, max_queue=1)
+    busy = socket.create_connection(("127.0.0.1", port), timeout=5)
+    busy.sendall(REQUEST)
+    time.sleep(0.3)
+    queued = socket.create_connection(("127.0.0.1", port), timeout=5)
+    queued.sendall(REQUEST)
+    time.sleep(0.3)
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as rejected:
+        rejected.sendall(REQUEST)
+        assert read_response(rejected).startswith(b"HTTP/1.1 503")
+
+    release.set()
+    assert read_response(busy).startswith(b"HTTP/1.1 200")
+    busy.close()
+    assert read_response(queued).startswith(b"HTTP/1.1 200")
+    queued.close()
@@ -0,0 +1,84 @@
+"""Streamed cross-shard merges."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shards  # noqa: E402
+
+
+@pytest.fixture
+def small_pool(monkeypatch):
+    monkeypatch.setattr(shards, "FANOUT_WORKERS", 2)
+    monkeypatch.setattr(shards, "_executor", None)
+    yield
+    if shards._executor is not None:
+        shards._executor.shutdown(wait=False)
+
+
+def numbers(values, closed=None):
+    def make_rows():
+        def rows():
+            try:
+                yield from values
+            finally:
+                if closed is not None:
+                    closed.set()
+        return rows()
+    return make_rows
+
+
+def test_merge_streams_merges_in_order():
+    merged = shards.merge_streams([numbers([9, 5, 1]), numbers([8, 2]), numbers([])], key=lambda n: n, reverse=True)
+    assert list(merged) == [9, 8, 5, 2, 1]
+
+
+def test_query_error_is_forwarded(monkeypatch):
+    monkeypatch.setattr(shards, "STREAM_STALL", 10)
+
+    def broken():
+        raise ValueError("no such column: site")
+
+    merged = shards.merge_streams([numbers([1]), broken], key=lambda n: n)
+    start = time.monotonic()
+    with pytest.raises(ValueError, match="no such column"):
+        list(merged)
+    assert time.monotonic() - start < 2
+
+
+def test_slow_reader_keeps_its_stream(monkeypatch):
+    monkeypatch.setattr(shards, "STREAM_STALL", 0.5)
+    merged = shards.merge_streams([numbers(range(10)), numbers(range(10, 20))], key=lambda n: n, buffer=1)
+    assert next(merged) == 0
+    # The client stops reading for longer than the stall timeout.
+    time.sleep(1.5)
+    assert list(merged) == list(range(1, 20))
+
+
+def test_open_streams_do_not_starve_fan_out(small_pool):
+    streams = [shards.merge_streams([numbers(range(100)) for _ in range(3)], key=lambda n: n, buffer=1)
+               for _ in range(4)]
+    for stream in streams:
+        next(stream)
+
+    done = threading.Event()
+    result = []
+    threading.Thread(target=lambda: (result.extend(shards.fan_out(lambda n: n * 2, [1, 2, 3])), done.set()),
+                     daemon=True).start()
+    assert done.wait(5)
+    assert result == [2, 4, 6]
+    for stream in streams:
+        stream.close()
+
+
+def test_closing_a_stream_stops_its_producers():
+    closed = [threading.Event() for _ in range(2)]
+    merged = shards.merge_streams([numbers(range(1000), closed[0]), numbers(range(1000), closed[1])],
+                                  key=lambda n: n, buffer=1)
+    next(merged)
+    merged.close()
+    assert all(event.wait(5) for event in closed)
@@ -0,0 +1,109 @@
+"""The streaming XLSX writer and the all-reports workbook built on it."""
+import io
+import os
+import re
+import sys
+import zipfile
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbconn  # noqa: E402
+import exports  # noqa: E402
+import models  # noqa: E402
+import xlsx  # noqa: E402
+from repository import SQLiteRepository  # noqa: E402
+
+
+def open_workbook(chunks):
+    return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+
+def sheet_names(book):
+    return re.findall(r'<sheet name="([^"]*)"', book.read("xl/workbook.xml").decode())
+
+
+def sheet_rows(book, number):
+    xml = book.read(f"xl/worksheets/sheet{number}.xml").decode()
+    return [
+        [re.sub(r"<[^>]+>", "", cell) for cell in re.findall(r"<c(?:/>|[^>]*>(.*?)</c>)", row)]
+        for row in re.findall(r"<row>(.*?)</row>", xml)
+    ]
+
+
+def test_cells_are_typed_and_escaped():
+    rows = [[1, 2.5, "a < b & c", None, "bell\x07"], [True, "", "  padded ", 0, "x"]]
+    book = open_workbook(xlsx.iter_xlsx([("Sheet/1", ["n", "f", "text", "none", "ctl"], rows)]))
+    assert book.testzip() is None
+    assert sheet_names(book) == ["Sheet_1"]
+    xml = book.read("xl/worksheets/sheet1.xml").decode()
+    assert "<c><v>1</v></c><c><v>2.5</v></c>" in xml
+    assert "a &lt; b &amp; c" in xml
+    assert "\x07" not in xml and ">bell<" in xml
+    # Booleans are written as text, empty strings as empty cells.
+    assert ">True<" in xml and "<c/>" in xml
+    assert '<t xml:space="preserve">  padded </t>' in xml
+
+
+def test_long_sheet_continues_on_numbered_sheets(monkeypatch):
+    monkeypatch.setattr(xlsx, "MAX_SHEET_ROWS", 3)
+    rows = [[i] for i in range(5)]
+    book = open_workbook(xlsx.iter_xlsx([("Reports", ["id"], rows), ("Issues", ["id"], [[9]])]))
+    assert sheet_names(book) == ["Reports", "Reports (2)", "Reports (3)", "Issues"]
+    assert [sheet_rows(book, n) for n in (1, 2, 3, 4)] == [
+        [["id"], ["0"], ["1"]], [["id"], ["2"], ["3"]], [["id"], ["4"]], [["id"], ["9"]],
+    ]
+
+
+def test_full_sheet_gets_no_empty_continuation(monkeypatch):
+    monkeypatch.setattr(xlsx, "MAX_SHEET_ROWS", 3)
+    book = open_workbook(xlsx.iter_xlsx([("Reports", ["id"], [[1], [2]])]))
+    assert sheet_names(book) == ["Reports"]
+
+
+def test_rows_are_consumed_as_output_is_yielded():
+    consumed = []
+
+    def rows():
+        for i in range(10000):
+            consumed.append(i)
+            yield [i, f"row {i}"]
+
+    chunks = xlsx.iter_xlsx([("Rows", ["n", "text"], rows())], flush_rows=100)
+    first = next(chunks)
+    assert 0 < len(consumed) < 10000
+    book = open_workbook([first] + list(chunks))
+    assert len(consumed) == 10000
+    assert len(sheet_rows(book, 1)) == 10001
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    import app as site_app
+    path = str(tmp_path / "site_reports.db")
+    monkeypatch.setattr(site_app, "DB_PATH", path)
+    site_app.init_db()
+    return path
+
+
+def test_reports_workbook_masks_secrets(db_path):
+    repo = SQLiteRepository(db_path)
+    report = models.Report(site_name="North Clinic", report_type="Weekly", wifi_password="wifi-secret",
+                           created_at=datetime.utcnow().isoformat())
+    issue = models.Issue(issue_title="Camera offline", status="Open")
+    issue.target_date_iso = models.normalize_date(issue.target_date)
+    device = models.Device(device_name="NVR-1", password="device-secret")
+    repo.create_report(report, [issue], [device])
+
+    conn = dbconn.connect(db_path)
+    try:
+        data = b"".join(exports.iter_reports_xlsx(conn))
+    finally:
+        conn.close()
+    book = zipfile.ZipFile(io.BytesIO(data))
+    assert sheet_names(book) == ["Reports", "Issues", "Devices"]
+    text = "".join(book.read(name).decode() for name in book.namelist())
+    assert "North Clinic" in text and "Camera offline" in text and "NVR-1" in text
+    assert "wifi-secret" not in text and "device-secret" not in text
@@ -0,0 +1,137 @@
+"""Single-writer queue with group commit.
+
+SQLite allows one writer at a time. Instead of every request thread
+fighting for the write lock (and failing with ``database is locked`` when
+it loses), request threads hand a *write unit* -- a function taking a
+cursor -- to one writer thread per process. The writer drains up to
+``WRITE_BATCH_MAX`` queued units into a single transaction, runs each unit
+inside its own SAVEPOINT so a failing unit only rolls back itself, commits
+once, and hands every caller its own result or exception.
+
+Environment variables:
+  WRITE_QUEUE_DEPTH (units that may wait before submitters get WriteQueueFull, defaults to 256)
+  WRITE_BATCH_MAX (units committed together, defaults to 32)
+  WRITE_SUBMIT_TIMEOUT (seconds a submitter waits for queue space, defaults to 5)
+"""
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import dbconn
+import metrics
+
+WRITE_QUEUE_DEPTH = int(os.getenv("WRITE_QUEUE_DEPTH", "256"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "32"))
+WRITE_SUBMIT_TIMEOUT = float(os.getenv("WRITE_SUBMIT_TIMEOUT", "5"))
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class WriteQueueFull(Exception):
+    """Raised when the write queue stays full for WRITE_SUBMIT_TIMEOUT seconds."""
+
+
+def _reset_after_fork():
+    # The writer thread does not survive fork; each worker starts its own.
+    global _writers_lock
+    _writers.clear()
+    _writers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class WriteQueue:
+    """A writer thread applying queued write units in group-committed batches."""
+
+    def __init__(self, db_path, depth=WRITE_QUEUE_DEPTH, batch_max=WRITE_BATCH_MAX):
+        self.db_path = db_path
+        self.batch_max = batch_max
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, timeout=WRITE_SUBMIT_TIMEOUT):
+        """Run ``fn(cursor)`` in the writer thread and return its result.
+
+        Exceptions raised by ``fn`` (or by the commit) are re-raised here.
+        """
+        future = Future()
+        try:
+            self._queue.put((fn, future), timeout=timeout)
+        except queue.Full:
+            metrics.incr("writer.rejected")
+            raise WriteQueueFull("Too many pending writes; please retry shortly.")
+        return future.result()
+
+    def _connect(self):
+        conn = dbconn.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(conn, batch)
+
+    def _apply(self, conn, batch):
+        outcomes = []
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cur.execute("SAVEPOINT write_unit")
+                try:
+                    result = fn(cur)
+                    cur.execute("RELEASE write_unit")
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO write_unit")
+                    cur.execute("RELEASE write_unit")
+                    outcomes.append((future, None, e))
+            cur.execute("COMMIT")
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in this batch was written.
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"[WRITER] Batch of {len(batch)} failed: {type(e).__name__}: {e}")
+            for fn, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        metrics.incr("writer.batches")
+        metrics.incr("writer.units", len(outcomes))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def get_writer(db_path):
+    """Return this process's writer for ``db_path``, starting it on first use."""
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = _writers[db_path] = WriteQueue(db_path)
+    return writer
+
+
+def run_write(db_path, fn):
+    """Shortcut for ``get_writer(db_path).submit(fn)``."""
+    return get_writer(db_path).submit(fn)
@@ -0,0 +1,165 @@
+"""Minimal streaming XLSX writer (stdlib only).
+
+``iter_xlsx`` writes each worksheet row by row straight into a deflated
+zip entry and yields the compressed bytes as they are produced, so memory
+stays flat however many rows there are and the output can go to a socket
+or any other unseekable sink. Cells are written as numbers or inline
+strings; there are no styles or shared strings.
+
+A sheet longer than Excel's row limit continues on "<name> (2)", etc.
+"""
+import re
+import zipfile
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+# Rows per worksheet, including the header row
+MAX_SHEET_ROWS = 1048576
+
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_SHEET_HEAD = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = b'</sheetData></worksheet>'
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+
+class _Sink:
+    """Write-only buffer handed to ZipFile; has no seek/tell, so zipfile streams."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cell(value):
+    if value is None or value == "":
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values):
+    return ("<row>" + "".join(_cell(v) for v in values) + "</row>").encode("utf-8")
+
+
+def _sheet_title(title, part, used):
+    # Excel sheet names: max 31 chars, no []:*?/\ and unique.
+    name = re.sub(r"[\[\]:*?/\\]", "_", title)[:31]
+    if part > 1:
+        suffix = f" ({part})"
+        name = name[:31 - len(suffix)] + suffix
+    while name in used:
+        name = name[:28] + f"~{len(used)}"
+    used.add(name)
+    return name
+
+
+def _workbook_parts(titles):
+    sheets = "".join(
+        f'<sheet name="{escape(t, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, t in enumerate(titles, 1)
+    )
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets>{sheets}</sheets></workbook>'
+    )
+    rels = "".join(
+        f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(titles) + 1)
+    )
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>'
+    )
+    overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(titles) + 1)
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        f'{overrides}</Types>'
+    )
+    return [
+        ("[Content_Types].xml", content_types),
+        ("_rels/.rels", _ROOT_RELS),
+        ("xl/workbook.xml", workbook),
+        ("xl/_rels/workbook.xml.rels", workbook_rels),
+    ]
+
+
+def iter_xlsx(sheets, flush_rows=500, level=6):
+    """Yield an .xlsx file as compressed chunks.
+
+    ``sheets`` is an iterable of ``(title, header, rows)``; ``rows`` may be
+    any iterator and is consumed lazily. Output is yielded every
+    ``flush_rows`` rows.
+    """
+    sink = _Sink()
+    titles = []
+    used = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+        for title, header, rows in sheets:
+            rows = iter(rows)
+            pending = []
+            part = 0
+            while True:
+                part += 1
+                titles.append(_sheet_title(title, part, used))
+                # The sink cannot seek back to fix up the header, so the size is
+                # unknown up front: force zip64, or a sheet past 2 GiB of XML
+                # would fail partway through the download.
+                with zf.open(f"xl/worksheets/sheet{len(titles)}.xml", "w", force_zip64=True) as f:
+                    f.write(_SHEET_HEAD)
+                    f.write(_row(header))
+                    written = 1
+                    for row in chain(pending, rows):
+                        f.write(_row(row))
+                        written += 1
+                        if written % flush_rows == 0:
+                            chunk = sink.take()
+                            if chunk:
+                                yield chunk
+                        if written >= MAX_SHEET_ROWS:
+                            break
+                    f.write(_SHEET_TAIL)
+                chunk = sink.take()
+                if chunk:
+                    yield chunk
+                # Only start a continuation sheet if rows are left.
+                pending = list(islice(rows, 1))
+                if not pending:
+                    break
+        for name, xml in _workbook_parts(titles):
+            zf.writestr(name, xml)
+    yield sink.take()